@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Drives a simulated Snatch3r to a simulated IR beacon with robot_controller.BeaconHoming and with the old seek_beacon
+loop (heading bands, fixed speeds, 0.2 second sleeps), and reports the time to first see the beacon (acquire) and
+the time to reach it (pickup) for a few beacon positions.
+
+It uses the simulated EV3 from ev3sim.py: its IR sensor works like the real one in IR-SEEK mode (the heading is -25
+to 25, about 3 degrees per unit, the beacon can only be seen within 75 degrees of straight ahead, the distance is 0
+to 100, about 0.8 inches per unit, and both are a little noisy), and the motors speed up and slow down like real
+ones.  It runs in stepped time, so it takes a few seconds and every run gives the same result.
+  PYTHONPATH=libs python3 benchmarks/beacon_homing_benchmark.py
+"""
+
+import math
+import time
+
+import ev3sim
+
+WORLD = ev3sim.install(time_scale=0)
+
+import ev3dev.ev3 as ev3
+import robot_controller as robo  # After install, so it uses the simulated EV3
+
+TIME_LIMIT = 40.0  # seconds
+# Beacon (x, y) in inches, the robot starts at (0, 0) facing along the x axis.
+BEACON_POSITIONS = [(40, 5), (25, -25), (-20, 20)]
+
+
+def main():
+    print("Seconds to see the beacon / seconds to reach it (inches left to the beacon at the end):")
+    print("  beacon at        old seek_beacon              BeaconHoming")
+    for beacon_x, beacon_y in BEACON_POSITIONS:
+        old = run_old(beacon_x, beacon_y)
+        new = run_homing(beacon_x, beacon_y)
+        print("  {:>10}   {:>24}   {:>24}".format(str((beacon_x, beacon_y)), old, new))
+
+
+def run_old(beacon_x, beacon_y):
+    """The seek_beacon loop that was in robot_controller (without its prints)."""
+    robot = start(beacon_x, beacon_y)
+    beacon_seeker = ev3.BeaconSeeker(channel=1)
+    start_time = time.monotonic()
+    acquired = None
+    forward_speed = 300
+    turn_speed = 100
+    while time.monotonic() - start_time < TIME_LIMIT:
+        current_heading, current_distance = beacon_seeker.heading_and_distance
+        while current_distance == -128 and time.monotonic() - start_time < TIME_LIMIT:
+            current_heading, current_distance = beacon_seeker.heading_and_distance
+            robot.right(100)
+        if acquired is None and current_distance != -128:
+            acquired = time.monotonic() - start_time
+        if math.fabs(current_heading) < 2:
+            if current_distance <= 1:
+                time.sleep(0.6)
+                robot.stop()
+                return result(acquired, time.monotonic() - start_time, beacon_x, beacon_y)
+            if current_distance > 1:
+                robot.forward(forward_speed, forward_speed)
+        if 2 < math.fabs(current_heading) < 10:
+            if current_heading < 0:
+                robot.left(turn_speed)
+            if current_heading > 0:
+                robot.right(turn_speed)
+        if math.fabs(current_heading) > 10:
+            robot.forward(100, 100)
+            time.sleep(0.5)
+            robot.stop()
+        time.sleep(0.2)
+    robot.stop()
+    return result(acquired, None, beacon_x, beacon_y)
+
+
+def run_homing(beacon_x, beacon_y):
+    robot = start(beacon_x, beacon_y)
+    beacon_homing = robo.BeaconHoming(robot)
+    beacon_homing.run(until=lambda: False, timeout=TIME_LIMIT)
+    return result(beacon_homing.time_to_acquire, beacon_homing.time_to_pickup, beacon_x, beacon_y)
+
+
+def start(beacon_x, beacon_y):
+    """Puts the robot back at (0, 0) with the beacon at (beacon_x, beacon_y) and returns a new Snatch3r."""
+    WORLD.reset()
+    WORLD.beacons[1] = (beacon_x, beacon_y)
+    return robo.Snatch3r()
+
+
+def result(time_to_acquire, time_to_pickup, beacon_x, beacon_y):
+    acquire = "-" if time_to_acquire is None else "{:.1f}".format(time_to_acquire)
+    pickup = "-" if time_to_pickup is None else "{:.1f}".format(time_to_pickup)
+    x, y = WORLD.sensor_position(ev3sim.IR_SENSOR_AHEAD)
+    return "{} / {} ({:.1f} in)".format(acquire, pickup, math.hypot(beacon_x - x, beacon_y - y))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
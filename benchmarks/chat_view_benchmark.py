@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Adds 100000 chat messages to a tkinter window, the old m2_pc_pychat way (label["text"] += "\n" + message) and with
+chat_view.ChatView, updating the window every BATCH messages like a busy chat would.  At a few points it prints the
+microseconds per message since the last point and how many characters the window keeps, so you can see the Label
+getting slower and bigger with every message while the ChatView stays the same.  The Label is given up on after
+LABEL_SECONDS.  Needs a display (run it on your computer, not over SSH).
+  PYTHONPATH=libs python3 benchmarks/chat_view_benchmark.py
+"""
+
+import time
+import tkinter
+from tkinter import ttk
+
+import chat_view
+
+MESSAGES = 100000
+BATCH = 10  # messages per window update
+CHECKPOINTS = [1000, 5000, 10000, 50000, 100000]
+LABEL_SECONDS = 30.0
+
+
+def main():
+    root = tkinter.Tk()
+    print("                  messages   microseconds/message   characters kept")
+
+    label = ttk.Label(root, justify=tkinter.LEFT, text="", width=60, wraplength="500p")
+    label.pack()
+
+    def add_to_label(message):
+        label["text"] += "\n" + message
+
+    run("Label text +=", root, add_to_label, lambda: len(label["text"]), LABEL_SECONDS)
+    label.destroy()
+
+    chat_window = chat_view.ChatView(root, capacity=1000, visible_lines=15, width=60)
+    chat_window.pack()
+    run("ChatView", root, chat_window.add,
+        lambda: sum(len(line) for line in chat_window.lines) + len(chat_window.text.get("1.0", "end")),
+        flush=chat_window.flush)
+    print("ChatView kept the newest {} of {} lines".format(len(chat_window.lines), chat_window.lines_added))
+    root.destroy()
+
+
+def run(name, root, add, characters_kept, time_limit=None, flush=None):
+    start = time.perf_counter()
+    checkpoint_time = start
+    checkpoint_count = 0
+    for k in range(1, MESSAGES + 1):
+        add("Dave: message number {} of the benchmark chat".format(k))
+        if k % BATCH == 0:
+            if flush:
+                flush()
+            root.update_idletasks()  # What the main loop does between events (layout and drawing)
+            if time_limit is not None and time.perf_counter() - start > time_limit:
+                print("  {:14} gave up after {} messages ({:.0f} seconds, {} characters kept)".format(
+                    name, k, time.perf_counter() - start, characters_kept()))
+                return
+        if k in CHECKPOINTS:
+            now = time.perf_counter()
+            print("  {:14} {:>9}   {:>20.1f}   {:>15}".format(
+                name, k, (now - checkpoint_time) / (k - checkpoint_count) * 1e6, characters_kept()))
+            checkpoint_time = now
+            checkpoint_count = k
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Compares the process() + time.sleep(0.01) button loop from the examples with input_events.InputEventLoop.  The EV3
+buttons and IR remotes are simulated (the button "input device" is a pipe), so this runs on any computer.
+
+For each loop it reports:
+  - CPU time used per second while nobody presses anything
+  - the time from a button press (or IR remote press) until its callback runs, for IR presses both while the remote
+    is in use and for the first press after it has been idle (when InputEventLoop polls it more slowly)
+"""
+
+import os
+import random
+import threading
+import time
+
+import input_events
+
+IDLE_SECONDS = 3.0
+IDLE_AFTER = 2.5
+PRESSES = 30
+IDLE_PRESSES = 4
+
+
+class FakeButtonBase(object):
+    """Does the same as ButtonBase.process in python-ev3dev, with buttons_pressed set by the benchmark."""
+
+    def __init__(self):
+        self._state = set()
+        self.pressed = []
+        self.reads = 0
+
+    @property
+    def buttons_pressed(self):
+        self.reads += 1
+        return self.pressed
+
+    def process(self):
+        new_state = set(self.buttons_pressed)
+        old_state = self._state
+        self._state = new_state
+        for button in new_state.symmetric_difference(old_state):
+            getattr(self, "on_" + button)(button in new_state)
+
+
+class FakeButton(FakeButtonBase):
+    """Like ev3.Button, the input device file is open in _file_cache.  A press also writes an "event" to it."""
+
+    def __init__(self):
+        super().__init__()
+        read_fd, self.write_fd = os.pipe()
+        self._file_cache = {"gpio_keys": os.fdopen(read_fd, "rb", 0)}
+
+    def press(self, button, pressed):
+        self.pressed = [button] if pressed else []
+        os.write(self.write_fd, b"\0" * 16)
+
+
+class FakeRemote(FakeButtonBase):
+    def press(self, button, pressed):
+        self.pressed = [button] if pressed else []
+
+
+def main():
+    print("Simulated EV3 buttons and 2 IR remotes.  Latency is from the press until the callback runs, in ms.")
+    print("                         idle CPU ms/s   button avg/max   IR avg/max     IR after idle avg/max")
+    report("process + sleep(0.01)", sleep_loop)
+    report("InputEventLoop", event_loop)
+
+
+def report(name, run_loop):
+    button = FakeButton()
+    remotes = [FakeRemote(), FakeRemote()]
+    latencies = {"button": [], "ir": []}
+    pressed_at = [0.0]
+
+    def on_press(kind, state):
+        if state:
+            latencies[kind].append(time.perf_counter() - pressed_at[0])
+
+    button.on_up = lambda state: on_press("button", state)
+    for remote in remotes:
+        remote.on_red_up = lambda state: on_press("ir", state)
+    stopper = Stopper()
+    loop_thread = threading.Thread(target=run_loop, args=(button, remotes, stopper))
+    loop_thread.start()
+
+    # Idle: nothing pressed, only measure the CPU time used by the loop.
+    time.sleep(IDLE_AFTER)
+    cpu_start = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = (time.process_time() - cpu_start) / IDLE_SECONDS * 1000
+
+    press(button, "up", PRESSES, 0.05, pressed_at)
+    press(remotes[1], "red_up", PRESSES, 0.05, pressed_at)
+    ir_latencies = latencies["ir"]
+    latencies["ir"] = []
+    press(remotes[0], "red_up", IDLE_PRESSES, IDLE_AFTER, pressed_at)
+    stopper.stop()
+    loop_thread.join()
+
+    print("  {:22} {:>10.2f}   {:>7.2f} /{:>6.2f}  {:>6.2f} /{:>6.2f}  {:>6.2f} /{:>6.2f}".format(
+        name, idle_cpu, average(latencies["button"]), maximum(latencies["button"]), average(ir_latencies),
+        maximum(ir_latencies), average(latencies["ir"]), maximum(latencies["ir"])))
+
+
+def press(device, button_name, count, min_gap, pressed_at):
+    """Presses and releases the button count times, waiting at least min_gap seconds before each press."""
+    for k in range(count):
+        time.sleep(min_gap + random.uniform(0, 0.2))
+        pressed_at[0] = time.perf_counter()
+        device.press(button_name, True)
+        time.sleep(0.05)
+        device.press(button_name, False)
+
+
+class Stopper(object):
+    def __init__(self):
+        self.running = True
+        self.on_stop = None
+
+    def stop(self):
+        self.running = False
+        if self.on_stop:
+            self.on_stop()
+
+
+def sleep_loop(button, remotes, stopper):
+    rc1, rc2 = remotes
+    while stopper.running:
+        rc1.process()
+        rc2.process()
+        button.process()
+        time.sleep(0.01)
+
+
+def event_loop(button, remotes, stopper):
+    input_loop = input_events.InputEventLoop(button, remotes, idle_after=IDLE_AFTER - 0.5)
+    stopper.on_stop = input_loop.stop
+    input_loop.run()
+    input_loop.close()
+
+
+def average(seconds):
+    return sum(seconds) / len(seconds) * 1000
+
+
+def maximum(seconds):
+    return max(seconds) * 1000
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
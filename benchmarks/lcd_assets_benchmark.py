@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Compares drawing the asset images on the EV3 screen the PIL way (Image.open every image at startup, paste into
+lcd.image, lcd.update() converts and writes the whole screen) with lcd_assets (load the atlas, blit straight into
+the screen memory):
+  - startup: opening the images that m3_ir_events_with_the_screen.py and m4_ev3_petals_on_a_rose.py use
+  - one frame of the petals game (five dice), and one full screen image (eyes)
+
+The screen is a fake 1 bit per pixel framebuffer (a memory mapped file, 24 bytes per row like the EV3 screen), so
+it runs on any computer.  Run it on the EV3 too, the differences are much bigger there.  The PIL rows need PIL
+(pip install pillow), without it only the lcd_assets rows are shown.
+  PYTHONPATH=libs python3 benchmarks/lcd_assets_benchmark.py [images folder]
+"""
+
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+import lcd_assets
+
+IMAGES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets", "images")
+STARTUP_IMAGES = ["ev3_lego/eyes_neutral", "ev3_lego/eyes_angry", "ev3_lego/eyes_disappointed", "ev3_lego/eyes_hurt",
+                  "ev3_lego/eyes_pinch_left", "ev3_lego/progress_bar_0", "ev3_lego/progress_bar_50",
+                  "ev3_lego/progress_bar_100", "ev3_lego/eyes_tear", "dice/none", "dice/one", "dice/two",
+                  "dice/three", "dice/four", "dice/five", "dice/six", "dice/seven", "dice/eight", "dice/nine"]
+DICE_POSITIONS = [(5, 8), (62, 8), (119, 8), (33, 66), (91, 66)]
+LINE_LENGTH = 24  # bytes per row of the EV3 framebuffer
+FRAMES = 300
+
+
+class FakeScreen(object):
+    """Looks like a 1 bit per pixel ev3.Screen, with the framebuffer in a file."""
+
+    class Info(object):
+        pass
+
+    def __init__(self, path):
+        with open(path, "wb") as framebuffer_file:
+            framebuffer_file.write(bytes(LINE_LENGTH * 128))
+        with open(path, "r+b") as framebuffer_file:
+            self.mmap = mmap.mmap(framebuffer_file.fileno(), 0)
+        self.var_info = FakeScreen.Info()
+        self.var_info.bits_per_pixel = 1
+        self.fix_info = FakeScreen.Info()
+        self.fix_info.line_length = LINE_LENGTH
+        self.xres = 178
+        self.yres = 128
+        self._img = None
+
+    @property
+    def image(self):
+        if self._img is None:
+            from PIL import Image
+            self._img = Image.new("1", (LINE_LENGTH * 8, self.yres), "white")
+        return self._img
+
+    def update(self):
+        data = self._img.tobytes("raw", "1;R")  # What ev3.Screen.update does for a 1 bit per pixel screen
+        self.mmap[:len(data)] = data
+
+
+def main():
+    images_folder = sys.argv[1] if len(sys.argv) > 1 else IMAGES_FOLDER
+    folder = tempfile.mkdtemp()
+    atlas_path = os.path.join(folder, "images.atlas")
+    screen = FakeScreen(os.path.join(folder, "fb0"))
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+        print("PIL is not installed, only showing lcd_assets")
+
+    start = time.perf_counter()
+    lcd_assets.build_atlas(images_folder, atlas_path)
+    print("Making the atlas (once): {:.1f} ms, {} bytes".format((time.perf_counter() - start) * 1000,
+                                                                os.path.getsize(atlas_path)))
+
+    print("Startup, {} images (milliseconds):".format(len(STARTUP_IMAGES)))
+    if Image is not None:
+        def open_with_pil():
+            images = [Image.open(os.path.join(images_folder, name + ".bmp")) for name in STARTUP_IMAGES]
+            for image in images:
+                image.load()  # Image.open only reads the header, the first paste decodes the rest
+        print("  {:34} {:>8.2f}".format("Image.open + load", best_time(open_with_pil, 20) * 1000))
+
+    def open_atlas():
+        atlas = lcd_assets.load_atlas(images_folder, atlas_path)
+        for name in STARTUP_IMAGES:
+            atlas.sprite(name)
+        atlas.close()
+    print("  {:34} {:>8.2f}".format("load_atlas + sprite", best_time(open_atlas, 20) * 1000))
+
+    print("Drawing (milliseconds per frame):")
+    atlas = lcd_assets.load_atlas(images_folder, atlas_path)
+    dice = ["dice/{}".format(name) for name in ["one", "two", "three", "four", "five", "six"]]
+    if Image is not None:
+        dice_images = [Image.open(os.path.join(images_folder, name + ".bmp")) for name in dice]
+        eyes_image = Image.open(os.path.join(images_folder, "ev3_lego/eyes_neutral.bmp"))
+
+        def pil_dice(frame):
+            for k, position in enumerate(DICE_POSITIONS):
+                screen.image.paste(dice_images[(frame + k) % 6], position)
+            screen.update()
+
+        def pil_eyes(frame):
+            screen.image.paste(eyes_image, (0, 0))
+            screen.update()
+
+        print("  {:34} {:>8.3f}".format("5 dice, paste + update", per_frame(pil_dice) * 1000))
+        print("  {:34} {:>8.3f}".format("eyes, paste + update", per_frame(pil_eyes) * 1000))
+
+    def atlas_dice(frame):
+        for k, (x, y) in enumerate(DICE_POSITIONS):
+            atlas.draw(screen, dice[(frame + k) % 6], x, y)
+
+    def atlas_eyes(frame):
+        atlas.draw(screen, "ev3_lego/eyes_neutral")
+
+    print("  {:34} {:>8.3f}".format("5 dice, atlas.draw", per_frame(atlas_dice) * 1000))
+    print("  {:34} {:>8.3f}".format("eyes, atlas.draw", per_frame(atlas_eyes) * 1000))
+    print("Atlas cache: {} hits, {} misses".format(atlas.hits, atlas.misses))
+
+
+def best_time(function, runs):
+    best = None
+    for k in range(runs):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def per_frame(draw):
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        draw(frame)
+    return (time.perf_counter() - start) / FRAMES
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Compares updating the screen the ev3.Screen way (paste into lcd.image, then lcd.update() converts and writes the
+whole screen) with lcd_compositor.ScreenCompositor (only the rows that changed are written, at most max_fps times a
+second, on a background thread), when one die of the petals game changes every frame:
+  - milliseconds and framebuffer bytes written per frame
+  - a 100 Hz control loop that updates the screen every time: the longest time one update took (how long the loop
+    was stalled) and how many frames were written
+
+The framebuffer is a file (lcd_compositor.Framebuffer.fake), 1 bit per pixel like the EV3 on ev3dev jessie and 32
+bits per pixel like ev3dev stretch, so it runs on any computer.  The ev3.Screen rows need PIL (pip install pillow).
+  PYTHONPATH=libs python3 benchmarks/lcd_compositor_benchmark.py
+"""
+
+import os
+import struct
+import tempfile
+import time
+
+import lcd_assets
+import lcd_compositor
+
+IMAGES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "assets", "images")
+DICE_POSITIONS = [(5, 8), (62, 8), (119, 8), (33, 66), (91, 66)]
+DICE = ["dice/one", "dice/two", "dice/three", "dice/four", "dice/five", "dice/six"]
+FRAMES = 200
+LOOP_HZ = 100
+LOOP_SECONDS = 1.0
+MAX_FPS = 20
+
+
+class PilScreen(object):
+    """The drawing and update() of ev3.Screen, on a Framebuffer."""
+
+    def __init__(self, framebuffer):
+        from PIL import Image
+        self.framebuffer = framebuffer
+        self.bytes_written = 0
+        if framebuffer.bits_per_pixel == 1:
+            self.image = Image.new("1", (framebuffer.line_length * 8, framebuffer.height), "white")
+        else:
+            self.image = Image.new("L", (framebuffer.line_length // 4, framebuffer.height), "white")
+
+    def update(self):
+        if self.framebuffer.bits_per_pixel == 1:
+            data = self.image.tobytes("raw", "1;R")
+        else:
+            pixels = [0x010101 * v for v in self.image.tobytes()]
+            data = struct.pack("I" * len(pixels), *pixels)
+        self.framebuffer.mmap[:len(data)] = data
+        self.bytes_written += len(data)
+
+
+def main():
+    folder = tempfile.mkdtemp()
+    atlas = lcd_assets.load_atlas(IMAGES_FOLDER, os.path.join(folder, "images.atlas"))
+    try:
+        import PIL
+        dice_images = [atlas.sprite(name).to_image() for name in DICE]
+    except ImportError:
+        dice_images = None
+        print("PIL is not installed, only showing ScreenCompositor")
+
+    for bits_per_pixel, line_length in [(1, 24), (32, 178 * 4)]:
+        path = os.path.join(folder, "fb{}".format(bits_per_pixel))
+        print("{} bits per pixel framebuffer:".format(bits_per_pixel))
+        print("                                   ms/frame   bytes/frame   worst stall ms   frames written")
+
+        if dice_images is not None:
+            screen = PilScreen(lcd_compositor.Framebuffer.fake(path, line_length=line_length,
+                                                               bits_per_pixel=bits_per_pixel))
+
+            def pil_frame(frame):
+                screen.image.paste(dice_images[frame % 6], DICE_POSITIONS[frame % 5])
+                screen.update()
+
+            seconds = time_frames(pil_frame)
+            bytes_per_frame = screen.bytes_written / FRAMES
+            stall, frames = control_loop(pil_frame, lambda: None)
+            print("  {:32} {:>8.3f}   {:>11.0f}   {:>14.2f}   {:>14}".format(
+                "paste + lcd.update()", seconds * 1000, bytes_per_frame, stall * 1000, frames))
+            screen.framebuffer.close()
+
+        framebuffer = lcd_compositor.Framebuffer.fake(path, line_length=line_length, bits_per_pixel=bits_per_pixel)
+        lcd = lcd_compositor.ScreenCompositor(framebuffer, max_fps=1000000, background=False)
+        lcd.update()  # The first frame writes the whole screen
+
+        def compositor_frame(frame):
+            x, y = DICE_POSITIONS[frame % 5]
+            atlas.draw(lcd, DICE[frame % 6], x, y)
+            lcd.update()
+
+        rows_before = lcd.rows_written
+        seconds = time_frames(compositor_frame)
+        bytes_per_frame = (lcd.rows_written - rows_before) * framebuffer.line_length / FRAMES
+        lcd.close()
+
+        lcd = lcd_compositor.ScreenCompositor(lcd_compositor.Framebuffer.fake(
+            path, line_length=line_length, bits_per_pixel=bits_per_pixel), max_fps=MAX_FPS)
+        stall, frames = control_loop(compositor_frame, lambda: lcd.close())
+        print("  {:32} {:>8.3f}   {:>11.0f}   {:>14.2f}   {:>14}".format(
+            "ScreenCompositor, max_fps {}".format(MAX_FPS), seconds * 1000, bytes_per_frame, stall * 1000,
+            lcd.frames_written))
+
+
+def time_frames(draw_frame):
+    start = time.perf_counter()
+    for frame in range(FRAMES):
+        draw_frame(frame)
+    return (time.perf_counter() - start) / FRAMES
+
+
+def control_loop(draw_frame, finish):
+    """Runs a LOOP_HZ loop that draws a frame every time.  Returns (longest draw_frame time, number of frames)."""
+    worst = 0.0
+    frame = 0
+    next_time = time.monotonic()
+    end_time = next_time + LOOP_SECONDS
+    while next_time < end_time:
+        start = time.perf_counter()
+        draw_frame(frame)
+        worst = max(worst, time.perf_counter() - start)
+        frame += 1
+        next_time += 1 / LOOP_HZ
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    finish()
+    return worst, frame
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
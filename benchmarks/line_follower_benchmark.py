@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Drives a simulated Snatch3r around a simulated track with robot_controller.LineFollower and with the "turn right or
+go forward, then sleep 0.2" loop from m2_follow_a_line.py, and reports the lap time and the loop timing.
+
+The track is a peanut shaped loop of black tape (about 68 inches long), so there are left turns AND right turns.
+The simulated robot moves with the motor speeds (90 degrees of wheel rotation per inch, like drive_inches) and the
+simulated color sensor reads black on the tape, white off the tape, and in between on the edge.  Motors reach their
+new speed right away, so real laps will be a bit slower.  It runs with the stepped clock of ev3sim.py (see
+sim_robot_benchmark.py for the whole simulated Snatch3r), so it takes a few seconds and every run gives the same
+result.  The loop rate and jitter are in simulated time, run LineFollower on the EV3 to see the real ones.
+  PYTHONPATH=libs python3 benchmarks/line_follower_benchmark.py
+"""
+
+import math
+import time
+
+import ev3sim
+
+ev3sim.install(time_scale=0)
+
+import robot_controller as robo  # After install, so it uses the simulated EV3
+
+TRACK_RADIUS = 10.0  # inches
+TRACK_WAIST = 0.3  # How much the peanut is pinched in the middle (0 is a circle)
+TRACK_POINTS = 600
+LINE_WIDTH = 0.75  # inches
+SENSOR_SPOT = 0.3  # inches, the size of the spot the color sensor sees
+SENSOR_AHEAD = 1.5  # inches from the middle of the wheels to the color sensor
+WHEEL_BASE = 5.73  # inches (turn_degrees turns the wheels 4.5 degrees per degree of robot turn)
+BLACK = 5
+WHITE = 60
+LOST_DISTANCE = 4.0  # inches from the tape counts as lost
+TIME_LIMIT = 40.0  # seconds
+
+
+class SimMotor(object):
+    def __init__(self):
+        self.speed_sp = 0
+        self.state = []
+
+    def run_forever(self, speed_sp):
+        self.speed_sp = speed_sp
+        self.state = ["running"]
+
+    def stop(self, stop_action="brake"):
+        self.speed_sp = 0
+        self.state = []
+
+
+class SimTrack(object):
+    """The robot position is moved forward (in small steps) every time the color sensor is read."""
+
+    def __init__(self):
+        self.points = []
+        for k in range(TRACK_POINTS):
+            angle = 2 * math.pi * k / TRACK_POINTS
+            radius = TRACK_RADIUS * (1 + TRACK_WAIST * math.cos(2 * angle))
+            self.points.append((radius * math.cos(angle), radius * math.sin(angle)))
+        self.length = sum(math.hypot(self.points[k][0] - self.points[k - 1][0],
+                                     self.points[k][1] - self.points[k - 1][1]) for k in range(TRACK_POINTS))
+        self.left_motor = SimMotor()
+        self.right_motor = SimMotor()
+        # Start with the color sensor on the left edge of the tape, going counterclockwise.
+        self.heading = math.pi / 2
+        self.x = self.points[0][0] - LINE_WIDTH / 2
+        self.y = self.points[0][1] - SENSOR_AHEAD
+        self.nearest = 0
+        self.progress = 0  # Track points passed (TRACK_POINTS is one lap)
+        self.distance = 0.0  # From the sensor to the middle of the tape
+        self.last_time = time.monotonic()
+
+    def read_intensity(self):
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        self.last_time = now
+        steps = int(elapsed / 0.002) + 1
+        for k in range(steps):
+            self.move(elapsed / steps)
+        edge_distance = self.distance - LINE_WIDTH / 2
+        white = max(0.0, min(1.0, edge_distance / SENSOR_SPOT + 0.5))
+        return int(BLACK + (WHITE - BLACK) * white)
+
+    def move(self, dt):
+        left = self.left_motor.speed_sp / 90  # inches per second
+        right = self.right_motor.speed_sp / 90
+        self.heading += (right - left) / WHEEL_BASE * dt
+        self.x += (left + right) / 2 * math.cos(self.heading) * dt
+        self.y += (left + right) / 2 * math.sin(self.heading) * dt
+        sensor_x = self.x + SENSOR_AHEAD * math.cos(self.heading)
+        sensor_y = self.y + SENSOR_AHEAD * math.sin(self.heading)
+        best = None
+        for k in range(self.nearest - 20, self.nearest + 21):
+            point = self.points[k % TRACK_POINTS]
+            distance = math.hypot(point[0] - sensor_x, point[1] - sensor_y)
+            if best is None or distance < best[0]:
+                best = (distance, k)
+        self.distance = best[0]
+        self.progress += best[1] - self.nearest
+        self.nearest = best[1] % TRACK_POINTS
+
+    def lap_done(self):
+        return self.progress >= TRACK_POINTS or self.lost() or time.monotonic() - self.start_time > TIME_LIMIT
+
+    def lost(self):
+        return self.distance > LOST_DISTANCE
+
+
+class SimRobot(object):
+    """Just the parts of a Snatch3r that the line followers use."""
+
+    def __init__(self, track):
+        self.left_motor = track.left_motor
+        self.right_motor = track.right_motor
+        self.write_cache = robo.WriteCache()
+        self.MAX_SPEED = 900
+
+    def forward(self, left_speed, right_speed):
+        self.write_cache.run_forever(self.right_motor, right_speed)
+        self.write_cache.run_forever(self.left_motor, left_speed)
+
+    def right(self, right_speed):
+        self.write_cache.run_forever(self.right_motor, -right_speed)
+        self.write_cache.run_forever(self.left_motor, right_speed)
+
+
+def main():
+    print("Simulated track: {:.0f} inches with left and right turns".format(SimTrack().length))
+    print("                                  lap time   avg off edge   loop rate   jitter avg/max ms   work avg ms")
+    run_bang_bang()
+    for speed, rate_hz in [(400, 100), (600, 100), (600, 25)]:
+        run_pid(speed, rate_hz)
+
+
+def run_bang_bang():
+    track = SimTrack()
+    robot = SimRobot(track)
+    white_level, black_level = WHITE, BLACK
+    threshold = (white_level + black_level) / 2
+    track.start_time = time.monotonic()
+    while not track.lap_done():
+        if track.read_intensity() > threshold:
+            robot.right(300)
+            time.sleep(0.2)
+        else:
+            robot.forward(300, 300)
+            time.sleep(0.2)
+    report("bang-bang, sleep 0.2", track, None)
+
+
+def run_pid(speed, rate_hz):
+    track = SimTrack()
+    robot = SimRobot(track)
+    line_follower = robo.LineFollower(robot, track.read_intensity, speed=speed, rate_hz=rate_hz)
+    line_follower.calibrate()
+    track.read_intensity()  # Move to where calibration left the robot, then start the lap from there
+    track.progress = 0
+    track.start_time = time.monotonic()
+    line_follower.run(until=track.lap_done)
+    report("PID, speed {}, {} Hz".format(speed, rate_hz), track, line_follower.timing_stats())
+
+
+def report(name, track, stats):
+    seconds = time.monotonic() - track.start_time
+    if track.lost():
+        lap = "lost at {:.0f}%".format(track.progress / TRACK_POINTS * 100)
+    elif track.progress < TRACK_POINTS:
+        lap = "{:.0f}% in {:.0f} s".format(max(0, track.progress) / TRACK_POINTS * 100, seconds)
+    else:
+        lap = "{:.1f} s".format(seconds)
+    if stats is None:
+        print("  {:30} {:>10}".format(name, lap))
+    else:
+        print("  {:30} {:>10}   {:>12.2f}   {:>6.0f} Hz   {:>8.2f} / {:<8.2f}   {:>8.3f}".format(
+            name, lap, stats["mean_abs_error"], stats["rate_hz"], stats["mean_jitter_ms"], stats["max_jitter_ms"],
+            stats["mean_work_ms"]))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
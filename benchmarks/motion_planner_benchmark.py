@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Drives a square and a hexagon with a simulated Snatch3r, with drive_polygon (drive_inches then turn_degrees for each
+side, stopping after each one) and with drive_polygon(blend=True), which uses robot_controller.MotionPlanner (one
+continuous motion with blended corners), and reports the total time and how far from the starting point the robot
+ends up.
+
+It uses the simulated EV3 from ev3sim.py: its motors speed up and slow down like real ones, and run_to_rel_pos
+slows down just in time to stop on the target.  It runs in stepped time, so it takes a few seconds and every run
+gives the same result.
+  PYTHONPATH=libs python3 benchmarks/motion_planner_benchmark.py
+"""
+
+import time
+
+import ev3sim
+
+WORLD = ev3sim.install(time_scale=0)
+
+import robot_controller as robo  # After install, so it uses the simulated EV3
+
+SPEED = 600
+EDGE_LENGTH = 12  # inches
+
+
+def main():
+    print("{} inch sides at speed {}:".format(EDGE_LENGTH, SPEED))
+    print("                               seconds   inches from start   heading error (degrees)")
+    for sides in [4, 6]:
+        robot = start()
+        start_time = time.monotonic()
+        robot.drive_polygon(sides, SPEED, EDGE_LENGTH)
+        report("{} sides, stop after each".format(sides), time.monotonic() - start_time)
+
+        robot = start()
+        seconds = robot.drive_polygon(sides, SPEED, EDGE_LENGTH, blend=True)
+        report("{} sides, blend=True".format(sides), seconds)
+
+
+def start():
+    """Puts the robot back at (0, 0) and returns a new Snatch3r."""
+    WORLD.reset()
+    return robo.Snatch3r()
+
+
+def report(name, seconds):
+    time.sleep(0.5)  # Lets the motors finish braking
+    x, y, heading = WORLD.pose()
+    print("  {:27} {:>8.2f}   {:>17.2f}   {:>23.1f}".format(name, seconds, (x ** 2 + y ** 2) ** 0.5, heading))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
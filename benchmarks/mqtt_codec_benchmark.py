@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compares the cost of the MqttClient wire formats (codecs).  For a few typical messages it prints the time to
+encode and decode a message plus the number of bytes that go over the wire.  No MQTT broker is needed.
+
+Run this on the EV3 to see the numbers that matter most (the EV3 CPU is MUCH slower than your computer).
+"""
+
+import time
+
+import mqtt_remote_method_calls as com
+
+# Typical messages used in the curriculum.
+SAMPLE_MESSAGES = [
+    ("stop", None),
+    ("forward", [300, 300]),
+    ("on_rectangle_update", [163, 98, 41, 37]),
+    ("drive_time", [600, 1.5]),
+    ("on_chat_message", ["Dave: Hello from the robot!"]),
+]
+
+ITERATIONS = 20000
+
+
+def main():
+    method_names = sorted(name for name, parameter_list in SAMPLE_MESSAGES)
+    codecs = [("json", com.JsonCodec(), com.JsonCodec()),
+              ("binary", com.BinaryCodec(method_names), com.BinaryCodec(method_names))]
+
+    print("{:<22}{:<8}{:>12}{:>12}{:>8}".format("message", "codec", "encode us", "decode us", "bytes"))
+    for function_name, parameter_list in SAMPLE_MESSAGES:
+        for codec_name, sender, receiver in codecs:
+            encode_us, decode_us, size = time_codec(sender, receiver, function_name, parameter_list)
+            print("{:<22}{:<8}{:>12.2f}{:>12.2f}{:>8}".format(function_name, codec_name, encode_us, decode_us, size))
+
+
+def time_codec(sender, receiver, function_name, parameter_list):
+    """
+    Returns the encode time (microseconds), decode time (microseconds) and size (bytes) of one message.
+
+    Type hints:
+      :type sender: com.JsonCodec | com.BinaryCodec
+      :type receiver: com.JsonCodec | com.BinaryCodec
+      :type function_name: str
+      :type parameter_list: list | None
+      :rtype: (float, float, int)
+    """
+    start = time.perf_counter()
+    for k in range(ITERATIONS):
+        message = sender.encode(function_name, parameter_list)
+    encode_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    if isinstance(message, str):
+        message = message.encode()  # The MQTT client always receives bytes.
+    start = time.perf_counter()
+    for k in range(ITERATIONS):
+        decoded = receiver.decode(message)
+    decode_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    assert decoded == com.Call(function_name, parameter_list or [], None)
+    return encode_us, decode_us, len(message)
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
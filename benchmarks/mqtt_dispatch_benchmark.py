@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of finding and calling the delegate method for one received message.  It compares the old way
+(hasattr + getattr on the delegate for every message) with the dispatch table that MqttClient now builds when it
+is constructed.  Only the dispatch step is timed (no decoding, no network).
+"""
+
+import time
+
+import mqtt_remote_method_calls as com
+
+ITERATIONS = 200000
+
+
+class RobotDelegate(object):
+    """A delegate with about as many methods as a Snatch3r."""
+
+    def forward(self, left_speed, right_speed):
+        pass
+
+    def stop(self):
+        pass
+
+    def left(self, speed):
+        pass
+
+    def right(self, speed):
+        pass
+
+    def back(self, left_speed, right_speed):
+        pass
+
+    def arm_up(self):
+        pass
+
+    def arm_down(self):
+        pass
+
+    def drive_inches(self, inches_target, speed_deg_per_second):
+        pass
+
+    def turn_degrees(self, degrees_to_turn, turn_speed_sp):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def main():
+    delegate = RobotDelegate()
+    mqtt_client = com.MqttClient(delegate)
+    message = com.Call("forward", [300, 300], None)
+
+    start = time.perf_counter()
+    for k in range(ITERATIONS):
+        getattr_dispatch(delegate, message)
+    before_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    start = time.perf_counter()
+    for k in range(ITERATIONS):
+        mqtt_client._dispatch(message)
+    after_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    print("hasattr + getattr per message:  {:.3f} us".format(before_us))
+    print("dispatch table per message:     {:.3f} us".format(after_us))
+
+
+def getattr_dispatch(delegate, message):
+    """How MqttClient used to find and call the delegate method (kept here only for comparison)."""
+    message_type, message_payload, call_id = message
+    if hasattr(delegate, message_type):
+        method_to_call = getattr(delegate, message_type)
+        method_to_call(*message_payload)
+    else:
+        print("Attempt to call method {} which was not found.".format(message_type))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
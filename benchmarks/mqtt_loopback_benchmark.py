@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Measures MqttClient throughput and latency without the real MQTT broker.  An "EV3" client (with a delegate) and a
+"PC" client run in this one process and talk through the in-process loopback broker.  For each codec it prints:
+  - messages/sec for one way send_message calls
+  - the CPU time used per message (both ends together, since they share this process)
+  - p50 and p99 round trip latency of call (request and reply)
+
+Run with the argument  tcp  to also measure through the local TCP broker from the mqtt_loopback module (that uses
+real paho clients and sockets, so it is closer to what happens with the real broker).
+"""
+
+import sys
+import threading
+import time
+
+import mqtt_loopback
+import mqtt_remote_method_calls as com
+
+MESSAGE_COUNT = 5000
+CALL_COUNT = 1000
+
+
+class EchoDelegate(object):
+    """The delegate on the "EV3" end."""
+
+    def __init__(self):
+        self.received = 0
+        self.expected = 0
+        self.all_received = threading.Event()
+
+    def count_message(self, left_speed, right_speed):
+        self.received += 1
+        if self.received == self.expected:
+            self.all_received.set()
+
+    def echo(self, value):
+        return value
+
+
+def main():
+    transports = [("loopback", com.LOOPBACK)]
+    tcp_broker = None
+    if "tcp" in sys.argv[1:]:
+        tcp_broker = mqtt_loopback.TcpBroker(port=1883).start()
+        transports.append(("tcp", "localhost"))
+
+    results = []
+    for transport_name, broker_address in transports:
+        for codec_class in [com.JsonCodec, com.BinaryCodec]:
+            results.append((transport_name, codec_class.__name__) + run_benchmark(broker_address, codec_class))
+    if tcp_broker:
+        tcp_broker.stop()
+
+    print()
+    print("{:<10}{:<13}{:>12}{:>14}{:>12}{:>12}".format("transport", "codec", "msgs/sec", "CPU us/msg",
+                                                         "p50 ms", "p99 ms"))
+    for transport_name, codec_name, rate, cpu_us, p50, p99 in results:
+        print("{:<10}{:<13}{:>12.0f}{:>14.1f}{:>12.3f}{:>12.3f}".format(transport_name, codec_name, rate, cpu_us,
+                                                                       p50 * 1000, p99 * 1000))
+
+
+def run_benchmark(broker_address, codec_class):
+    """
+    Returns (messages per second, CPU microseconds per message, p50 round trip seconds, p99 round trip seconds).
+
+    Type hints:
+      :type broker_address: str
+      :rtype: (float, float, float, float)
+    """
+    ev3_delegate = EchoDelegate()
+    ev3_client = com.MqttClient(ev3_delegate, codec=codec_class())
+    ev3_client.connect_to_pc(broker_address)
+    pc_client = com.MqttClient(codec=codec_class())
+    pc_client.connect_to_ev3(broker_address)
+    wait_until_connected(pc_client)
+
+    # Throughput of one way messages
+    ev3_delegate.expected = MESSAGE_COUNT
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    for k in range(MESSAGE_COUNT):
+        pc_client.send_message("count_message", [300, 300])
+    ev3_delegate.all_received.wait(60)
+    elapsed = time.perf_counter() - start_time
+    cpu_us = (time.process_time() - start_cpu) / MESSAGE_COUNT * 1e6
+
+    # Round trip latency, one call at a time
+    round_trips = []
+    for k in range(CALL_COUNT):
+        call_start = time.perf_counter()
+        pc_client.call("echo", [k]).result(5)
+        round_trips.append(time.perf_counter() - call_start)
+    round_trips.sort()
+
+    pc_client.close()
+    ev3_client.close()
+    return (ev3_delegate.received / elapsed, cpu_us, round_trips[len(round_trips) // 2],
+            round_trips[int(len(round_trips) * 0.99)])
+
+
+def wait_until_connected(mqtt_client):
+    """Keeps calling echo until one gets a reply, since the subscriptions finish in the background."""
+    for k in range(50):
+        try:
+            mqtt_client.call("echo", [0], timeout=0.2).result()
+            return
+        except Exception:
+            pass
+    raise RuntimeError("Unable to connect to the broker")
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
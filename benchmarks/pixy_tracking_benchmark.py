@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Measures how far off the estimate of a Pixy object's x position is, at different Pixy reading rates, for:
+  - using the last reading until the next one (what m3_color_tracking.py does, reading every 0.25 seconds)
+  - robot_controller.PositionFilter (a Kalman filter), predicting the position between readings (like PixyTracker)
+
+By default it uses a synthetic trace: an object moving back and forth in front of the camera, with noisy readings
+that are 20 ms old when they arrive (like a real Pixy).  It can also use a trace recorded on the robot:
+
+  On the EV3:  python3 pixy_tracking_benchmark.py record trace.csv 20   (records 20 seconds of SIG1 readings)
+  Anywhere:    python3 pixy_tracking_benchmark.py trace.csv
+
+For a recorded trace the "true" position is the recording itself at its full rate (so the noise counts as error).
+Recording needs python-ev3dev and the Pixy.  The rest runs on any computer: it only uses PositionFilter, so it
+imports robot_controller on the simulated EV3 from ev3sim.py.
+"""
+
+import math
+import random
+import sys
+import time
+
+import ev3sim
+
+if sys.argv[1:2] != ["record"]:
+    ev3sim.install(time_scale=1)
+
+import robot_controller as robo  # After install, so it uses the simulated EV3 unless recording
+
+SAMPLE_RATES = [50, 25, 10, 4]
+PIXY_LATENCY = 0.02  # seconds
+DEGREES_PER_PIXEL = 75 / 320
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        record(sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else 20)
+        return
+    if len(sys.argv) > 1:
+        times, readings = load(sys.argv[1])
+        true_times, true_x = times, readings
+        latency = 0.0  # The recording has the latency in it already, it can't be removed
+        print("Recorded trace {} ({:.1f} seconds)".format(sys.argv[1], times[-1] - times[0]))
+    else:
+        true_times, true_x, times, readings = synthetic_trace(20)
+        latency = PIXY_LATENCY
+        print("Synthetic trace (20 seconds, noise 3 pixels, readings {:.0f} ms old)".format(PIXY_LATENCY * 1000))
+
+    print("Average error in pixels (degrees):")
+    print("  readings/second     last reading       PositionFilter")
+    for rate in SAMPLE_RATES:
+        sample_times, sample_x = decimate(times, readings, rate)
+        held = evaluate(true_times, true_x, sample_times, sample_x, hold_estimator())
+        filtered = evaluate(true_times, true_x, sample_times, sample_x, filter_estimator(latency))
+        print("  {:>15}   {:>6.1f} ({:>4.1f})     {:>6.1f} ({:>4.1f})".format(
+            rate, held, held * DEGREES_PER_PIXEL, filtered, filtered * DEGREES_PER_PIXEL))
+
+
+def synthetic_trace(seconds):
+    """Returns the true positions (at 200 per second) and the Pixy readings (at 50 per second)."""
+    random_numbers = random.Random(1)
+
+    def position(t):
+        return 160 + 100 * math.sin(2 * math.pi * 0.3 * t) + 40 * math.sin(2 * math.pi * 0.9 * t + 1)
+
+    true_times = [k / 200 for k in range(int(seconds * 200))]
+    true_x = [position(t) for t in true_times]
+    times = [k / 50 for k in range(int(seconds * 50))]
+    readings = [int(round(position(t - PIXY_LATENCY) + random_numbers.gauss(0, 3))) for t in times]
+    return true_times, true_x, times, readings
+
+
+def decimate(times, readings, rate):
+    """Keeps only the readings that a loop reading rate times a second would get."""
+    sample_times = []
+    sample_x = []
+    next_time = times[0]
+    for t, x in zip(times, readings):
+        if t >= next_time - 1e-9:
+            sample_times.append(t)
+            sample_x.append(x)
+            next_time += 1 / rate
+    return sample_times, sample_x
+
+
+def hold_estimator():
+    last = [None]
+
+    def add(t, x):
+        last[0] = x
+
+    return add, lambda t: last[0]
+
+
+def filter_estimator(latency):
+    x_filter = robo.PositionFilter()
+    return (lambda t, x: x_filter.update(x, t)), (lambda t: x_filter.predict(t + latency))
+
+
+def evaluate(true_times, true_x, sample_times, sample_x, estimator):
+    """Returns the average distance between the estimate and the true position, checked at every true time."""
+    add, estimate = estimator
+    total = 0.0
+    count = 0
+    next_sample = 0
+    for t, x in zip(true_times, true_x):
+        while next_sample < len(sample_times) and sample_times[next_sample] <= t:
+            add(sample_times[next_sample], sample_x[next_sample])
+            next_sample += 1
+        if next_sample > 0:
+            total += abs(estimate(t) - x)
+            count += 1
+    return total / count
+
+
+def load(filename):
+    times = []
+    readings = []
+    with open(filename) as trace_file:
+        for line in trace_file:
+            if line.startswith("timestamp"):
+                continue
+            timestamp, x, y, width, height = line.split(",")
+            if int(width) > 0:
+                times.append(float(timestamp))
+                readings.append(int(x))
+    return times, readings
+
+
+def record(filename, seconds):
+    robot = robo.Snatch3r()
+    read_block = robot.fast_sensor_reader(robot.pixy, "SIG1", 1, 5)
+    timer = robo.FixedRateTimer(50)
+    start_time = timer.start()
+    with open(filename, "w") as trace_file:
+        trace_file.write("timestamp,x,y,width,height\n")
+        while time.monotonic() - start_time < seconds:
+            now = time.monotonic()
+            trace_file.write("{:.4f},{},{},{},{}\n".format(now - start_time, *read_block()))
+            timer.wait()
+    print("Saved", filename)
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Runs the real robot_controller code on the simulated EV3 from ev3sim.py, in stepped time (as fast as the computer
+can go, and the same result every run), and reports the simulated times:
+  - follow_line: one lap of the peanut track (calibrate_line first), at a few speeds
+  - BeaconHoming: time to see and to reach the beacon, for a few beacon positions
+  - PixyTracker: how far off center (in Pixy pixels) a target moving back and forth stays
+
+Unlike the other simulated benchmarks this one uses the whole Snatch3r (motors that speed up and slow down, the
+color sensor spot over the tape, the IR-SEEK readings, the Pixy), so it is also a quick check after changing one of
+the controllers: it exits with status 1 if a lap or a pickup fails.  It doesn't need python-ev3dev.
+  PYTHONPATH=libs python3 benchmarks/sim_robot_benchmark.py
+"""
+
+import math
+import sys
+import time
+
+import ev3sim
+
+WORLD = ev3sim.install(time_scale=0)
+
+import robot_controller as robo  # After install, so it uses the simulated EV3
+
+LINE_SPEEDS = [300, 400, 600]
+BEACON_POSITIONS = [(40, 5), (25, -25), (-20, 20)]  # The robot starts at (0, 0) facing along the x axis
+TIME_LIMIT = 60.0  # simulated seconds
+LOST_DISTANCE = 4.0  # inches from the tape counts as lost
+
+
+def main():
+    failures = 0
+    wall_start = time.perf_counter()
+    simulated_start = time.monotonic()
+
+    print("follow_line, one lap of the peanut track:")
+    print("  speed   lap seconds   loop rate   avg off edge")
+    for speed in LINE_SPEEDS:
+        failures += run_line(speed)
+
+    print("BeaconHoming:")
+    print("  beacon at      seconds to see   seconds to reach   inches left")
+    for beacon in BEACON_POSITIONS:
+        failures += run_beacon(beacon)
+
+    print("PixyTracker, target moving back and forth 30 inches away:")
+    run_pixy()
+
+    wall_seconds = time.perf_counter() - wall_start
+    simulated_seconds = time.monotonic() - simulated_start
+    print("{:.0f} simulated seconds in {:.1f} real seconds ({:.0f} times faster than real time)".format(
+        simulated_seconds, wall_seconds, simulated_seconds / wall_seconds))
+    if failures:
+        print("FAILED:", failures)
+        sys.exit(1)
+
+
+def run_line(speed):
+    WORLD.reset()
+    track = WORLD.floor.lines[0]
+    # The color sensor on the left edge of the tape at the start of the track, going counterclockwise.
+    WORLD.place_robot(track[0][0] - 0.375, track[0][1] - ev3sim.COLOR_SENSOR_AHEAD, 90)
+    robot = robo.Snatch3r()
+    robot.calibrate_line()
+    lap = LapCounter(track)
+    seconds = robot.follow_line(speed=speed, until=lap.done, timeout=TIME_LIMIT)
+    stats = robot.line_follower.timing_stats()
+    if lap.angle < 2 * math.pi:
+        print("  {:>5}   {:>11}".format(speed, "lost" if lap.lost() else "too slow"))
+        return 1
+    print("  {:>5}   {:>11.1f}   {:>6.0f} Hz   {:>12.2f}".format(speed, seconds, stats["rate_hz"],
+                                                               stats["mean_abs_error"]))
+    return 0
+
+
+class LapCounter(object):
+    """Adds up how far around (0, 0) the robot has gone, the peanut track goes around it once."""
+
+    def __init__(self, track):
+        self.track = track
+        self.angle = 0.0
+        self.last_angle = self.current_angle()
+
+    def current_angle(self):
+        x, y, heading = WORLD.pose()
+        return math.atan2(y, x)
+
+    def done(self):
+        angle = self.current_angle()
+        self.angle += (angle - self.last_angle + math.pi) % (2 * math.pi) - math.pi
+        self.last_angle = angle
+        return self.angle >= 2 * math.pi or self.lost()
+
+    def lost(self):
+        x, y = WORLD.sensor_position(ev3sim.COLOR_SENSOR_AHEAD)
+        return min(math.hypot(x - point_x, y - point_y) for point_x, point_y in self.track) > LOST_DISTANCE
+
+
+def run_beacon(beacon):
+    WORLD.reset()
+    WORLD.beacons[1] = beacon
+    robot = robo.Snatch3r()
+    beacon_homing = robo.BeaconHoming(robot)
+    found = beacon_homing.run(until=lambda: False, timeout=TIME_LIMIT)
+    x, y = WORLD.sensor_position(ev3sim.IR_SENSOR_AHEAD)
+    left = math.hypot(beacon[0] - x, beacon[1] - y)
+    if not found:
+        print("  {:>10}   {:>14}".format(str(beacon), "not reached"))
+        return 1
+    print("  {:>10}   {:>14.1f}   {:>16.1f}   {:>11.1f}".format(str(beacon), beacon_homing.time_to_acquire,
+                                                                 beacon_homing.time_to_pickup, left))
+    return 0
+
+
+def run_pixy():
+    WORLD.reset()
+    start_time = time.monotonic()
+
+    def target(t):
+        return 30, 12 * math.sin(2 * math.pi * 0.25 * (t - start_time))
+
+    WORLD.pixy_target = target
+    robot = robo.Snatch3r()
+    robot.pixy_tracker = robo.PixyTracker(robot, log_size=1000)  # Room for all 20 seconds of frames
+    robot.track_color(until=lambda: False, timeout=20)
+    samples = robot.pixy_tracker.samples.window(len(robot.pixy_tracker.samples))
+    errors = [abs(x - robo.PixyTracker.CENTER_X) for timestamp, (x, y, width, height) in samples if width > 0]
+    print("  average {:.1f} pixels off center, worst {:.0f}, target seen in {:.0f}% of the frames".format(
+        sum(errors) / max(1, len(errors)), max(errors, default=0), 100 * len(errors) / max(1, len(samples))))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
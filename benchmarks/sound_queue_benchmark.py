@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compares speaking the ev3.Sound way (ev3.Sound.speak("...").wait() starts espeak and waits) with
+sound_queue.SoundQueue (the WAV is made once and kept, played on a background thread):
+  - a 50 Hz control loop that says a phrase every second: the longest the loop was stalled and the loop
+    iterations it missed
+  - making a phrase the first time vs finding it in the cache
+  - how long a HIGH priority sound with interrupt=True waits before it starts, while a long sentence is playing
+
+It runs on the simulated EV3 from ev3sim.py in real time (the sounds take as long as they would on the robot, but
+are silent), and uses a fake espeak that takes ESPEAK_SECONDS to make a WAV file, so it runs on any computer.
+  PYTHONPATH=libs python3 benchmarks/sound_queue_benchmark.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import ev3sim
+
+WORLD = ev3sim.install(time_scale=1)
+
+import ev3dev.ev3 as ev3
+import sound_queue
+
+PHRASES = ["Beacon pickup", "Goodbye", "Error", "Beacon pickup", "Goodbye"]
+LOOP_HZ = 50
+ESPEAK_SECONDS = 0.5  # About how long espeak takes to start and make a short phrase on the EV3
+FAKE_ESPEAK = """#!{python}
+import sys, time, wave
+time.sleep({seconds})
+with wave.open(sys.argv[sys.argv.index("-w") + 1], "wb") as wav:
+    wav.setnchannels(1)
+    wav.setsampwidth(2)
+    wav.setframerate(22050)
+    wav.writeframes(bytes(2 * int(22050 * (0.4 + 0.06 * len(sys.argv[-1])))))
+"""
+
+
+def main():
+    folder = tempfile.mkdtemp()
+    espeak = os.path.join(folder, "espeak")
+    with open(espeak, "w") as espeak_file:
+        espeak_file.write(FAKE_ESPEAK.format(python=sys.executable, seconds=ESPEAK_SECONDS))
+    os.chmod(espeak, 0o755)
+    cache = sound_queue.SpeechCache(os.path.join(folder, "speech"), espeak)
+
+    print("{} Hz loop saying a phrase every second for {} seconds:".format(LOOP_HZ, len(PHRASES)))
+    print("                                     worst stall ms   missed iterations")
+
+    def speak_and_wait(text):
+        # ev3sim.Sound.speak takes as long as saying it, the real one also waits ESPEAK_SECONDS for espeak
+        time.sleep(ESPEAK_SECONDS)
+        ev3.Sound.speak(text).wait()
+
+    stall, missed = control_loop(speak_and_wait)
+    print("  {:34} {:>14.1f}   {:>17}".format("ev3.Sound.speak(...).wait()", stall * 1000, missed))
+
+    sounds = sound_queue.SoundQueue(cache)
+    stall, missed = control_loop(sounds.speak)
+    sounds.wait()
+    print("  {:34} {:>14.1f}   {:>17}".format("SoundQueue.speak", stall * 1000, missed))
+
+    print("Making the WAV file (milliseconds):")
+    start = time.perf_counter()
+    cache.render("Nice to meet you")
+    print("  {:34} {:>8.1f}".format("first time (espeak)", (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    cache.render("Nice to meet you")
+    print("  {:34} {:>8.3f}".format("cached", (time.perf_counter() - start) * 1000))
+    print("  cache: {} hits, {} misses".format(cache.hits, cache.misses))
+
+    sounds.speak("This is a long sentence that takes a few seconds to say")
+    time.sleep(ESPEAK_SECONDS + 0.5)  # Made and playing
+    sound_count = len(WORLD.sounds)
+    start = time.perf_counter()
+    sounds.speak("Goodbye", sound_queue.SoundQueue.HIGH, interrupt=True)
+    while len(WORLD.sounds) == sound_count:
+        time.sleep(0.001)
+    print("Interrupting a long sentence: Goodbye started after {:.0f} ms ({} played, {} interrupted)".format(
+        (time.perf_counter() - start) * 1000, sounds.played, sounds.interrupted))
+    sounds.close()
+
+
+def control_loop(speak):
+    """Runs a LOOP_HZ loop for len(PHRASES) seconds, speaking one phrase each second.  Returns (stall, missed)."""
+    period = 1 / LOOP_HZ
+    worst = 0.0
+    iterations = 0
+    start_time = time.monotonic()
+    next_time = start_time
+    for k in range(len(PHRASES) * LOOP_HZ):
+        start = time.perf_counter()
+        if k % LOOP_HZ == 0:
+            speak(PHRASES[k // LOOP_HZ])
+        worst = max(worst, time.perf_counter() - start)
+        iterations += 1
+        next_time += period
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_time = time.monotonic()
+    expected = round((time.monotonic() - start_time) / period)
+    return worst, expected - iterations
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Measures how long programs take to start, from launching python3 until the robot is ready to use, for the common
+ways of starting: importing ev3dev, importing robot_controller, making a Snatch3r (devices made lazily, or all of
+them right away like the Snatch3r used to), and attaching to a running robot_server.  Each one runs in a new
+python3 process several times and the median is reported.
+
+Run it on the EV3 to see the real numbers.  On a computer without python-ev3dev the server and the programs use
+the simulated EV3 from ev3sim.py (EV3_BACKEND=sim), so the numbers only show how the ways of starting compare:
+  PYTHONPATH=libs python3 benchmarks/startup_benchmark.py
+"""
+
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 5
+ON_EV3 = importlib.util.find_spec("ev3dev") is not None
+ENVIRONMENT = dict(os.environ) if ON_EV3 else dict(os.environ, EV3_BACKEND="sim")
+
+ENTRY_POINTS = [
+    ("python3 (nothing imported)", "pass"),
+    ("import ev3dev.ev3", "import ev3dev.ev3"),
+    ("import robot_controller", "import robot_controller"),
+    ("Snatch3r() (lazy devices)", "import robot_controller; robot_controller.Snatch3r()"),
+    ("Snatch3r() + warm_up()", "import robot_controller; robot_controller.Snatch3r().warm_up()"),
+    ("Snatch3r() + drive motors only", "import robot_controller; r = robot_controller.Snatch3r(); "
+                                       "r.left_motor; r.right_motor"),
+    ("robot_server.connect() + call", "import robot_server; robot_server.connect({path!r}).get('MAX_SPEED')"),
+]
+
+
+def main():
+    socket_path = os.path.join(tempfile.mkdtemp(), "snatch3r.sock")
+    server = subprocess.Popen([sys.executable, "-m", "robot_server", socket_path], stdout=subprocess.DEVNULL,
+                              env=ENVIRONMENT)
+    try:
+        wait_for(socket_path, server)
+        print("Milliseconds from starting python3 until ready (median of {} runs{}):".format(
+            RUNS, "" if ON_EV3 else ", simulated EV3"))
+        for name, code in ENTRY_POINTS:
+            if "ev3dev" in code and not ON_EV3:
+                print("  {:34} {:>8}".format(name, "-"))
+                continue
+            code = code.format(path=socket_path)
+            times = [run_once(code) for k in range(RUNS)]
+            print("  {:34} {:>8.0f}".format(name, statistics.median(times)))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_once(code):
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, "-c", code], env=ENVIRONMENT)
+    return (time.perf_counter() - start) * 1000
+
+
+def wait_for(socket_path, server):
+    end_time = time.monotonic() + 60  # Starting the server on the EV3 takes a while
+    while not os.path.exists(socket_path):
+        if time.monotonic() > end_time or server.poll() is not None:
+            raise RuntimeError("The robot server did not start")
+        time.sleep(0.05)
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compares ways of reading the 5 value attributes of a sensor (like the Pixy x, y, width, height readings).  A fake
+sysfs folder is made in a temporary directory, so this runs on any computer.  On the EV3 you can instead give the
+real sensor folder as an argument, for example:  /sys/class/lego-sensor/sensor2
+
+  - open, read, close every file for every sample (what reading a sysfs file "by hand" does)
+  - cached file objects with seek + read (about what python-ev3dev does for each pixy.value(n))
+  - ev3_sysfs.SensorValues (open file descriptors, one os.pread per value, into a preallocated array)
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import ev3_sysfs
+
+VALUE_COUNT = 5
+ITERATIONS = 20000
+
+
+def main():
+    if len(sys.argv) > 1:
+        device_path = sys.argv[1]
+    else:
+        device_path = tempfile.mkdtemp()
+        for k in range(VALUE_COUNT):
+            with open(os.path.join(device_path, "value{}".format(k)), "w") as value_file:
+                value_file.write("{}\n".format(100 + k))
+
+    paths = [os.path.join(device_path, "value{}".format(k)) for k in range(VALUE_COUNT)]
+    print("Microseconds per sample of {} values:".format(VALUE_COUNT))
+    print("  open/read/close each file:   {:.2f}".format(time_it(lambda: open_read_close(paths))))
+
+    files = [open(path) for path in paths]
+    print("  cached files, seek + read:   {:.2f}".format(time_it(lambda: seek_and_read(files))))
+    for value_file in files:
+        value_file.close()
+
+    sensor_values = ev3_sysfs.SensorValues(device_path, VALUE_COUNT)
+    print("  ev3_sysfs.SensorValues:      {:.2f}".format(time_it(sensor_values.read)))
+    sensor_values.close()
+
+
+def time_it(read_sample):
+    start = time.perf_counter()
+    for k in range(ITERATIONS):
+        read_sample()
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def open_read_close(paths):
+    values = []
+    for path in paths:
+        with open(path) as value_file:
+            values.append(int(value_file.read()))
+    return values
+
+
+def seek_and_read(files):
+    values = []
+    for value_file in files:
+        value_file.seek(0)
+        values.append(int(value_file.read()))
+    return values
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Floods a tkinter window with MQTT messages (through the in-process loopback broker, no network needed) and compares
+running the delegate methods:
+  - on the MQTT network thread (the old way, changing widgets from the wrong thread)
+  - on the tkinter thread with com.TkDispatcher
+  - on the tkinter thread with com.TkDispatcher, coalescing on_rectangle_update (only the newest Pixy reading)
+
+For each message rate it prints the delegate calls made, the average and worst time from receiving a message until
+its method ran, and the worst lateness of a 10 ms after() timer, which is how long the window stopped responding
+to the mouse and keyboard.  Needs a display (run it on your computer, not over SSH).
+  PYTHONPATH=libs python3 benchmarks/tk_dispatch_benchmark.py
+"""
+
+import threading
+import time
+import tkinter
+
+import mqtt_remote_method_calls as com
+
+RATES = [200, 1000, 3000]  # messages per second
+SECONDS = 2.0
+CHAT_EVERY = 10  # Every 10th message is a chat message, the rest are Pixy rectangles
+HEARTBEAT_MS = 10
+
+
+class PcDelegate(object):
+    """What m2_pc_pixy_display and m2_pc_pychat do with the messages."""
+
+    def __init__(self, canvas, rectangle_tag, label):
+        self.canvas = canvas
+        self.rectangle_tag = rectangle_tag
+        self.label = label
+        self.calls = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def on_rectangle_update(self, x, y, width, height, sent_time):
+        self.canvas.coords(self.rectangle_tag, [x, y, x + width, y + height])
+        self._record(sent_time)
+
+    def on_chat_message(self, message, sent_time):
+        self.label["text"] = message
+        self._record(sent_time)
+
+    def _record(self, sent_time):
+        latency = time.perf_counter() - sent_time
+        self.calls += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+
+def main():
+    print("{:>6}   {:36} {:>8}   {:>10}   {:>10}   {:>14}".format(
+        "msg/s", "", "calls", "avg ms", "worst ms", "GUI stall ms"))
+    for rate in RATES:
+        for name, make_executor in [("MQTT thread (old)", lambda root: None),
+                                    ("TkDispatcher", lambda root: com.TkDispatcher(root)),
+                                    ("TkDispatcher, coalesced", lambda root: com.TkDispatcher(
+                                        root, coalesce_methods=["on_rectangle_update"]))]:
+            run(rate, name, make_executor)
+
+
+def run(rate, name, make_executor):
+    root = tkinter.Tk()
+    canvas = tkinter.Canvas(root, width=320, height=200)
+    canvas.pack()
+    rectangle_tag = canvas.create_rectangle(150, 90, 170, 110, fill="blue")
+    label = tkinter.Label(root, text="")
+    label.pack()
+
+    delegate = PcDelegate(canvas, rectangle_tag, label)
+    pc_client = com.MqttClient(delegate, executor=make_executor(root))
+    pc_client.connect_to_ev3(com.LOOPBACK)
+    ev3_client = com.MqttClient()
+    ev3_client.connect_to_pc(com.LOOPBACK)
+
+    heartbeat = {"expected": None, "worst": 0.0}
+
+    def beat():
+        now = time.perf_counter()
+        if heartbeat["expected"] is not None:
+            heartbeat["worst"] = max(heartbeat["worst"], now - heartbeat["expected"])
+        heartbeat["expected"] = now + HEARTBEAT_MS / 1000
+        root.after(HEARTBEAT_MS, beat)
+
+    def send():
+        period = 1 / rate
+        next_time = time.perf_counter()
+        for k in range(int(rate * SECONDS)):
+            if k % CHAT_EVERY == 0:
+                ev3_client.send_message("on_chat_message", ["Message {}".format(k), time.perf_counter()])
+            else:
+                ev3_client.send_message("on_rectangle_update", [k % 300, 90, 20, 20, time.perf_counter()])
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        root.after(500, root.quit)  # Let the last messages be handled
+
+    root.after(HEARTBEAT_MS, beat)
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    root.mainloop()
+    sender.join()
+    pc_client.close()
+    ev3_client.close()
+    root.destroy()
+    print("{:>6}   {:36} {:>8}   {:>10.2f}   {:>10.2f}   {:>14.1f}".format(
+        rate, name, delegate.calls, delegate.total_latency / max(1, delegate.calls) * 1000,
+        delegate.max_latency * 1000, heartbeat["worst"] * 1000))
+
+
+# ----------------------------------------------------------------------
+# Calls  main  to start the ball rolling.
+# ----------------------------------------------------------------------
+main()
@@ -7,7 +7,8 @@ Author: David Fisher.
 """
 
 import ev3dev.ev3 as ev3
-import time
+
+import input_events
 
 
 class DataContainer(object):
@@ -15,6 +16,7 @@ class DataContainer(object):
 
     def __init__(self):
         self.running = True
+        self.input_loop = None
 
 
 def main():
@@ -51,11 +53,9 @@ def main():
     # Note there is also an enter button but sometimes that causes issues with Brickman when used
     btn.on_backspace = lambda state: handle_shutdown(state, robot, dc)
 
-    while dc.running:
-        rc1.process()
-        rc2.process()
-        btn.process()
-        time.sleep(0.01)
+    # Calls btn.process() as soon as an EV3 button changes and polls the remotes (instead of a time.sleep(0.01) loop).
+    dc.input_loop = input_events.InputEventLoop(btn, [rc1, rc2])
+    dc.input_loop.run()
 
 
 # ----------------------------------------------------------------------
@@ -260,6 +260,7 @@ def handle_shutdown(button_state, robot, dc):
     if button_state:
         # robot.shutdown()  # To stop motors and turn on the GREEN leds.
         dc.running = False
+        dc.input_loop.stop()
 
 
 # ----------------------------------------------------------------------
@@ -0,0 +1,156 @@
+"""
+  A tkinter chat window that stays fast in long chats.  Adding a line with label["text"] += "\n" + message copies
+  the whole chat every time and makes the Label lay out every line again, so each message takes longer than the
+  last one and the chat is never forgotten.
+
+  A ChatView keeps at most capacity lines (the oldest are forgotten, like a RingBuffer) and the Text widget only
+  holds the lines that fit in the window.  Lines added with add are shown together once per frame (every
+  interval_ms), so a burst of messages is one widget update.  Scroll up with the scrollbar or the mouse wheel to
+  see older lines, scroll back to the bottom to follow new ones again.
+
+  Example:
+    import chat_view
+
+    chat_window = chat_view.ChatView(main_frame, capacity=1000, visible_lines=15, width=60)
+    chat_window.grid(columnspan=2)
+    chat_window.add("Me: Hello")  # Safe from any thread, for example from an MQTT delegate method
+"""
+
+import collections
+import itertools
+import tkinter
+from tkinter import ttk
+
+WHEEL_LINES = 3  # Lines scrolled per mouse wheel step
+
+
+class ChatView(object):
+    """A Text widget with a scrollbar, showing the newest of at most capacity lines (see the module docstring)."""
+
+    def __init__(self, master, capacity=1000, visible_lines=15, width=60, interval_ms=30):
+        """
+        Type hints:
+          :type master: tkinter.Widget
+          :type capacity: int
+          :type visible_lines: int
+          :type width: int
+          :type interval_ms: int
+        """
+        self.capacity = capacity
+        self.visible_lines = visible_lines
+        self.interval_ms = interval_ms
+        self.lines = collections.deque(maxlen=capacity)  # The newest capacity lines, oldest first
+        self.lines_added = 0  # Every line ever added (some of them forgotten)
+        self.top = 0  # Index in self.lines of the first line in the window
+        self.following = True  # Scrolled to the bottom, so new lines scroll the window
+        self._pending = collections.deque()  # Lines added since the last frame (append is thread safe)
+
+        self.frame = ttk.Frame(master)
+        self.text = tkinter.Text(self.frame, height=visible_lines, width=width, wrap="word", state="disabled")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tkinter.VERTICAL, command=self._on_scrollbar)
+        self.text.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.text.bind("<MouseWheel>", lambda event: self._on_wheel(-WHEEL_LINES if event.delta > 0 else WHEEL_LINES))
+        self.text.bind("<Button-4>", lambda event: self._on_wheel(-WHEEL_LINES))  # Mouse wheel on Linux
+        self.text.bind("<Button-5>", lambda event: self._on_wheel(WHEEL_LINES))
+        self.frame.after(self.interval_ms, self._run_frame)
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def add(self, line):
+        """
+        Adds a line at the bottom (shown at the next frame).  Safe to call from any thread.  A message with newlines
+        in it is split into its lines, so every entry in self.lines is one line in the Text widget.
+        """
+        self._pending.append(line)
+
+    def clear(self):
+        self._pending.clear()
+        self.lines.clear()
+        self.top = 0
+        self.following = True
+        self._show_window()
+        self._update_scrollbar()
+
+    def flush(self):
+        """Shows the lines added since the last frame now and returns how many there were (call on the tk thread)."""
+        new_lines = []
+        while self._pending:
+            new_lines.extend(str(self._pending.popleft()).split("\n"))
+        if not new_lines:
+            return 0
+        forgotten = max(0, len(self.lines) + len(new_lines) - self.capacity)
+        self.lines.extend(new_lines)
+        self.lines_added += len(new_lines)
+        if self.following:
+            shown = min(len(self.lines) - len(new_lines), self.visible_lines)  # Lines in the widget before
+            self.top = max(0, len(self.lines) - self.visible_lines)
+            if len(new_lines) >= self.visible_lines:
+                self._show_window()
+            else:
+                self.text.configure(state="normal")
+                self.text.insert("end", "".join(("\n" if shown or k else "") + line
+                                                for k, line in enumerate(new_lines)))
+                extra = shown + len(new_lines) - self.visible_lines
+                if extra > 0:
+                    self.text.delete("1.0", "{}.0".format(extra + 1))
+                self.text.configure(state="disabled")
+                self.text.see("end")  # Long lines wrap, so the window might not show the last one
+        elif forgotten > self.top:
+            self.top = 0  # The lines in the window were forgotten
+            self._show_window()
+        else:
+            self.top -= forgotten  # The same lines stay in the window, they just moved up in self.lines
+        self._update_scrollbar()
+        return len(new_lines)
+
+    def scroll(self, lines):
+        """Scrolls down (up if lines is negative) that many lines."""
+        self.scroll_to(self.top + lines)
+
+    def scroll_to(self, top):
+        """Shows the lines starting at self.lines[top]."""
+        last_top = max(0, len(self.lines) - self.visible_lines)
+        top = min(max(0, top), last_top)
+        self.following = top == last_top
+        if top != self.top:
+            self.top = top
+            self._show_window()
+        self._update_scrollbar()
+
+    def _on_scrollbar(self, action, amount, units=None):
+        if action == tkinter.MOVETO:
+            self.scroll_to(round(float(amount) * len(self.lines)))
+        elif units == tkinter.PAGES:
+            self.scroll(int(amount) * self.visible_lines)
+        else:
+            self.scroll(int(amount))
+
+    def _on_wheel(self, lines):
+        self.scroll(lines)
+        return "break"  # The Text widget's own scrolling would only move within the window
+
+    def _show_window(self):
+        """Puts the visible_lines lines starting at self.top into the Text widget."""
+        window = itertools.islice(self.lines, self.top, self.top + self.visible_lines)
+        self.text.configure(state="normal")
+        self.text.delete("1.0", "end")
+        self.text.insert("end", "\n".join(window))
+        self.text.configure(state="disabled")
+        if self.following:
+            self.text.see("end")
+
+    def _update_scrollbar(self):
+        if not self.lines:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        self.scrollbar.set(self.top / len(self.lines),
+                           min(1.0, (self.top + self.visible_lines) / len(self.lines)))
+
+    def _run_frame(self):
+        self.flush()
+        self.frame.after(self.interval_ms, self._run_frame)
@@ -0,0 +1,104 @@
+"""
+  Fast access to the sysfs attribute files of ev3dev devices.
+
+  On ev3dev every sensor reading is a small text file, like /sys/class/lego-sensor/sensor0/value0.  Reading a
+  property such as robot.color_sensor.reflected_light_intensity goes through several Python layers and system calls
+  every time.  This module keeps the attribute files open and reads them with os.pread (one system call, no seek),
+  and SensorValues reads all the valueN attributes of a sensor in one call into a preallocated array.
+
+  Example:
+    robot.pixy.mode = "SIG1"  # Set the mode FIRST, the number of values depends on the mode
+    pixy_values = ev3_sysfs.SensorValues.for_device(robot.pixy)
+    values = pixy_values.read()  # array of value0 ... valueN
+    x, y, width, height = values[1], values[2], values[3], values[4]
+
+  Remember to set the mode again (and make a new SensorValues) if anything else changes the sensor mode.
+"""
+
+import array
+import os
+
+# Sysfs values are short text numbers, so this many bytes is always enough for one read.
+_READ_SIZE = 32
+
+
+class SysfsAttribute(object):
+    """One attribute file that stays open.  Every read is a single os.pread system call."""
+
+    def __init__(self, path):
+        """
+        Type hints:
+          :type path: str
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        """Returns the attribute text (without the newline)."""
+        return os.pread(self.fd, _READ_SIZE, 0).decode().strip()
+
+    def read_int(self):
+        return int(os.pread(self.fd, _READ_SIZE, 0))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SensorValues(object):
+    """
+    The value0 ... valueN attributes of one sensor.  The files are opened once, and read reads all of them into
+    the same preallocated array every time.
+    """
+
+    def __init__(self, device_path, count=None):
+        """
+        device_path is the sysfs folder of the sensor.  If count is None it is read from the num_values attribute
+        (which depends on the current mode).
+
+        Type hints:
+          :type device_path: str
+          :type count: int | None
+        """
+        self.device_path = device_path
+        if count is None:
+            num_values = SysfsAttribute(os.path.join(device_path, "num_values"))
+            count = num_values.read_int()
+            num_values.close()
+        self._fds = [os.open(os.path.join(device_path, "value{}".format(k)), os.O_RDONLY) for k in range(count)]
+        self.values = array.array("l", [0]) * count
+
+    @staticmethod
+    def for_device(device, count=None):
+        """
+        Makes a SensorValues for an ev3dev device object.  Returns None if the device has no sysfs folder (for
+        example a simulated device), so callers can fall back to the normal properties.
+
+        Type hints:
+          :rtype: SensorValues | None
+        """
+        device_path = getattr(device, "_path", None)
+        if not device_path or not os.path.isdir(device_path):
+            return None
+        return SensorValues(device_path, count)
+
+    def read(self):
+        """
+        Reads every value attribute and returns the array (the same array each time, so copy it to keep it).
+
+        Type hints:
+          :rtype: array.array
+        """
+        values = self.values
+        pread = os.pread
+        k = 0
+        for fd in self._fds:
+            values[k] = int(pread(fd, _READ_SIZE, 0))
+            k += 1
+        return values
+
+    def close(self):
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
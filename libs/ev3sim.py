@@ -0,0 +1,1093 @@
+"""
+  A simulated EV3, so robot_controller and the sandbox programs can run on a computer without a robot (for
+  benchmarks, for checking that a change didn't break a control loop, or just to try something out).
+
+  It has the parts of the ev3dev.ev3 module that this repository uses: motors that speed up, slow down and move to
+  positions like the real ones, a color sensor that looks at a floor with tape on it, an IR sensor that sees beacons
+  and remote buttons, a Pixy that sees a moving target, a touch sensor that is pressed when the arm is all the way
+  up, and the buttons, LEDs, sound and screen.  The robot drives around in WORLD (see World) as the motors turn.
+
+  To use it with robot_controller set the EV3_BACKEND environment variable:
+    EV3_BACKEND=sim PYTHONPATH=libs python3 my_program.py
+
+  To run any program (even one that does import ev3dev.ev3 itself) with it:
+    PYTHONPATH=libs python3 -m ev3sim sandbox/src/motors/m1_drive_timed.py
+    PYTHONPATH=libs python3 -m ev3sim --time-scale 10 sandbox/src/motors/m1_drive_timed.py
+
+  The time scale makes the simulation (and time.sleep, time.monotonic and time.time) run that many times faster
+  than real time.  Time scale 0 is stepped time: time only moves forward when the program sleeps, so every run does
+  exactly the same thing, as fast as the computer can go.  Stepped time only works for programs that use one thread
+  (a background thread that sleeps would move the clock for everybody).  The EV3_SIM_TIME_SCALE environment
+  variable sets the time scale for EV3_BACKEND=sim.
+
+  Example (in a benchmark or a test):
+    import ev3sim
+    world = ev3sim.install(time_scale=0)
+    world.place_robot(0, 0, 90)
+    world.beacons[1] = (30, 40)
+    import robot_controller
+    robot = robot_controller.Snatch3r()
+    robot.drive_inches(12, 400)
+    print(world.pose())
+"""
+
+import math
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+_real_monotonic = time.monotonic
+_real_sleep = time.sleep
+_real_time = time.time
+
+INPUT_1 = "in1"
+INPUT_2 = "in2"
+INPUT_3 = "in3"
+INPUT_4 = "in4"
+OUTPUT_A = "outA"
+OUTPUT_B = "outB"
+OUTPUT_C = "outC"
+OUTPUT_D = "outD"
+
+COLOR_NOCOLOR = 0
+COLOR_BLACK = 1
+COLOR_BLUE = 2
+COLOR_GREEN = 3
+COLOR_YELLOW = 4
+COLOR_RED = 5
+COLOR_WHITE = 6
+COLOR_BROWN = 7
+
+# What the color sensor reads for each color: (reflected light intensity, (red, green, blue) raw values)
+COLOR_READINGS = {
+    COLOR_NOCOLOR: (0, (0, 0, 0)),
+    COLOR_BLACK: (5, (20, 22, 15)),
+    COLOR_BLUE: (12, (30, 60, 130)),
+    COLOR_GREEN: (14, (40, 120, 45)),
+    COLOR_YELLOW: (58, (290, 250, 60)),
+    COLOR_RED: (45, (260, 45, 30)),
+    COLOR_WHITE: (60, (300, 310, 250)),
+    COLOR_BROWN: (20, (90, 60, 35)),
+}
+
+# The Snatch3r: wheels on B (left) and C (right), arm on A, sensors in front of the middle of the wheels.
+LEFT_MOTOR = OUTPUT_B
+RIGHT_MOTOR = OUTPUT_C
+ARM_MOTOR = OUTPUT_A
+WHEEL_DEGREES_PER_INCH = 90
+WHEEL_BASE = 5.73  # inches
+ARM_TOP = 14.2 * 360  # Arm motor degrees from down to up (the touch sensor is pressed at the top)
+COLOR_SENSOR_AHEAD = 1.5  # inches
+COLOR_SENSOR_SPOT = 0.3  # inches, the radius of the spot the color sensor sees
+IR_SENSOR_AHEAD = 3.0  # inches
+PIXY_AHEAD = 2.0  # inches
+PHYSICS_STEP = 0.002  # seconds
+NOT_FOUND = -128  # The IR-SEEK distance when the beacon can't be seen
+
+
+class SimClock(object):
+    """
+    The simulated time.  With a time_scale it runs time_scale times faster than real time (sleep(1) sleeps
+    1 / time_scale real seconds).  With time_scale 0 it is stepped: sleep only moves the time forward (and every
+    reading of the time moves it forward READ_COST seconds, so loops that wait for the time without sleeping end).
+    """
+
+    READ_COST = 0.00002  # seconds
+
+    def __init__(self, time_scale=1.0):
+        """
+        Type hints:
+          :type time_scale: float
+        """
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self._real_start = _real_monotonic()
+        self._start = self._real_start
+        self._now = self._real_start
+        self._epoch = _real_time() - self._real_start
+
+    @property
+    def stepped(self):
+        return self.time_scale == 0
+
+    def monotonic(self):
+        if self.stepped:
+            with self._lock:
+                self._now += self.READ_COST
+                return self._now
+        return self._start + (_real_monotonic() - self._real_start) * self.time_scale
+
+    def sleep(self, seconds):
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        if self.stepped:
+            with self._lock:
+                self._now += seconds
+        else:
+            _real_sleep(seconds / self.time_scale)
+
+    def time(self):
+        return self._epoch + self.monotonic()
+
+
+class FloorMap(object):
+    """
+    A white floor with tape lines on it, for the color sensor.  Each line is a list of (x, y) points in inches.
+    The segments are kept in a grid of CELL_SIZE squares, so a reading only checks the few segments near the sensor.
+    """
+
+    CELL_SIZE = 2.0  # inches
+
+    def __init__(self, floor_color=COLOR_WHITE):
+        """
+        Type hints:
+          :type floor_color: int
+        """
+        self.floor_color = floor_color
+        self.lines = []
+        self._cells = {}  # (column, row) --> list of segments (x0, y0, dx, dy, length squared, half width, color)
+
+    def add_line(self, points, color=COLOR_BLACK, width=0.75, closed=False):
+        """
+        Adds a line of tape through the points (a loop back to the first point if closed).
+
+        Type hints:
+          :type points: list[(float, float)]
+          :type color: int
+          :type width: float
+          :type closed: bool
+        """
+        points = list(points)
+        if closed:
+            points.append(points[0])
+        self.lines.append(points)
+        reach = width / 2 + 1.0  # Bigger than half the line plus the sensor spot
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            dx = x1 - x0
+            dy = y1 - y0
+            segment = (x0, y0, dx, dy, dx * dx + dy * dy or 1e-12, width / 2, color)
+            for column in range(self._cell(min(x0, x1) - reach), self._cell(max(x0, x1) + reach) + 1):
+                for row in range(self._cell(min(y0, y1) - reach), self._cell(max(y0, y1) + reach) + 1):
+                    self._cells.setdefault((column, row), []).append(segment)
+
+    def under(self, x, y, radius=COLOR_SENSOR_SPOT):
+        """Returns (color, fraction) for the line that covers most of the spot of this radius at (x, y)."""
+        best_color = self.floor_color
+        best_fraction = 0.0
+        for x0, y0, dx, dy, length_squared, half_width, color in self._cells.get((self._cell(x), self._cell(y)), ()):
+            t = max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / length_squared))
+            distance = math.hypot(x - x0 - t * dx, y - y0 - t * dy)
+            fraction = _covered(half_width - distance, radius) - _covered(-half_width - distance, radius)
+            if fraction > best_fraction:
+                best_color = color
+                best_fraction = fraction
+        return best_color, best_fraction
+
+    def reflected_light(self, x, y, radius=COLOR_SENSOR_SPOT):
+        color, fraction = self.under(x, y, radius)
+        floor = COLOR_READINGS[self.floor_color][0]
+        return floor + (COLOR_READINGS[color][0] - floor) * fraction
+
+    def color(self, x, y, radius=COLOR_SENSOR_SPOT):
+        color, fraction = self.under(x, y, radius)
+        return color if fraction >= 0.5 else self.floor_color
+
+    def rgb(self, x, y, radius=COLOR_SENSOR_SPOT):
+        color, fraction = self.under(x, y, radius)
+        floor = COLOR_READINGS[self.floor_color][1]
+        return tuple(f + (c - f) * fraction for f, c in zip(floor, COLOR_READINGS[color][1]))
+
+    def _cell(self, coordinate):
+        return int(math.floor(coordinate / self.CELL_SIZE))
+
+    @staticmethod
+    def peanut_track(radius=10.0, waist=0.3, points=600, width=0.75):
+        """
+        Returns a floor with a peanut shaped loop of black tape around (0, 0), so there are left AND right turns.
+        It starts at (radius * (1 + waist), 0) and goes counterclockwise.  The default one is about 68 inches long.
+        """
+        floor_map = FloorMap()
+        track = []
+        for k in range(points):
+            angle = 2 * math.pi * k / points
+            r = radius * (1 + waist * math.cos(2 * angle))
+            track.append((r * math.cos(angle), r * math.sin(angle)))
+        floor_map.add_line(track, COLOR_BLACK, width, closed=True)
+        return floor_map
+
+
+def _covered(edge, radius):
+    """The fraction of a circle that is on the near side of a straight edge this far from its middle."""
+    if edge <= -radius:
+        return 0.0
+    if edge >= radius:
+        return 1.0
+    cap = radius * radius * math.acos(edge / radius) - edge * math.sqrt(radius * radius - edge * edge)
+    return 1.0 - cap / (math.pi * radius * radius)
+
+
+class _MotorState(object):
+    """The physics of one motor (position is in degrees, velocity in degrees per second)."""
+
+    def __init__(self, max_speed, acceleration, low_limit=None, high_limit=None):
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.low_limit = low_limit
+        self.high_limit = high_limit
+        self.reset()
+
+    def reset(self):
+        self.velocity = 0.0
+        self.angle = 0.0  # Where the motor really is
+        self.offset = 0.0  # position is angle + offset (setting position changes the offset)
+        self.speed = 0.0  # The commanded speed
+        self.target = None  # The angle to stop at (run_to_*_pos)
+        self.end_time = None  # When to stop (run_timed)
+        self.stop_action = "coast"
+        self.running = False
+        self.holding = False
+        self.stalled = False
+
+    def moving(self):
+        return self.running or self.velocity != 0.0
+
+    def state(self):
+        state = []
+        if self.running:
+            state.append(Motor.STATE_RUNNING)
+        if self.holding:
+            state.append(Motor.STATE_HOLDING)
+        if self.stalled:
+            state.append(Motor.STATE_STALLED)
+        return state
+
+    def run(self, speed, target=None, end_time=None):
+        self.speed = max(-self.max_speed, min(self.max_speed, speed))
+        self.target = target
+        self.end_time = end_time
+        self.running = True
+        self.holding = False
+
+    def stop(self, stop_action):
+        self.stop_action = stop_action
+        self.speed = 0.0
+        self.target = None
+        self.end_time = None
+        self.running = False
+        self.holding = stop_action == Motor.STOP_ACTION_HOLD
+
+    def step(self, dt, now):
+        if self.end_time is not None and now >= self.end_time:
+            self.stop(self.stop_action)
+        acceleration = self.acceleration
+        wanted = self.speed if self.running else 0.0
+        if self.target is not None:
+            remaining = self.target - self.angle
+            if abs(remaining) < 1 and abs(self.velocity) < 40:
+                self.angle = self.target
+                self.velocity = 0.0
+                self.stop(self.stop_action)
+                return
+            wanted = math.copysign(min(abs(self.speed), math.sqrt(2 * acceleration * abs(remaining))), remaining)
+        elif not self.running and self.stop_action == Motor.STOP_ACTION_COAST:
+            acceleration /= 4  # Coasting slows down more gently than braking
+        change = max(-acceleration * dt, min(acceleration * dt, wanted - self.velocity))
+        self.velocity += change
+        self.angle += self.velocity * dt
+        self.stalled = False
+        if self.high_limit is not None and self.angle > self.high_limit:
+            self.angle = self.high_limit
+            self.velocity = 0.0
+            self.stalled = self.running
+        elif self.low_limit is not None and self.angle < self.low_limit:
+            self.angle = self.low_limit
+            self.velocity = 0.0
+            self.stalled = self.running
+
+
+class World(object):
+    """
+    Everything the simulated devices see: the robot pose (x and y in inches, heading in degrees counterclockwise
+    from the x axis), the floor, the IR beacons (channel --> (x, y)), the Pixy target ((x, y), or a function of the
+    time that returns (x, y)), obstacles for the IR proximity ((x, y, radius)), and the pressed buttons.  The
+    devices also leave things here: the LED colors, the sounds played, and the number of screen updates.
+
+    The robot moves (in PHYSICS_STEP steps) whenever a device is used, so nothing runs in the background.
+    Sensor readings get a little noise, set noise to 0 to turn it off.
+    """
+
+    def __init__(self, clock=None, seed=1):
+        """
+        Type hints:
+          :type clock: SimClock | None
+          :type seed: int
+        """
+        self.clock = clock or SimClock()
+        self.seed = seed
+        self._lock = threading.RLock()
+        self._motors = {}  # address --> _MotorState
+        self.reset()
+
+    def reset(self):
+        """Puts the robot back at (0, 0) facing along the x axis and clears everything else."""
+        with self._lock:
+            self.x = 0.0
+            self.y = 0.0
+            self.heading = 0.0  # radians
+            self.distance_driven = 0.0  # inches
+            self.floor = FloorMap.peanut_track()
+            self.beacons = {}
+            self.pixy_target = None
+            self.obstacles = []
+            self.remote_buttons = {channel: set() for channel in range(1, 5)}
+            self.brick_buttons = set()
+            self.touch_pressed = False  # Presses the touch sensor (the arm at the top presses it too)
+            self.ambient_light = 10
+            self.noise = 1.0
+            self.random = random.Random(self.seed)
+            self.leds = {}
+            self.sounds = []
+            self.screen_updates = 0
+            for motor in self._motors.values():
+                motor.reset()
+            self._last_time = None
+
+    def place_robot(self, x, y, heading=0.0):
+        """Moves the robot (the middle of the wheels) to (x, y) facing heading degrees counterclockwise."""
+        with self._lock:
+            self.update()
+            self.x = x
+            self.y = y
+            self.heading = math.radians(heading)
+
+    def pose(self):
+        """Returns (x, y, heading in degrees between -180 and 180)."""
+        with self._lock:
+            self.update()
+            return self.x, self.y, (math.degrees(self.heading) + 180) % 360 - 180
+
+    def sensor_position(self, ahead):
+        """Returns (x, y) of a point this many inches in front of the middle of the wheels."""
+        return self.x + ahead * math.cos(self.heading), self.y + ahead * math.sin(self.heading)
+
+    def motor(self, address, max_speed, acceleration):
+        """Returns the physics of the motor on this port (every Motor object on a port shares it)."""
+        with self._lock:
+            if address not in self._motors:
+                if address == ARM_MOTOR:
+                    self._motors[address] = _MotorState(max_speed, acceleration, -20, ARM_TOP)
+                else:
+                    self._motors[address] = _MotorState(max_speed, acceleration)
+            return self._motors[address]
+
+    def update(self):
+        """Moves the motors and the robot forward to the current time."""
+        with self._lock:
+            now = self.clock.monotonic()
+            if self._last_time is None or not any(motor.moving() for motor in self._motors.values()):
+                self._last_time = now
+                return
+            elapsed = now - self._last_time
+            if elapsed <= 0:
+                return
+            steps = int(math.ceil(elapsed / PHYSICS_STEP))
+            dt = elapsed / steps
+            motors = list(self._motors.values())
+            left = self._motors.get(LEFT_MOTOR)
+            right = self._motors.get(RIGHT_MOTOR)
+            t = self._last_time
+            for k in range(steps):
+                t += dt
+                for motor in motors:
+                    motor.step(dt, t)
+                left_inches = left.velocity * dt / WHEEL_DEGREES_PER_INCH if left else 0.0
+                right_inches = right.velocity * dt / WHEEL_DEGREES_PER_INCH if right else 0.0
+                forward = (left_inches + right_inches) / 2
+                # The left wheel forward and the right one back (like turn_degrees(positive)) turns clockwise.
+                self.heading += (right_inches - left_inches) / WHEEL_BASE
+                self.x += forward * math.cos(self.heading)
+                self.y += forward * math.sin(self.heading)
+                self.distance_driven += abs(forward)
+            self._last_time = now
+
+    def sensor_values(self, driver_name, mode):
+        """Returns the list of values a sensor with this driver shows in this mode."""
+        with self._lock:
+            self.update()
+            if driver_name == TouchSensor._DRIVER_NAME:
+                return self._touch_values()
+            if driver_name == ColorSensor._DRIVER_NAME:
+                return self._color_values(mode)
+            if driver_name == InfraredSensor._DRIVER_NAME:
+                return self._infrared_values(mode)
+            if driver_name == "pixy-lego":
+                return self._pixy_values(mode)
+            return [0]
+
+    def _touch_values(self):
+        arm = self._motors.get(ARM_MOTOR)
+        return [int(self.touch_pressed or (arm is not None and arm.angle >= ARM_TOP - 5))]
+
+    def _color_values(self, mode):
+        x, y = self.sensor_position(COLOR_SENSOR_AHEAD)
+        if mode == ColorSensor.MODE_COL_COLOR:
+            return [self.floor.color(x, y)]
+        if mode == ColorSensor.MODE_COL_AMBIENT:
+            return [self.ambient_light]
+        if mode == ColorSensor.MODE_RGB_RAW:
+            return [int(round(value + self.random.gauss(0, 2 * self.noise))) for value in self.floor.rgb(x, y)]
+        intensity = self.floor.reflected_light(x, y) + self.random.gauss(0, 0.5 * self.noise)
+        return [max(0, min(100, int(round(intensity))))]
+
+    def _infrared_values(self, mode):
+        if mode == InfraredSensor.MODE_IR_SEEK:
+            values = []
+            for channel in range(1, 5):
+                values.extend(self._beacon_heading_and_distance(channel))
+            return values
+        if mode == InfraredSensor.MODE_IR_REMOTE:
+            return [_REMOTE_CODES.get(frozenset(self.remote_buttons[channel]), 0) for channel in range(1, 5)]
+        return [self._proximity()]
+
+    def _beacon_heading_and_distance(self, channel):
+        """The IR-SEEK values: heading -25 to 25 (3 degrees per unit), distance 0 to 100 (0.8 inches per unit)."""
+        if channel not in self.beacons:
+            return [0, NOT_FOUND]
+        beacon_x, beacon_y = self.beacons[channel]
+        x, y = self.sensor_position(IR_SENSOR_AHEAD)
+        angle = _angle_to(x, y, self.heading, beacon_x, beacon_y)
+        distance = math.hypot(beacon_x - x, beacon_y - y) / 0.8
+        if abs(angle) > 75 or distance > 100:
+            return [0, NOT_FOUND]
+        # A positive heading means the beacon is to the right (clockwise).
+        heading = -angle / 3 + self.random.uniform(-0.7, 0.7) * self.noise
+        distance += self.random.uniform(-0.7, 0.7) * self.noise
+        return [max(-25, min(25, int(round(heading)))), max(0, int(round(distance)))]
+
+    def _proximity(self):
+        """0 to 100 (about 0.275 inches per unit) to the nearest obstacle within 20 degrees of straight ahead."""
+        x, y = self.sensor_position(IR_SENSOR_AHEAD)
+        nearest = 100
+        for obstacle_x, obstacle_y, radius in self.obstacles:
+            if abs(_angle_to(x, y, self.heading, obstacle_x, obstacle_y)) <= 20:
+                distance = max(0.0, math.hypot(obstacle_x - x, obstacle_y - y) - radius)
+                nearest = min(nearest, int(distance / 0.275 + self.random.uniform(-1, 1) * self.noise))
+        return max(0, nearest)
+
+    def _pixy_values(self, mode):
+        """SIG1 (and ALL) values: count, x (0 to 319), y (0 to 199), width, height.  The target is 4 inches big."""
+        target = self.pixy_target
+        if callable(target):
+            target = target(self.clock.monotonic())
+        if target is None:
+            return [0, 0, 0, 0, 0]
+        x, y = self.sensor_position(PIXY_AHEAD)
+        angle = _angle_to(x, y, self.heading, target[0], target[1])
+        distance = math.hypot(target[0] - x, target[1] - y)
+        if abs(angle) > 37.5 or distance < 2 or distance > 80:
+            return [0, 0, 0, 0, 0]
+        size = int(math.degrees(2 * math.atan(2 / distance)) * 320 / 75)
+        pixy_x = 160 - angle * 320 / 75 + self.random.gauss(0, 1.5 * self.noise)
+        return [1, max(0, min(319, int(round(pixy_x)))), 100, size, size]
+
+
+def _angle_to(x, y, heading, target_x, target_y):
+    """Degrees from the heading (radians) to the target, counterclockwise, between -180 and 180."""
+    angle = math.degrees(math.atan2(target_y - y, target_x - x) - heading)
+    return (angle + 180) % 360 - 180
+
+
+# RemoteControl button codes (IR-REMOTE values) for each set of pressed buttons.
+_REMOTE_CODES = {
+    frozenset(["red_up"]): 1,
+    frozenset(["red_down"]): 2,
+    frozenset(["blue_up"]): 3,
+    frozenset(["blue_down"]): 4,
+    frozenset(["red_up", "blue_up"]): 5,
+    frozenset(["red_up", "blue_down"]): 6,
+    frozenset(["red_down", "blue_up"]): 7,
+    frozenset(["red_down", "blue_down"]): 8,
+    frozenset(["beacon"]): 9,
+    frozenset(["red_up", "red_down"]): 10,
+    frozenset(["blue_up", "blue_down"]): 11,
+}
+_REMOTE_BUTTONS = {code: sorted(buttons) for buttons, code in _REMOTE_CODES.items()}
+
+WORLD = World()
+
+
+class Motor(object):
+    """Like ev3dev.ev3.Motor.  Commands take the same keyword arguments (speed_sp, position_sp, time_sp, ...)."""
+
+    COMMAND_RUN_FOREVER = "run-forever"
+    COMMAND_RUN_TO_ABS_POS = "run-to-abs-pos"
+    COMMAND_RUN_TO_REL_POS = "run-to-rel-pos"
+    COMMAND_RUN_TIMED = "run-timed"
+    COMMAND_STOP = "stop"
+    COMMAND_RESET = "reset"
+    STATE_RUNNING = "running"
+    STATE_RAMPING = "ramping"
+    STATE_HOLDING = "holding"
+    STATE_OVERLOADED = "overloaded"
+    STATE_STALLED = "stalled"
+    STOP_ACTION_COAST = "coast"
+    STOP_ACTION_BRAKE = "brake"
+    STOP_ACTION_HOLD = "hold"
+
+    _DRIVER_NAME = "lego-ev3-l-motor"
+    _DEFAULT_ADDRESS = OUTPUT_B
+    _MAX_SPEED = 1050
+    _ACCELERATION = 6000  # degrees per second per second
+
+    def __init__(self, address=None, **kwargs):
+        """
+        Type hints:
+          :type address: str | None
+        """
+        self.address = address or self._DEFAULT_ADDRESS
+        self.driver_name = self._DRIVER_NAME
+        self.connected = True
+        self._path = None  # No sysfs folder, so ev3_sysfs falls back to the properties
+        self._motor = WORLD.motor(self.address, self._MAX_SPEED, self._ACCELERATION)
+        self.commands = [self.COMMAND_RUN_FOREVER, self.COMMAND_RUN_TO_ABS_POS, self.COMMAND_RUN_TO_REL_POS,
+                         self.COMMAND_RUN_TIMED, self.COMMAND_STOP, self.COMMAND_RESET]
+        self.stop_actions = [self.STOP_ACTION_COAST, self.STOP_ACTION_BRAKE, self.STOP_ACTION_HOLD]
+        self.count_per_rot = 360
+        self.max_speed = self._MAX_SPEED
+        self.speed_sp = 0
+        self.position_sp = 0
+        self.time_sp = 0
+        self.duty_cycle_sp = 0
+        self.ramp_up_sp = 0
+        self.ramp_down_sp = 0
+        self.stop_action = self.STOP_ACTION_COAST
+
+    @property
+    def position(self):
+        WORLD.update()
+        return int(round(self._motor.angle + self._motor.offset))
+
+    @position.setter
+    def position(self, value):
+        with WORLD._lock:
+            WORLD.update()
+            self._motor.offset = value - self._motor.angle
+
+    @property
+    def speed(self):
+        WORLD.update()
+        return int(round(self._motor.velocity))
+
+    @property
+    def state(self):
+        WORLD.update()
+        return self._motor.state()
+
+    @property
+    def is_running(self):
+        return self.STATE_RUNNING in self.state
+
+    @property
+    def is_stalled(self):
+        return self.STATE_STALLED in self.state
+
+    @property
+    def command(self):
+        raise AttributeError("command is write only")
+
+    @command.setter
+    def command(self, command):
+        with WORLD._lock:
+            WORLD.update()
+            motor = self._motor
+            motor.stop_action = self.stop_action
+            if command == self.COMMAND_RUN_FOREVER:
+                motor.run(self.speed_sp)
+            elif command == self.COMMAND_RUN_TO_ABS_POS:
+                motor.run(abs(self.speed_sp), target=self.position_sp - motor.offset)
+            elif command == self.COMMAND_RUN_TO_REL_POS:
+                motor.run(abs(self.speed_sp), target=motor.angle + self.position_sp)
+            elif command == self.COMMAND_RUN_TIMED:
+                motor.run(self.speed_sp, end_time=WORLD.clock.monotonic() + self.time_sp / 1000)
+            elif command == self.COMMAND_STOP:
+                motor.stop(self.stop_action)
+            elif command == self.COMMAND_RESET:
+                motor.stop(self.STOP_ACTION_COAST)
+                motor.offset = -motor.angle
+                self.speed_sp = self.position_sp = self.time_sp = 0
+            else:
+                raise ValueError("Unknown motor command: {}".format(command))
+
+    def _run(self, command, kwargs):
+        for name in kwargs:
+            setattr(self, name, kwargs[name])
+        self.command = command
+
+    def run_forever(self, **kwargs):
+        self._run(self.COMMAND_RUN_FOREVER, kwargs)
+
+    def run_to_abs_pos(self, **kwargs):
+        self._run(self.COMMAND_RUN_TO_ABS_POS, kwargs)
+
+    def run_to_rel_pos(self, **kwargs):
+        self._run(self.COMMAND_RUN_TO_REL_POS, kwargs)
+
+    def run_timed(self, **kwargs):
+        self._run(self.COMMAND_RUN_TIMED, kwargs)
+
+    def stop(self, **kwargs):
+        self._run(self.COMMAND_STOP, kwargs)
+
+    def reset(self, **kwargs):
+        self._run(self.COMMAND_RESET, kwargs)
+
+    def wait(self, cond, timeout=None):
+        """Waits (checking every 10 ms) until cond(state) is True.  Returns False if timeout milliseconds pass."""
+        clock = WORLD.clock
+        end_time = None if timeout is None else clock.monotonic() + timeout / 1000
+        while not cond(self.state):
+            if end_time is not None and clock.monotonic() >= end_time:
+                return False
+            clock.sleep(0.01)
+        return True
+
+    def wait_until_not_moving(self, timeout=None):
+        return self.wait(lambda state: self.STATE_RUNNING not in state or self.STATE_STALLED in state, timeout)
+
+    def wait_until(self, s, timeout=None):
+        return self.wait(lambda state: s in state, timeout)
+
+    def wait_while(self, s, timeout=None):
+        return self.wait(lambda state: s not in state, timeout)
+
+
+class LargeMotor(Motor):
+    _DRIVER_NAME = "lego-ev3-l-motor"
+    _DEFAULT_ADDRESS = OUTPUT_B
+    _MAX_SPEED = 1050
+    _ACCELERATION = 6000
+
+
+class MediumMotor(Motor):
+    _DRIVER_NAME = "lego-ev3-m-motor"
+    _DEFAULT_ADDRESS = OUTPUT_A
+    _MAX_SPEED = 1560
+    _ACCELERATION = 10000
+
+
+class Sensor(object):
+    """Like ev3dev.ev3.Sensor.  Sensor(driver_name="pixy-lego") is the Pixy camera."""
+
+    _DRIVER_NAME = None
+    _DEFAULT_ADDRESS = INPUT_1
+    _MODES = ["SIG1", "SIG2", "SIG3", "SIG4", "SIG5", "SIG6", "SIG7", "ALL"]
+
+    def __init__(self, address=None, driver_name=None, **kwargs):
+        """
+        Type hints:
+          :type address: str | None
+          :type driver_name: str | None
+        """
+        self.address = address or self._DEFAULT_ADDRESS
+        self.driver_name = driver_name or self._DRIVER_NAME
+        self.connected = True
+        self._path = None  # No sysfs folder, so ev3_sysfs falls back to value(n)
+        self.modes = list(self._MODES)
+        self._mode = self.modes[0]
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode not in self.modes:
+            raise ValueError("{} has no mode {} (the modes are {})".format(type(self).__name__, mode, self.modes))
+        self._mode = mode
+
+    @property
+    def num_values(self):
+        return len(WORLD.sensor_values(self.driver_name, self._mode))
+
+    def value(self, n=0):
+        return WORLD.sensor_values(self.driver_name, self._mode)[n]
+
+
+class TouchSensor(Sensor):
+    _DRIVER_NAME = "lego-ev3-touch"
+    _DEFAULT_ADDRESS = INPUT_1
+    MODE_TOUCH = "TOUCH"
+    _MODES = [MODE_TOUCH]
+
+    @property
+    def is_pressed(self):
+        self.mode = self.MODE_TOUCH
+        return bool(self.value(0))
+
+
+class ColorSensor(Sensor):
+    _DRIVER_NAME = "lego-ev3-color"
+    _DEFAULT_ADDRESS = INPUT_3
+    MODE_COL_REFLECT = "COL-REFLECT"
+    MODE_COL_AMBIENT = "COL-AMBIENT"
+    MODE_COL_COLOR = "COL-COLOR"
+    MODE_RGB_RAW = "RGB-RAW"
+    _MODES = [MODE_COL_REFLECT, MODE_COL_AMBIENT, MODE_COL_COLOR, MODE_RGB_RAW]
+    COLOR_NOCOLOR = COLOR_NOCOLOR
+    COLOR_BLACK = COLOR_BLACK
+    COLOR_BLUE = COLOR_BLUE
+    COLOR_GREEN = COLOR_GREEN
+    COLOR_YELLOW = COLOR_YELLOW
+    COLOR_RED = COLOR_RED
+    COLOR_WHITE = COLOR_WHITE
+    COLOR_BROWN = COLOR_BROWN
+
+    @property
+    def reflected_light_intensity(self):
+        self.mode = self.MODE_COL_REFLECT
+        return self.value(0)
+
+    @property
+    def ambient_light_intensity(self):
+        self.mode = self.MODE_COL_AMBIENT
+        return self.value(0)
+
+    @property
+    def color(self):
+        self.mode = self.MODE_COL_COLOR
+        return self.value(0)
+
+    @property
+    def raw(self):
+        self.mode = self.MODE_RGB_RAW
+        return tuple(WORLD.sensor_values(self.driver_name, self._mode))
+
+
+class InfraredSensor(Sensor):
+    _DRIVER_NAME = "lego-ev3-ir"
+    _DEFAULT_ADDRESS = INPUT_4
+    MODE_IR_PROX = "IR-PROX"
+    MODE_IR_SEEK = "IR-SEEK"
+    MODE_IR_REMOTE = "IR-REMOTE"
+    _MODES = [MODE_IR_PROX, MODE_IR_SEEK, MODE_IR_REMOTE]
+
+    @property
+    def proximity(self):
+        self.mode = self.MODE_IR_PROX
+        return self.value(0)
+
+
+class BeaconSeeker(object):
+    """Like ev3dev.ev3.BeaconSeeker, sees the beacon in WORLD.beacons[channel]."""
+
+    def __init__(self, sensor=None, channel=1):
+        self._sensor = InfraredSensor() if sensor is None else sensor
+        self._channel = max(1, min(4, channel)) - 1
+        self._sensor.mode = InfraredSensor.MODE_IR_SEEK
+
+    @property
+    def heading(self):
+        return self._sensor.value(self._channel * 2)
+
+    @property
+    def distance(self):
+        return self._sensor.value(self._channel * 2 + 1)
+
+    @property
+    def heading_and_distance(self):
+        return self._sensor.value(self._channel * 2), self._sensor.value(self._channel * 2 + 1)
+
+
+class ButtonBase(object):
+    """Like ev3dev.ev3.ButtonBase: process() calls on_<button>(pressed) for every button that changed."""
+
+    on_change = None
+    _state = set()
+
+    def any(self):
+        return bool(self.buttons_pressed)
+
+    def check_buttons(self, buttons=()):
+        return set(self.buttons_pressed) == set(buttons)
+
+    def process(self):
+        new_state = set(self.buttons_pressed)
+        old_state = self._state
+        self._state = new_state
+        state_diff = new_state.symmetric_difference(old_state)
+        for button in state_diff:
+            handler = getattr(self, "on_" + button)
+            if handler is not None:
+                handler(button in new_state)
+        if self.on_change is not None and state_diff:
+            self.on_change([(button, button in new_state) for button in state_diff])
+
+    @property
+    def buttons_pressed(self):
+        raise NotImplementedError()
+
+
+class RemoteControl(ButtonBase):
+    """Like ev3dev.ev3.RemoteControl, press its buttons with WORLD.remote_buttons[channel].add("red_up")."""
+
+    on_red_up = None
+    on_red_down = None
+    on_blue_up = None
+    on_blue_down = None
+    on_beacon = None
+
+    def __init__(self, sensor=None, channel=1):
+        self._sensor = InfraredSensor() if sensor is None else sensor
+        self._channel = max(1, min(4, channel)) - 1
+        self._state = set()
+        self._sensor.mode = InfraredSensor.MODE_IR_REMOTE
+
+    @property
+    def connected(self):
+        return self._sensor.connected
+
+    @property
+    def buttons_pressed(self):
+        return _REMOTE_BUTTONS.get(self._sensor.value(self._channel), [])
+
+    @property
+    def red_up(self):
+        return "red_up" in self.buttons_pressed
+
+    @property
+    def red_down(self):
+        return "red_down" in self.buttons_pressed
+
+    @property
+    def blue_up(self):
+        return "blue_up" in self.buttons_pressed
+
+    @property
+    def blue_down(self):
+        return "blue_down" in self.buttons_pressed
+
+    @property
+    def beacon(self):
+        return "beacon" in self.buttons_pressed
+
+
+class Button(ButtonBase):
+    """Like ev3dev.ev3.Button, press its buttons with WORLD.brick_buttons.add("up")."""
+
+    on_up = None
+    on_down = None
+    on_left = None
+    on_right = None
+    on_enter = None
+    on_backspace = None
+    _BUTTONS = ["up", "down", "left", "right", "enter", "backspace"]
+
+    @property
+    def buttons_pressed(self):
+        return [name for name in self._BUTTONS if name in WORLD.brick_buttons]
+
+    @property
+    def up(self):
+        return "up" in WORLD.brick_buttons
+
+    @property
+    def down(self):
+        return "down" in WORLD.brick_buttons
+
+    @property
+    def left(self):
+        return "left" in WORLD.brick_buttons
+
+    @property
+    def right(self):
+        return "right" in WORLD.brick_buttons
+
+    @property
+    def enter(self):
+        return "enter" in WORLD.brick_buttons
+
+    @property
+    def backspace(self):
+        return "backspace" in WORLD.brick_buttons
+
+
+class Leds(object):
+    """Like ev3dev.ev3.Leds, the colors end up in WORLD.leds (group --> (red, green) brightness)."""
+
+    LEFT = ("red_left", "green_left")
+    RIGHT = ("red_right", "green_right")
+    BLACK = (0, 0)
+    RED = (1, 0)
+    GREEN = (0, 1)
+    AMBER = (1, 1)
+    ORANGE = (1, 0.5)
+    YELLOW = (0.1, 1)
+
+    @staticmethod
+    def set_color(group, color, pct=1):
+        WORLD.leds[group] = tuple(brightness * pct for brightness in color)
+
+    @staticmethod
+    def all_off():
+        WORLD.leds[Leds.LEFT] = Leds.BLACK
+        WORLD.leds[Leds.RIGHT] = Leds.BLACK
+
+
+class _SoundProcess(object):
+    """What the Sound methods return, like the subprocess.Popen of the real ones."""
+
+    def __init__(self, seconds):
+        self._end_time = WORLD.clock.monotonic() + seconds
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and WORLD.clock.monotonic() >= self._end_time:
+            self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        delay = self._end_time - WORLD.clock.monotonic()
+        if delay > 0:
+            WORLD.clock.sleep(delay)
+        self.returncode = 0
+        return 0
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+            self._end_time = WORLD.clock.monotonic()
+
+
+class Sound(object):
+    """Like ev3dev.ev3.Sound, but silent.  Every sound is added to WORLD.sounds and takes about as long as it would."""
+
+    @staticmethod
+    def beep(args=""):
+        WORLD.sounds.append(("beep", args))
+        return _SoundProcess(0.1)
+
+    @staticmethod
+    def tone(*args):
+        if len(args) == 1:
+            tones = args[0]  # A list of (frequency, milliseconds, delay milliseconds) tuples
+            seconds = sum((tone[1] + (tone[2] if len(tone) > 2 else 0)) / 1000 for tone in tones)
+        else:
+            tones = [tuple(args)]
+            seconds = args[1] / 1000
+        WORLD.sounds.append(("tone", tones))
+        return _SoundProcess(seconds)
+
+    @staticmethod
+    def play(wav_file):
+        WORLD.sounds.append(("play", wav_file))
+        seconds = 1.0
+        try:
+            import wave
+            with wave.open(wav_file) as wav:
+                seconds = wav.getnframes() / wav.getframerate()
+        except (OSError, EOFError, wave.Error):
+            pass
+        return _SoundProcess(seconds)
+
+    @staticmethod
+    def speak(text, espeak_opts="-a 200 -s 130"):
+        WORLD.sounds.append(("speak", text))
+        return _SoundProcess(0.4 + 0.06 * len(text))
+
+
+class Screen(object):
+    """Like ev3dev.ev3.Screen (178 x 128, black and white), update just counts in WORLD.screen_updates."""
+
+    def __init__(self):
+        from PIL import Image, ImageDraw
+        self._img = Image.new("1", (178, 128), "white")
+        self._draw = ImageDraw.Draw(self._img)
+
+    @property
+    def xres(self):
+        return 178
+
+    @property
+    def yres(self):
+        return 128
+
+    @property
+    def shape(self):
+        return self.xres, self.yres
+
+    @property
+    def draw(self):
+        return self._draw
+
+    @property
+    def image(self):
+        return self._img
+
+    def clear(self):
+        self._draw.rectangle(((0, 0), self.shape), fill="white")
+
+    def update(self):
+        WORLD.screen_updates += 1
+
+
+def install(time_scale=None):
+    """
+    Makes import ev3dev.ev3 import this module, and makes time.sleep, time.monotonic and time.time use the simulated
+    clock (unless the time scale is 1).  If time_scale is None it comes from the EV3_SIM_TIME_SCALE environment
+    variable (1, real time, if that is not set either), and if the simulator is already installed nothing changes
+    (so robot_controller can call install again).  Returns WORLD.
+
+    Type hints:
+      :type time_scale: float | None
+      :rtype: World
+    """
+    module = sys.modules[__name__]
+    if time_scale is None:
+        if sys.modules.get("ev3dev.ev3") is module:
+            return WORLD
+        time_scale = float(os.environ.get("EV3_SIM_TIME_SCALE", "1"))
+    with WORLD._lock:
+        WORLD.update()
+        WORLD.clock = SimClock(time_scale)
+        WORLD._last_time = None
+    package = types.ModuleType("ev3dev")
+    package.__path__ = []
+    package.ev3 = module
+    sys.modules["ev3dev"] = package
+    sys.modules["ev3dev.ev3"] = module
+    if time_scale == 1:
+        time.monotonic = _real_monotonic
+        time.sleep = _real_sleep
+        time.time = _real_time
+    else:
+        time.monotonic = WORLD.clock.monotonic
+        time.sleep = WORLD.clock.sleep
+        time.time = WORLD.clock.time
+    return WORLD
+
+
+def main():
+    """python3 -m ev3sim [--time-scale N] program.py [arguments] runs the program with the simulated EV3."""
+    import runpy
+    import ev3sim
+
+    arguments = sys.argv[1:]
+    time_scale = None
+    if arguments and arguments[0] == "--time-scale":
+        time_scale = float(arguments[1])
+        arguments = arguments[2:]
+    if not arguments:
+        print("Usage: python3 -m ev3sim [--time-scale N] program.py [arguments]")
+        sys.exit(2)
+    os.environ["EV3_BACKEND"] = "sim"
+    ev3sim.install(time_scale)
+    sys.argv = arguments
+    sys.path.insert(0, os.path.dirname(os.path.abspath(arguments[0])))
+    runpy.run_path(arguments[0], run_name="__main__")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+  An event loop for the EV3 buttons and the IR remote control.
+
+  The examples handle button events with a loop like this:
+
+    while dc.running:
+        rc1.process()
+        rc2.process()
+        btn.process()
+        time.sleep(0.01)
+
+  That wakes up 100 times a second even when nobody touches anything, and a press can still wait up to 10 ms before
+  its callback runs.  InputEventLoop does the same job with the same on_red_up style callbacks, but:
+    - The EV3 buttons are a Linux input (evdev) device, so the loop sleeps in select until the kernel says a button
+      changed, then calls btn.process() right away.
+    - The IR remote has no such device (it is read through the IR sensor), so it is still polled, but at an adaptive
+      rate: fast_poll while buttons are being used and slow_poll after idle_after seconds of no changes.
+
+  Example (replacing the loop above):
+
+    input_loop = input_events.InputEventLoop(btn, [rc1, rc2])
+    btn.on_backspace = lambda state: input_loop.stop()
+    input_loop.run()
+
+  The loop can also run inside an asyncio event loop instead of calling run (it uses add_reader and call_later, so
+  nothing needs the async keyword):
+
+    input_loop.attach(asyncio.get_event_loop())
+    asyncio.get_event_loop().run_forever()
+
+  If the button object has no input device files (for example when it is simulated) the button is polled together
+  with the remotes, so the callbacks still work.
+"""
+
+import os
+import select
+import time
+
+
+class InputEventLoop(object):
+    """Calls process() on the EV3 buttons when they change and on the IR remotes at an adaptive polling rate."""
+
+    def __init__(self, button=None, remotes=(), fast_poll=0.01, slow_poll=0.05, idle_after=2.0):
+        """
+        button is an ev3.Button (or None), remotes is a list of ev3.RemoteControl objects.  Times are in seconds.
+
+        Type hints:
+          :type button: ev3.Button
+          :type remotes: list[ev3.RemoteControl]
+          :type fast_poll: float
+          :type slow_poll: float
+          :type idle_after: float
+        """
+        self.button = button
+        self.remotes = list(remotes)
+        self.fast_poll = fast_poll
+        self.slow_poll = slow_poll
+        self.idle_after = idle_after
+        self.running = False
+        self.button_fds = []
+        if button is not None:
+            # python-ev3dev keeps the evdev device files of the buttons open in _file_cache.
+            for device_file in getattr(button, "_file_cache", {}).values():
+                self.button_fds.append(device_file.fileno())
+        self.polled = list(self.remotes)
+        if button is not None and not self.button_fds:
+            self.polled.append(button)
+        self.last_activity = time.monotonic()
+        self.next_poll = self.last_activity
+        self.button_wakeups = 0
+        self.polls = 0
+        self._asyncio_loop = None
+        self._timer = None
+        self._wake_read, self._wake_write = os.pipe()
+
+    def add_remote(self, remote):
+        """
+        Type hints:
+          :type remote: ev3.RemoteControl
+        """
+        self.remotes.append(remote)
+        self.polled.append(remote)
+
+    def poll_interval(self):
+        """Returns the current time between IR remote polls, fast while in use and slow when idle."""
+        if time.monotonic() - self.last_activity < self.idle_after:
+            return self.fast_poll
+        return self.slow_poll
+
+    def process_button(self, readable_fds):
+        """Reads the pending input events (only to empty the devices) and lets the button call its callbacks."""
+        for fd in readable_fds:
+            os.read(fd, 4096)
+        self.button_wakeups += 1
+        self.last_activity = time.monotonic()
+        self.button.process()
+
+    def poll(self):
+        """Calls process() on every polled device and schedules the next poll.  Returns the seconds until then."""
+        for device in self.polled:
+            old_state = device._state
+            device.process()
+            if device._state or device._state != old_state:
+                self.last_activity = time.monotonic()
+        self.polls += 1
+        self.next_poll = time.monotonic() + self.poll_interval()
+        return self.next_poll - time.monotonic()
+
+    def run(self):
+        """Handles input events until stop is called (for example from a button callback)."""
+        self.running = True
+        read_fds = self.button_fds + [self._wake_read]
+        if not self.polled:
+            timeout = None
+        else:
+            timeout = self.poll()
+        while self.running:
+            readable = select.select(read_fds, [], [], timeout)[0]
+            if self._wake_read in readable:
+                os.read(self._wake_read, 64)
+                readable.remove(self._wake_read)
+            if readable:
+                self.process_button(readable)
+            if self.polled:
+                timeout = self.next_poll - time.monotonic()
+                if timeout <= 0:
+                    timeout = self.poll()
+
+    def stop(self):
+        """Makes run return (safe to call from a callback or from another thread) and detaches from asyncio."""
+        self.running = False
+        os.write(self._wake_write, b"x")
+        self.detach()
+
+    def attach(self, asyncio_loop):
+        """
+        Handles the input events inside an asyncio event loop instead of run.
+
+        Type hints:
+          :type asyncio_loop: asyncio.AbstractEventLoop
+        """
+        self._asyncio_loop = asyncio_loop
+        self.running = True
+        for fd in self.button_fds:
+            asyncio_loop.add_reader(fd, self.process_button, [fd])
+        if self.polled:
+            self._on_timer()
+
+    def _on_timer(self):
+        if self._asyncio_loop is not None:
+            self._timer = self._asyncio_loop.call_later(self.poll(), self._on_timer)
+
+    def detach(self):
+        """Stops handling the input events in the asyncio event loop given to attach."""
+        asyncio_loop = self._asyncio_loop
+        if asyncio_loop is None:
+            return
+        self._asyncio_loop = None
+        for fd in self.button_fds:
+            asyncio_loop.remove_reader(fd)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def close(self):
+        self.stop()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
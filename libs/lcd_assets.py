@@ -0,0 +1,356 @@
+"""
+  Fast images for the EV3 screen.  Opening BMP files with PIL and pasting them into ev3.Screen().image is slow on
+  the EV3: every Image.open decodes a file, every paste converts the image, and every lcd.update() converts the
+  whole screen again and writes all of it.
+
+  This module converts all the images in the assets/images folder ONCE into an atlas file (images.atlas next to the
+  images folder) that has every image already in the format of the EV3 screen (1 bit per pixel).  Loading the atlas
+  only reads its index (the file is memory mapped, so an image is only read from the disk when it is used), images
+  are kept in a small cache (the least recently used one is dropped when it is full), and drawing copies the bits
+  straight into the screen memory, with no PIL at all.  The atlas is made again automatically when an image changes.
+
+  Example:
+    import lcd_assets
+
+    lcd = ev3.Screen()
+    atlas = lcd_assets.load_atlas()  # Makes /home/robot/csse120/assets/images.atlas the first time
+    atlas.draw(lcd, "ev3_lego/eyes_neutral")  # Image names are the path in the images folder, without .bmp
+    atlas.draw(lcd, "dice/five", 62, 8)
+    atlas.update(lcd)  # Only needed if the screen is not 1 bit per pixel (then draw pastes into lcd.image)
+
+  When draw writes to the screen memory directly, lcd.image doesn't have the image, so a later lcd.update() (after
+  drawing with PIL) replaces it.  Draw everything on a screen with the atlas, or everything with PIL.
+"""
+
+import collections
+import mmap
+import os
+import struct
+
+IMAGES_FOLDER = "/home/robot/csse120/assets/images"
+
+# The atlas file: a header, an index entry for every image, then the pixels of every image.
+_MAGIC = b"EV3ATLAS"
+_VERSION = 1
+_HEADER = struct.Struct("<8sHHI")  # magic, version, number of images, size of the index in bytes
+_ENTRY = struct.Struct("<HHHI")  # width, height, bytes per row, offset of the pixels (after the name)
+_NAME_LENGTH = struct.Struct("<H")
+
+
+class Sprite(object):
+    """
+    One image in the format of the EV3 screen memory: rows of stride bytes, 1 bit per pixel, the leftmost pixel in
+    the lowest bit, 1 for white (the same as PIL's "1;R" raw mode, which is what ev3.Screen.update writes).
+    """
+
+    def __init__(self, name, width, height, stride, data):
+        """
+        Type hints:
+          :type name: str
+          :type width: int
+          :type height: int
+          :type stride: int
+          :type data: bytes
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.stride = stride
+        self.data = data
+        self._placements = {}  # (x, y, line_length, width, height) --> what blit needs, see _place
+
+    def blit(self, buffer, line_length, x=0, y=0, width=None, height=None):
+        """
+        Copies the image into a screen memory (buffer is a bytearray or the mmap of a framebuffer with rows of
+        line_length bytes, in the same format as the sprite) with its upper left corner at (x, y).  The parts
+        outside width x height pixels (the whole buffer by default) are left out.  Returns (left, top, right, bottom)
+        of the pixels that changed, or None if the image was completely outside.
+
+        The rows the image covers are changed all at once as one big int (a few operations in C instead of a
+        Python loop over the rows).  The shifted image and mask for each position are kept, since images are
+        usually drawn at the same few places.
+
+        Type hints:
+          :type line_length: int
+          :rtype: (int, int, int, int) | None
+        """
+        if width is None:
+            width = line_length * 8
+        if height is None:
+            height = len(buffer) // line_length
+        key = (x, y, line_length, width, height)
+        placement = self._placements.get(key)
+        if placement is None:
+            if len(self._placements) >= 8:
+                self._placements.clear()
+            placement = self._placements[key] = self._place(x, y, line_length, width, height)
+        start, end, keep, source, changed = placement
+        if changed is not None:
+            old = int.from_bytes(buffer[start:end], "little")
+            buffer[start:end] = ((old & keep) | source).to_bytes(end - start, "little")
+        return changed
+
+    def _place(self, x, y, line_length, width, height):
+        """Returns (first byte, end byte, bits to keep, image bits, changed rectangle) for drawing at (x, y)."""
+        first_row = max(0, -y)
+        end_row = min(self.height, height - y)
+        left = max(0, x)
+        right = min(x + self.width, width)
+        if end_row <= first_row or right <= left:
+            return 0, 0, 0, 0, None
+        start = (y + first_row) * line_length
+        end = (y + end_row) * line_length
+        row_mask = ((1 << (right - left)) - 1) << left
+        mask = 0
+        source = 0
+        stride = self.stride
+        for k in range(first_row, end_row):
+            row = int.from_bytes(self.data[k * stride:(k + 1) * stride], "little")
+            row = row << x if x >= 0 else row >> -x
+            shift = (k - first_row) * line_length * 8
+            mask |= row_mask << shift
+            source |= (row & row_mask) << shift
+        keep = ((1 << ((end - start) * 8)) - 1) ^ mask
+        return start, end, keep, source, (left, y + first_row, right, y + end_row)
+
+    @staticmethod
+    def from_image(image, name=""):
+        """Makes a Sprite from a PIL image (for example text drawn with ImageDraw), white where it is bright."""
+        if image.mode != "1":
+            image = image.convert("L").point(lambda value: 255 if value >= 128 else 0, "1")
+        stride = (image.width + 7) // 8
+        return Sprite(name, image.width, image.height, stride, image.tobytes("raw", "1;R", stride))
+
+    def to_image(self):
+        """Returns the image as a PIL image (mode "1"), for pasting into ev3.Screen().image."""
+        from PIL import Image
+        return Image.frombytes("1", (self.width, self.height), self.data, "raw", "1;R", self.stride)
+
+
+class Atlas(object):
+    """
+    The images of an atlas file made by build_atlas.  Only the index is read when it is opened, each image is read
+    (from the memory mapped file) the first time it is used and then kept in a cache of cache_size images.
+    """
+
+    def __init__(self, path, cache_size=32):
+        """
+        Type hints:
+          :type path: str
+          :type cache_size: int
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()  # name --> Sprite, the most recently used last
+        self._needs_update = set()  # ids of the screens that draw pasted into screen.image
+        with open(path, "rb") as atlas_file:
+            self._map = mmap.mmap(atlas_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, index_size = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._map.close()
+            raise ValueError("{} is not an atlas file (or is from another version, delete it)".format(path))
+        self._index = {}  # name --> (width, height, stride, offset)
+        position = _HEADER.size
+        for k in range(count):
+            name_length = _NAME_LENGTH.unpack_from(self._map, position)[0]
+            position += _NAME_LENGTH.size
+            name = self._map[position:position + name_length].decode()
+            position += name_length
+            self._index[name] = _ENTRY.unpack_from(self._map, position)
+            position += _ENTRY.size
+
+    def names(self):
+        return sorted(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def sprite(self, name):
+        """
+        Returns the Sprite for an image name (like "dice/five"), from the cache if it is there.
+
+        Type hints:
+          :type name: str
+          :rtype: Sprite
+        """
+        sprite = self._cache.get(name)
+        if sprite is not None:
+            self._cache.move_to_end(name)
+            self.hits += 1
+            return sprite
+        if name not in self._index:
+            raise KeyError("No image named {} in {} (the names are like {})".format(
+                name, self.path, ", ".join(self.names()[:3])))
+        width, height, stride, offset = self._index[name]
+        sprite = Sprite(name, width, height, stride, self._map[offset:offset + height * stride])
+        self.misses += 1
+        self._cache[name] = sprite
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return sprite
+
+    def draw(self, screen, name, x=0, y=0):
+        """
+        Draws an image on an ev3.Screen with its upper left corner at (x, y).  On a 1 bit per pixel screen (the
+        EV3) it goes straight into the screen memory and shows right away.  Otherwise it is pasted into screen.image
+        and shows after update(screen).
+
+        Type hints:
+          :type screen: ev3.Screen
+          :type name: str
+          :type x: int
+          :type y: int
+        """
+        if not draw(screen, self.sprite(name), x, y):
+            self._needs_update.add(id(screen))
+
+    def update(self, screen):
+        """Calls screen.update() if draw pasted anything into screen.image since the last update."""
+        if id(screen) in self._needs_update:
+            self._needs_update.discard(id(screen))
+            screen.update()
+
+    def close(self):
+        self._cache.clear()
+        self._map.close()
+
+
+def draw(screen, sprite, x=0, y=0):
+    """
+    Draws a Sprite on an ev3.Screen (or an lcd_compositor.ScreenCompositor) with its upper left corner at (x, y).
+    Returns True if it went straight into the screen memory (a 1 bit per pixel screen, like the EV3 one), or False
+    if it only shows after screen.update() (it was pasted into screen.image, or drawn on the compositor).
+
+    Type hints:
+      :type screen: ev3.Screen
+      :type sprite: Sprite
+      :rtype: bool
+    """
+    if hasattr(screen, "draw_sprite"):
+        screen.draw_sprite(sprite, x, y)
+        return False
+    var_info = getattr(screen, "var_info", None)
+    if var_info is not None and var_info.bits_per_pixel == 1 and getattr(screen, "mmap", None) is not None:
+        sprite.blit(screen.mmap, screen.fix_info.line_length, x, y, screen.xres, screen.yres)
+        return True
+    screen.image.paste(sprite.to_image(), (x, y))
+    return False
+
+
+def load_atlas(images_folder=IMAGES_FOLDER, atlas_path=None, cache_size=32):
+    """
+    Returns the Atlas of every image in the images folder.  The atlas file (images_folder + ".atlas" if atlas_path
+    is None) is made (again) first if it doesn't exist or an image is newer than it.
+
+    Type hints:
+      :type images_folder: str
+      :type atlas_path: str | None
+      :type cache_size: int
+      :rtype: Atlas
+    """
+    if atlas_path is None:
+        atlas_path = images_folder.rstrip("/") + ".atlas"
+    try:
+        atlas_time = os.stat(atlas_path).st_mtime
+    except OSError:
+        atlas_time = None
+    if atlas_time is None or any(os.stat(path).st_mtime > atlas_time for name, path in _image_files(images_folder)):
+        build_atlas(images_folder, atlas_path)
+    return Atlas(atlas_path, cache_size)
+
+
+def build_atlas(images_folder, atlas_path):
+    """
+    Converts every .bmp file in the images folder (and the folders in it) and saves them in one atlas file.
+    The name of each image is its path in the images folder without .bmp, like "ev3_lego/eyes_neutral".
+    Colors with a brightness of at least 128 (out of 255) become white, the rest black.
+
+    Type hints:
+      :type images_folder: str
+      :type atlas_path: str
+    """
+    images = []
+    for name, path in _image_files(images_folder):
+        width, height, rows = read_bmp(path)
+        images.append((name.encode(), width, height, rows))
+    index_size = sum(_NAME_LENGTH.size + len(name) + _ENTRY.size for name, width, height, rows in images)
+    offset = _HEADER.size + index_size
+    index = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(images), index_size))
+    pixels = bytearray()
+    for name, width, height, rows in images:
+        stride = (width + 7) // 8
+        index += _NAME_LENGTH.pack(len(name)) + name + _ENTRY.pack(width, height, stride, offset)
+        for row in rows:
+            pixels += row.to_bytes(stride, "little")
+        offset += height * stride
+    temporary_path = atlas_path + ".new"
+    with open(temporary_path, "wb") as atlas_file:
+        atlas_file.write(index + pixels)
+    os.replace(temporary_path, atlas_path)  # So a program opening the atlas never sees half of one
+
+
+def _image_files(images_folder):
+    """Returns a sorted list of (name, path) of the .bmp files in the folder and the folders in it."""
+    image_files = []
+    for folder, folder_names, file_names in os.walk(images_folder):
+        for file_name in file_names:
+            if file_name.lower().endswith(".bmp"):
+                path = os.path.join(folder, file_name)
+                name = os.path.splitext(os.path.relpath(path, images_folder))[0].replace(os.sep, "/")
+                image_files.append((name, path))
+    return sorted(image_files)
+
+
+def read_bmp(path):
+    """
+    Reads an uncompressed BMP file (1, 4, 8, 24 or 32 bits per pixel) without PIL.  Returns (width, height, rows),
+    each row an int with bit k set if pixel k is white (brightness of at least 128).
+
+    Type hints:
+      :type path: str
+      :rtype: (int, int, list of int)
+    """
+    with open(path, "rb") as bmp_file:
+        data = bmp_file.read()
+    if data[:2] != b"BM":
+        raise ValueError("{} is not a BMP file".format(path))
+    pixel_offset = struct.unpack_from("<I", data, 10)[0]
+    header_size, width, height, planes, bits, compression = struct.unpack_from("<IiiHHI", data, 14)
+    if compression not in (0, 3) or bits not in (1, 4, 8, 24, 32):
+        raise ValueError("{} is a compressed or {} bit BMP, save it as an uncompressed BMP".format(path, bits))
+    top_down = height < 0
+    height = abs(height)
+    white = []  # For each palette index, True if the color is white
+    if bits <= 8:
+        colors = struct.unpack_from("<I", data, 46)[0] or 1 << bits
+        palette_start = 14 + header_size
+        for k in range(colors):
+            blue, green, red = data[palette_start + 4 * k:palette_start + 4 * k + 3]
+            white.append(_is_white(red, green, blue))
+    row_size = (width * bits + 31) // 32 * 4
+    rows = []
+    for row in range(height):
+        start = pixel_offset + (row if top_down else height - 1 - row) * row_size
+        line = data[start:start + row_size]
+        value = 0
+        for k in range(width):
+            if bits == 1:
+                pixel_white = white[(line[k >> 3] >> (7 - (k & 7))) & 1]
+            elif bits == 4:
+                pixel_white = white[(line[k >> 1] >> (4 if k % 2 == 0 else 0)) & 15]
+            elif bits == 8:
+                pixel_white = white[line[k]]
+            else:
+                step = bits // 8
+                blue, green, red = line[k * step:k * step + 3]
+                pixel_white = _is_white(red, green, blue)
+            if pixel_white:
+                value |= 1 << k
+        rows.append(value)
+    return width, height, rows
+
+
+def _is_white(red, green, blue):
+    return red * 299 + green * 587 + blue * 114 >= 128000
@@ -0,0 +1,256 @@
+"""
+  Updates the EV3 screen without rewriting all of it every time.  ev3.Screen().update() converts the whole PIL
+  image and writes the whole framebuffer, even when only one die (or one eye) changed, and it does it right away
+  on the thread that called it, however often that is.
+
+  A ScreenCompositor draws into its own copy of the screen (1 bit per pixel, like lcd_assets sprites), remembers
+  which rows were drawn on, and update() only writes the rows that really changed into the memory mapped
+  framebuffer.  The writing is done on a background thread at most max_fps times a second, so update() returns
+  right away: a control loop can call it as often as it likes, and frames that come too fast are merged.
+
+  Example:
+    import lcd_assets
+    import lcd_compositor
+
+    atlas = lcd_assets.load_atlas()
+    lcd = lcd_compositor.ScreenCompositor(max_fps=20)  # Use it instead of ev3.Screen()
+    atlas.draw(lcd, "ev3_lego/eyes_neutral")
+    atlas.draw(lcd, "ev3_lego/progress_bar_50", 0, 100)
+    lcd.update()  # Shows everything drawn since the last update (within 1 / max_fps seconds)
+    ...
+    lcd.close()  # Writes the last frame and stops the background thread
+
+  For testing on a computer use a file as the framebuffer:
+    lcd = lcd_compositor.ScreenCompositor(lcd_compositor.Framebuffer.fake("/tmp/fb0"))
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+import lcd_assets
+
+FRAMEBUFFER_PATH = os.getenv("FRAMEBUFFER", "/dev/fb0")  # The same default as ev3dev
+_FBIOGET_VSCREENINFO = 0x4600
+_FBIOGET_FSCREENINFO = 0x4602
+_VAR_SCREEN_INFO = struct.Struct("=7I")  # xres, yres, xres_virtual, yres_virtual, xoffset, yoffset, bits_per_pixel
+_FIX_SCREEN_INFO = struct.Struct("@16sLIIIIHHHI")  # id, smem_start, smem_len, type, type_aux, visual, ..., line_length
+
+# The 4 bytes of a white and a black pixel on a 32 bits per pixel screen, and the 32 bytes for every 8 pixels.
+_WHITE_XRGB = b"\xff\xff\xff\x00"
+_BLACK_XRGB = b"\x00\x00\x00\x00"
+_XRGB_BYTES = [b"".join(_WHITE_XRGB if byte >> bit & 1 else _BLACK_XRGB for bit in range(8)) for byte in range(256)]
+
+
+class Framebuffer(object):
+    """
+    The memory mapped framebuffer device (like /dev/fb0), or a file that pretends to be one.  The size and format
+    come from the device, or from the arguments for a file.
+    """
+
+    def __init__(self, path=FRAMEBUFFER_PATH, width=None, height=None, line_length=None, bits_per_pixel=None):
+        """
+        Type hints:
+          :type path: str
+          :type width: int | None
+          :type height: int | None
+          :type line_length: int | None
+          :type bits_per_pixel: int | None
+        """
+        self.path = path
+        fd = os.open(path, os.O_RDWR)
+        try:
+            if width is None:
+                var_info = bytearray(160)
+                fcntl.ioctl(fd, _FBIOGET_VSCREENINFO, var_info)
+                fix_info = bytearray(128)
+                fcntl.ioctl(fd, _FBIOGET_FSCREENINFO, fix_info)
+                width, height = _VAR_SCREEN_INFO.unpack_from(var_info)[:2]
+                bits_per_pixel = _VAR_SCREEN_INFO.unpack_from(var_info)[6]
+                line_length = _FIX_SCREEN_INFO.unpack_from(fix_info)[9]
+            self.width = width
+            self.height = height
+            self.line_length = line_length
+            self.bits_per_pixel = bits_per_pixel
+            if bits_per_pixel not in (1, 32):
+                raise ValueError("Only 1 and 32 bits per pixel screens are supported, not {}".format(bits_per_pixel))
+            self.mmap = mmap.mmap(fd, line_length * height)
+        finally:
+            os.close(fd)  # The mmap keeps its own reference to the file
+
+    @staticmethod
+    def fake(path, width=178, height=128, line_length=24, bits_per_pixel=1):
+        """
+        Makes (or clears) a file the size of a framebuffer and returns a Framebuffer for it.  The defaults are the
+        EV3 screen on ev3dev jessie.
+
+        Type hints:
+          :rtype: Framebuffer
+        """
+        with open(path, "wb") as framebuffer_file:
+            framebuffer_file.write(bytes(line_length * height))
+        return Framebuffer(path, width, height, line_length, bits_per_pixel)
+
+    def write_rows(self, first_row, rows):
+        """Writes consecutive rows of 1 bit per pixel data (each one the same length) starting at first_row."""
+        line_length = self.line_length
+        start = first_row * line_length
+        if self.bits_per_pixel == 1:
+            data = b"".join(rows)
+            self.mmap[start:start + len(data)] = data
+        else:
+            row_bytes = self.width * 4
+            for k, row in enumerate(rows):
+                pixels = b"".join([_XRGB_BYTES[byte] for byte in row])
+                self.mmap[start + k * line_length:start + k * line_length + row_bytes] = pixels[:row_bytes]
+
+    def close(self):
+        self.mmap.close()
+
+
+class ScreenCompositor(object):
+    """
+    Draws sprites and PIL images into a copy of the screen, and writes only the changed rows to the framebuffer
+    (see the module docstring).  It has the xres, yres, clear and update of ev3.Screen, so lcd_assets.draw and
+    Atlas.draw work with it too.
+
+    Drawing is safe from any thread.  Things drawn while a frame is being written may show in that frame or the
+    next one.
+    """
+
+    def __init__(self, framebuffer=None, max_fps=30, background=True):
+        """
+        With background=False there is no thread: update() writes right away if the last frame was at least
+        1 / max_fps seconds ago, and otherwise leaves the frame for the next update() (or flush()).
+
+        Type hints:
+          :type framebuffer: Framebuffer | None
+          :type max_fps: float
+          :type background: bool
+        """
+        self.framebuffer = framebuffer or Framebuffer()
+        self.xres = self.framebuffer.width
+        self.yres = self.framebuffer.height
+        self.line_length = (self.xres + 7) // 8
+        if self.framebuffer.bits_per_pixel == 1:
+            self.line_length = self.framebuffer.line_length
+        self.max_fps = max_fps
+        self.frames_written = 0
+        self.frames_merged = 0  # update() calls that were shown by a later frame instead
+        self.rows_written = 0
+        self._back = bytearray(b"\xff" * (self.line_length * self.yres))  # What is drawn (white to start)
+        self._front = None  # What the framebuffer shows (unknown until the first frame)
+        self._dirty = bytearray(b"\x01" * self.yres)  # 1 for every row drawn on since the last frame
+        self._pending = False  # update() was called since the last frame
+        self._last_frame_time = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # One frame written at a time
+        self._wake = threading.Event()
+        self.running = background
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def draw_sprite(self, sprite, x=0, y=0):
+        """
+        Type hints:
+          :type sprite: lcd_assets.Sprite
+        """
+        with self._lock:
+            changed = sprite.blit(self._back, self.line_length, x, y, self.xres, self.yres)
+            if changed is not None:
+                top, bottom = changed[1], changed[3]
+                self._dirty[top:bottom] = b"\x01" * (bottom - top)
+
+    def draw_image(self, image, x=0, y=0):
+        """Draws a PIL image (for example text drawn with ImageDraw) with its upper left corner at (x, y)."""
+        self.draw_sprite(lcd_assets.Sprite.from_image(image), x, y)
+
+    def fill(self, x, y, width, height, white=True):
+        stride = (width + 7) // 8
+        data = (b"\xff" if white else b"\x00") * (stride * height)
+        self.draw_sprite(lcd_assets.Sprite("", width, height, stride, data), x, y)
+
+    def clear(self):
+        self.fill(0, 0, self.xres, self.yres)
+
+    def update(self):
+        """Shows everything drawn so far, within 1 / max_fps seconds.  Never waits for the framebuffer."""
+        with self._lock:
+            if self._pending:
+                self.frames_merged += 1
+            self._pending = True
+        if self._thread is not None:
+            self._wake.set()
+        elif self._last_frame_time is None or time.monotonic() - self._last_frame_time >= 1 / self.max_fps:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending frame now (ignoring max_fps).  Returns the number of rows written."""
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._pending = False
+                changes = self._take_changes()
+            self._last_frame_time = time.monotonic()
+            for first_row, rows in changes:
+                self.framebuffer.write_rows(first_row, rows)
+            count = sum(len(rows) for first_row, rows in changes)
+            self.frames_written += 1
+            self.rows_written += count
+            return count
+
+    def close(self):
+        """Writes the last frame, stops the background thread and closes the framebuffer."""
+        self.running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self.framebuffer.close()
+
+    def _take_changes(self):
+        """Returns [(first row, [row bytes, ...]), ...] for the runs of drawn rows that changed (call with the lock)."""
+        line_length = self.line_length
+        back = self._back
+        front = self._front
+        if front is None:
+            front = self._front = bytearray(len(back))
+            self._dirty[:] = b"\x01" * self.yres  # Write every row the first time
+            changed_rows = range(self.yres)
+        else:
+            changed_rows = []
+            row = self._dirty.find(1)
+            while row >= 0:
+                start = row * line_length
+                if back[start:start + line_length] != front[start:start + line_length]:
+                    changed_rows.append(row)
+                row = self._dirty.find(1, row + 1)
+        self._dirty[:] = bytes(self.yres)
+        changes = []
+        for row in changed_rows:
+            start = row * line_length
+            data = bytes(back[start:start + line_length])
+            front[start:start + line_length] = data
+            if changes and changes[-1][0] + len(changes[-1][1]) == row:
+                changes[-1][1].append(data)
+            else:
+                changes.append((row, [data]))
+        return changes
+
+    def _run(self):
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+            if not self.running:
+                break
+            if self._last_frame_time is not None:
+                delay = self._last_frame_time + 1 / self.max_fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)  # update() calls meanwhile are merged into this frame
+            self.flush()
@@ -0,0 +1,403 @@
+"""
+  Local stand-ins for the MQTT broker, for testing and benchmarking without a network.
+
+  Normally every MqttClient connects to the broker at mosquitto.csse.rose-hulman.edu, so nothing can be tested (or
+  timed) unless that broker is reachable.  This module has two replacements:
+
+  - An in-process broker.  Pass com.LOOPBACK as the broker address and the MqttClient uses a LoopbackClient instead
+    of a real paho client.  Messages never leave the Python process, so the EV3 side and the PC side of a program
+    can run in one process on any computer:
+
+      ev3_client = com.MqttClient(robot_delegate)
+      ev3_client.connect_to_pc(com.LOOPBACK)
+      pc_client = com.MqttClient(pc_delegate)
+      pc_client.connect_to_ev3(com.LOOPBACK)
+
+  - A small TCP broker that speaks enough of MQTT 3.1.1 (QoS 0 and 1, retained messages, + and # wildcards) for real
+    paho clients, for example when the EV3 and PC programs run as separate processes on one computer:
+
+      python3 mqtt_loopback.py              (runs the broker on port 1883 until you press Ctrl-C)
+      mqtt_client.connect_to_pc("localhost")
+
+    The broker only accepts connections from the same computer.  To let a robot on the network connect, run
+    python3 mqtt_loopback.py --all-interfaces (there is no authentication, so anyone on the network can then
+    send messages to your programs).
+
+  Both use the same topic matching rules as a real broker (paho's topic_matches_sub).
+"""
+
+import itertools
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+import paho.mqtt.client as mqtt
+
+
+class LoopbackMessage(object):
+    """Looks like the paho MQTTMessage given to message callbacks (topic, payload, retain)."""
+
+    def __init__(self, topic, payload, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+        self.qos = 0
+
+
+class LoopbackBroker(object):
+    """An in-process publish / subscribe broker.  Every LoopbackClient uses the module level BROKER by default."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []  # list of (client, topic filter)
+        self._retained = {}  # topic --> LoopbackMessage
+
+    def subscribe(self, client, topic_filter):
+        """
+        Type hints:
+          :type client: LoopbackClient
+          :type topic_filter: str
+        """
+        with self._lock:
+            self._subscriptions.append((client, topic_filter))
+            retained = [message for topic, message in self._retained.items()
+                        if mqtt.topic_matches_sub(topic_filter, topic)]
+        for message in retained:
+            client.deliver(message)
+
+    def unsubscribe(self, client, topic_filter=None):
+        """Removes one subscription of the client (or all of them when topic_filter is None)."""
+        with self._lock:
+            self._subscriptions = [(subscriber, subscribed_filter)
+                                   for subscriber, subscribed_filter in self._subscriptions
+                                   if subscriber is not client
+                                   or (topic_filter is not None and subscribed_filter != topic_filter)]
+
+    def publish(self, topic, payload, retain=False):
+        """
+        Delivers the payload to every client with a matching subscription (once per client).
+
+        Type hints:
+          :type topic: str
+          :type payload: bytes
+          :type retain: bool
+        """
+        message = LoopbackMessage(topic, payload)
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = LoopbackMessage(topic, payload, retain=True)
+                else:
+                    self._retained.pop(topic, None)  # An empty retained message clears the topic.
+            subscribers = []
+            for client, topic_filter in self._subscriptions:
+                if client not in subscribers and mqtt.topic_matches_sub(topic_filter, topic):
+                    subscribers.append(client)
+        for client in subscribers:
+            client.deliver(message)
+
+
+BROKER = LoopbackBroker()
+
+
+class LoopbackClient(object):
+    """
+    Has the part of the paho Client interface that MqttClient uses, but talks to a LoopbackBroker.  Like paho, all
+    callbacks run on one background thread that is started by loop_start.
+    """
+
+    def __init__(self, broker=None):
+        """
+        Type hints:
+          :type broker: LoopbackBroker | None
+        """
+        self.broker = broker or BROKER
+        self.on_connect = None
+        self.on_subscribe = None
+        self.on_message = None
+        self._message_callbacks = []  # list of (topic filter, callback)
+        self._inbox = queue.Queue()
+        self._thread = None
+        self._message_ids = itertools.count(1)
+
+    def message_callback_add(self, sub, callback):
+        self._message_callbacks.append((sub, callback))
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        self._inbox.put(lambda: self.on_connect and self.on_connect(self, None, {}, 0))
+        return 0
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is None:
+            return
+        self._inbox.put(None)
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def subscribe(self, topic, qos=0):
+        message_id = next(self._message_ids)
+        self.broker.subscribe(self, topic)
+        self._inbox.put(lambda: self.on_subscribe and self.on_subscribe(self, None, message_id, (0,)))
+        return 0, message_id
+
+    def unsubscribe(self, topic):
+        self.broker.unsubscribe(self, topic)
+        return 0, next(self._message_ids)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if payload is None:
+            payload = b""
+        elif isinstance(payload, str):
+            payload = payload.encode()
+        elif isinstance(payload, (int, float)):
+            payload = str(payload).encode()
+        self.broker.publish(topic, payload, retain)
+        return 0, next(self._message_ids)
+
+    def disconnect(self):
+        self.broker.unsubscribe(self)
+
+    def deliver(self, message):
+        """Called by the broker (on the publisher's thread) to queue a message for this client's loop thread."""
+        self._inbox.put(message)
+
+    def _loop(self):
+        while True:
+            item = self._inbox.get()
+            if item is None:
+                return
+            if callable(item):
+                item()
+                continue
+            handled = False
+            for topic_filter, callback in self._message_callbacks:
+                if mqtt.topic_matches_sub(topic_filter, item.topic):
+                    callback(self, None, item)
+                    handled = True
+            if not handled and self.on_message:
+                self.on_message(self, None, item)
+
+
+# MQTT control packet types (the high 4 bits of the first byte).
+_CONNECT = 1
+_PUBLISH = 3
+_PUBACK = 4
+_SUBSCRIBE = 8
+_UNSUBSCRIBE = 10
+_PINGREQ = 12
+_DISCONNECT = 14
+
+_U16 = struct.Struct("!H")
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True  # So the broker can be restarted right away on the same port
+    daemon_threads = True
+
+
+class TcpBroker(object):
+    """
+    A small MQTT 3.1.1 broker for local testing (QoS 0 and 1 only, no authentication, no persistent sessions).
+    Each connection is handled on its own thread.
+
+    Example:
+      broker = mqtt_loopback.TcpBroker(port=1883).start()
+      ...
+      broker.stop()
+    """
+
+    def __init__(self, host="localhost", port=1883):
+        """
+        Type hints:
+          :type host: str
+          :type port: int
+        """
+        self.host = host
+        self.port = port
+        self._lock = threading.Lock()
+        self._subscriptions = []  # list of (_MqttConnection, topic filter)
+        self._retained = {}  # topic --> payload
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Starts accepting connections on a background thread.  Returns self."""
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                _MqttConnection(broker, self.request).run()
+
+        self._server = _TcpServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def subscribe(self, connection, topic_filter):
+        with self._lock:
+            self._subscriptions.append((connection, topic_filter))
+            retained = [(topic, payload) for topic, payload in self._retained.items()
+                        if mqtt.topic_matches_sub(topic_filter, topic)]
+        for topic, payload in retained:
+            connection.send_publish(topic, payload, retain=True)
+
+    def unsubscribe(self, connection, topic_filter=None):
+        with self._lock:
+            self._subscriptions = [(subscriber, subscribed_filter)
+                                   for subscriber, subscribed_filter in self._subscriptions
+                                   if subscriber is not connection
+                                   or (topic_filter is not None and subscribed_filter != topic_filter)]
+
+    def publish(self, topic, payload, retain=False):
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = payload
+                else:
+                    self._retained.pop(topic, None)
+            subscribers = []
+            for connection, topic_filter in self._subscriptions:
+                if connection not in subscribers and mqtt.topic_matches_sub(topic_filter, topic):
+                    subscribers.append(connection)
+        for connection in subscribers:
+            connection.send_publish(topic, payload)
+
+
+class _MqttConnection(object):
+    """One client connection to the TcpBroker."""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+
+    def run(self):
+        try:
+            while True:
+                packet_type, flags, body = self._read_packet()
+                if packet_type == _CONNECT:
+                    self._send(b"\x20\x02\x00\x00")  # CONNACK, connection accepted
+                elif packet_type == _PUBLISH:
+                    self._handle_publish(flags, body)
+                elif packet_type == _SUBSCRIBE:
+                    self._handle_subscribe(body)
+                elif packet_type == _UNSUBSCRIBE:
+                    self._handle_unsubscribe(body)
+                elif packet_type == _PINGREQ:
+                    self._send(b"\xd0\x00")  # PINGRESP
+                elif packet_type == _DISCONNECT:
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.unsubscribe(self)
+            self.sock.close()
+
+    def send_publish(self, topic, payload, retain=False):
+        topic_bytes = topic.encode()
+        body = _U16.pack(len(topic_bytes)) + topic_bytes + payload
+        try:
+            self._send(bytes([(_PUBLISH << 4) | (1 if retain else 0)]) + _encode_length(len(body)) + body)
+        except OSError:
+            pass  # The connection is closing, its thread cleans up.
+
+    def _handle_publish(self, flags, body):
+        qos = (flags >> 1) & 3
+        topic_length = _U16.unpack_from(body, 0)[0]
+        topic = body[2:2 + topic_length].decode()
+        offset = 2 + topic_length
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            self._send(bytes([_PUBACK << 4, 2]) + packet_id)
+        self.broker.publish(topic, body[offset:], retain=bool(flags & 1))
+
+    def _handle_subscribe(self, body):
+        packet_id = body[0:2]
+        offset = 2
+        topic_filters = []
+        while offset < len(body):
+            topic_length = _U16.unpack_from(body, offset)[0]
+            topic_filters.append(body[offset + 2:offset + 2 + topic_length].decode())
+            offset += 3 + topic_length  # The byte after the topic filter is the requested QoS.
+        granted = bytes(len(topic_filters))  # Always grant QoS 0
+        self._send(b"\x90" + _encode_length(2 + len(granted)) + packet_id + granted)  # SUBACK
+        for topic_filter in topic_filters:
+            self.broker.subscribe(self, topic_filter)
+
+    def _handle_unsubscribe(self, body):
+        packet_id = body[0:2]
+        offset = 2
+        while offset < len(body):
+            topic_length = _U16.unpack_from(body, offset)[0]
+            self.broker.unsubscribe(self, body[offset + 2:offset + 2 + topic_length].decode())
+            offset += 2 + topic_length
+        self._send(b"\xb0\x02" + packet_id)  # UNSUBACK
+
+    def _read_packet(self):
+        first_byte = self._read_exactly(1)[0]
+        length = 0
+        multiplier = 1
+        while True:
+            encoded_byte = self._read_exactly(1)[0]
+            length += (encoded_byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not encoded_byte & 0x80:
+                break
+        return first_byte >> 4, first_byte & 0x0F, self._read_exactly(length)
+
+    def _read_exactly(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed")
+            data += chunk
+        return data
+
+    def _send(self, data):
+        with self._send_lock:
+            self.sock.sendall(data)
+
+
+def _encode_length(length):
+    """MQTT remaining length encoding (7 bits per byte, high bit means more bytes follow)."""
+    encoded = bytearray()
+    while True:
+        encoded_byte = length % 128
+        length //= 128
+        if length:
+            encoded_byte |= 0x80
+        encoded.append(encoded_byte)
+        if not length:
+            return bytes(encoded)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # Only this computer can connect unless --all-interfaces is given (the broker has no authentication).
+    host = "0.0.0.0" if "--all-interfaces" in sys.argv[1:] else "127.0.0.1"
+    tcp_broker = TcpBroker(host=host).start()
+    print("Local MQTT broker running on {} port {}, press Ctrl-C to stop".format(host, tcp_broker.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        tcp_broker.stop()
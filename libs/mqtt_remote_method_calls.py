@@ -38,7 +38,112 @@
   Limitations:
     This communication protocol is only meant for simple methods. It has various limitations.
     - Parameters passed must be simple variable types such as int, str, float
-    - The method called should not return anything (it won't get magically passed back)
+    - The method called should not return anything when using send_message (it won't get magically passed back)
+
+  Getting a value back (remote calls with replies):
+    If you DO want the return value, use call instead of send_message.  It returns a Future right away (so your
+    program does not wait) and the Future gets the return value when the other end replies.
+
+    Code running on the PC:
+      future = mqtt_client.call("get_distance", timeout=5)
+      ...
+      print("The distance is", future.result())  # Waits for the reply (raises an exception if the call failed)
+
+    or, to avoid waiting at all:
+      future.add_done_callback(lambda f: print("The distance is", f.result()))
+
+    Each call has its own id, so you can have many calls waiting for replies at the same time.  If the method on
+    the other end raises an exception the Future raises a RemoteCallError.  If no reply arrives within the timeout
+    the Future raises a concurrent.futures.TimeoutError.  Replies are sent back on the caller's subscription topic.
+
+  Only keeping the newest value (coalescing high rate messages):
+    Some messages are sent faster than the receiver can handle them, like Pixy readings that update a tkinter
+    canvas.  Normally every message is handled in order, so the display falls further and further behind.  If only
+    the newest value matters you can coalesce that method.  Messages for it are then held (only the newest one is
+    kept, older ones are dropped) until your program calls process_coalesced, usually once per GUI tick:
+
+    Code running on the PC:
+      mqtt_client = com.MqttClient(my_delegate)
+      mqtt_client.coalesce("on_rectangle_update")
+      mqtt_client.connect_to_ev3()
+
+      def process_messages():
+          mqtt_client.process_coalesced()  # Calls on_rectangle_update at most once, with the newest values
+          root.after(30, process_messages)
+
+      root.after(30, process_messages)
+      root.mainloop()
+
+    The counters mqtt_client.messages_coalesced and mqtt_client.messages_dropped show how many messages were held
+    and how many were thrown away because a newer one arrived first.
+
+  Sending many small messages (batching):
+    Every send_message is normally its own MQTT publish.  A GUI that sends a command for every key press (or key
+    repeat) sends lots of tiny messages, and each one pays the full MQTT overhead.  After enable_batching, messages
+    sent within a short window are packed into one publish and the other end calls the methods in the same order:
+
+    Code running on the PC:
+      mqtt_client.enable_batching(window=0.005, max_messages=10)
+      mqtt_client.send_message("forward", [300, 300])   # Sent within 5 ms (or when 10 messages are waiting)
+      mqtt_client.send_message("stop", batch=False)     # Sends everything waiting, then this, right now
+      mqtt_client.flush()                                # Sends everything waiting right now
+
+    The receiving end does not need any setup, it understands batches from either codec.
+
+  Which methods can be called (exporting methods):
+    When the MqttClient is constructed it makes a table of the delegate methods that the other end may call.  By
+    default that is every public method (names that don't start with _).  To allow only some methods, either mark
+    them with the @com.exported decorator or pass a list of names:
+
+      class MyDelegate(object):
+          @com.exported
+          def arm_up(self):
+              ...
+
+      mqtt_client = com.MqttClient(my_delegate, methods=["arm_up", "arm_down"])
+
+    Messages for methods that are not in the table, or with the wrong number of parameters, are not called (an
+    error is printed instead).  Methods added to the delegate after the MqttClient was made are not in the table.
+
+  Many robots from one program (fleet mode):
+    A PC program that controls many robots can use one MqttFleetClient instead of one MqttClient per robot.  It
+    uses a single broker connection and routes each message to the delegate for the robot that sent it:
+
+      fleet = com.MqttFleetClient()
+      fleet.add_robot(7, MyDelegate("robot 7"))
+      fleet.add_robot(8, MyDelegate("robot 8"))
+      fleet.connect_to_ev3s()
+      fleet.send_message(7, "arm_up")
+      fleet.broadcast("stop")  # Every robot in the fleet
+
+  Testing without a broker:
+    Pass com.LOOPBACK as the mqtt_broker_ip_address (for example mqtt_client.connect_to_pc(com.LOOPBACK)) to use an
+    in-process broker instead of the real one.  Then the EV3 side and the PC side can run in one program on your
+    computer.  See the mqtt_loopback module for that and for a small local TCP broker.
+
+  Long running delegate methods (dispatch executor):
+    Normally delegate methods run on the MQTT network thread, so while a long method like seek_beacon runs no other
+    message is handled, not even stop.  Give the MqttClient a DispatchExecutor to run methods on worker threads.
+    Methods in the same serial lane still run one at a time in order, and stop/shutdown jump ahead of everything:
+
+    Code running on the EV3:
+      executor = com.DispatchExecutor(serial_lanes={"motors": ["forward", "left", "right", "back"]},
+                                      priority_methods=["stop", "shutdown"])
+      mqtt_client = com.MqttClient(robot, executor=executor)
+      mqtt_client.connect_to_pc()
+
+  Delegates that change tkinter widgets (TkDispatcher):
+    tkinter widgets must only be changed from the thread running root.mainloop(), but delegate methods normally
+    run on the MQTT network thread.  Give the MqttClient a TkDispatcher to run them on the tkinter thread instead,
+    a few milliseconds of them per frame (so the window keeps responding even with hundreds of messages a second).
+    Methods in coalesce_methods only run for the newest message that arrived since the last frame:
+
+    Code running on the PC:
+      root = tkinter.Tk()
+      ...
+      mqtt_client = com.MqttClient(my_delegate, executor=com.TkDispatcher(root, coalesce_methods=["on_pixy"]))
+      mqtt_client.connect_to_ev3()
+      root.mainloop()
 
 
   Also note that messages can go the other way too. For example:
@@ -121,29 +226,912 @@
     mqtt_client.send_message("arm_up")
     mqtt_client.send_message("something_else")
 
+
+  Wire formats (codecs):
+    By default messages are sent as JSON, like {"type": "drive_time", "payload": [600, 1.5]}.  That is easy to read
+    but slow to encode and decode on the EV3.  For high rate messages (drive commands, Pixy readings) both ends can
+    instead use the compact BinaryCodec.  Just give the same codec type to the MqttClient on BOTH ends:
+
+    Code running on the EV3:
+      mqtt_client = com.MqttClient(robot, codec=com.BinaryCodec())
+      mqtt_client.connect_to_pc()
+
+    Code running on the PC:
+      mqtt_client = com.MqttClient(codec=com.BinaryCodec())
+      mqtt_client.connect_to_ev3()
+
+    When a client with a delegate connects it publishes a table of its delegate's method names.  The other end uses
+    that table to send a small method id instead of the full method name string.  Until the table arrives (or for
+    names that are not in it) the method name is sent inline, so nothing is lost while connecting.
+    Note: a JSON client and a binary client can NOT talk to each other.
 """
 
 import json
+import struct
+import zlib
 
 import collections
+import collections.abc
+import concurrent.futures
+import heapq
+import inspect
+import itertools
+import threading
+import time
+import traceback
 import paho.mqtt.client as mqtt
 
 LEGO_NUMBER = 19  # DONE: Set your LEGO_NUMBER
 
+# The max parameters of a delegate method that takes *args.
+_NO_PARAMETER_LIMIT = float("inf")
+_MAX_MISSING_METHODS = 256  # Names remembered as not callable (see MqttClient._add_new_method), then forgotten
+
+# Use this as the mqtt_broker_ip_address to connect to an in-process broker (see the mqtt_loopback module).
+LOOPBACK = "loopback"
+
+# What codecs return from decode.  A Call asks the delegate to run a method (call_id is None when no reply is
+# wanted), a Reply carries the result (or the error message) of an earlier Call back to the caller.
+Call = collections.namedtuple("Call", ["function_name", "parameter_list", "call_id"])
+Reply = collections.namedtuple("Reply", ["call_id", "result", "error"])
+# Several Calls (or Replies) that were sent together in one publish (see MqttClient.enable_batching).
+Batch = collections.namedtuple("Batch", ["messages"])
+
+
+class RemoteCallError(Exception):
+    """Raised by the Future returned from MqttClient.call when the method on the other end failed."""
+
+
+class JsonCodec(object):
+    """
+    The original (default) wire format.  Each call is a JSON dict like {"type": "forward", "payload": [300, 300]}.
+    Easy to read with any MQTT tool, but every message repeats the method name and must be parsed as text.
+    """
+
+    max_batched_length = None  # Messages of any length can be batched
+
+    def encode(self, function_name, parameter_list=None, call_id=None):
+        """
+        Converts a method call into the payload that is published to the broker.
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list | None
+          :type call_id: int | None
+          :rtype: str
+        """
+        message_dict = {"type": function_name}
+        if parameter_list:
+            message_dict["payload"] = parameter_list
+        if call_id is not None:
+            message_dict["id"] = call_id
+        return json.dumps(message_dict)
+
+    def encode_reply(self, call_id, result=None, error=None):
+        """
+        Converts the result (or error message) of a call into a reply payload.
+
+        Type hints:
+          :type call_id: int
+          :type error: str | None
+          :rtype: str
+        """
+        if error is not None:
+            return json.dumps({"reply": call_id, "error": error})
+        return json.dumps({"reply": call_id, "result": result})
+
+    def encode_batch(self, payloads):
+        """
+        Packs several encoded payloads into one payload, like {"batch": [{"type": ...}, {"type": ...}]}.
+
+        Type hints:
+          :type payloads: list of str
+          :rtype: str
+        """
+        return '{"batch": [' + ", ".join(payloads) + ']}'
+
+    def decode(self, payload):
+        """
+        Converts a received payload back into a Call or a Reply.  Raises ValueError if the payload is not a valid
+        message.
+
+        Type hints:
+          :type payload: bytes
+          :rtype: Call | Reply
+        """
+        try:
+            message_dict = json.loads(payload.decode())
+        except ValueError:
+            raise ValueError("Unable to decode the received message as JSON")
+        if isinstance(message_dict, dict) and isinstance(message_dict.get("batch"), list):
+            return Batch([self._from_dict(item) for item in message_dict["batch"]])
+        return self._from_dict(message_dict)
+
+    @staticmethod
+    def _from_dict(message_dict):
+        if isinstance(message_dict, dict) and "reply" in message_dict:
+            return Reply(message_dict["reply"], message_dict.get("result"), message_dict.get("error"))
+        if not isinstance(message_dict, dict) or "type" not in message_dict:
+            raise ValueError("Received a messages without a 'type' parameter.")
+        return Call(message_dict["type"], message_dict.get("payload", []), message_dict.get("id"))
+
+    def handshake(self, method_names):
+        """JSON messages always carry the full method name, so there is nothing to send when connecting."""
+        return None
+
+
+# Binary frame kinds (first byte of every binary payload).
+_FRAME_CALL_BY_ID = 1
+_FRAME_CALL_BY_NAME = 2
+_FRAME_METHOD_TABLE = 3
+_FRAME_REPLY = 4
+_FRAME_BATCH = 5
+_FLAG_CALL_ID = 0x80  # Set on a call frame kind when a call id (for the reply) follows the header.
+
+# Struct layouts used by the BinaryCodec.  Everything is little endian.
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_I32 = struct.Struct("<i")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+_CALL_BY_ID_HEADER = struct.Struct("<BHHB")  # frame kind, table tag, method id, number of arguments
+_TABLE_HEADER = struct.Struct("<BHH")  # frame kind, table tag, number of method names
+_CALL_ID = struct.Struct("<I")
+_REPLY_HEADER = struct.Struct("<BIB")  # frame kind, call id, 1 if the value is an error message (else 0)
+_BATCH_HEADER = struct.Struct("<BH")  # frame kind, number of frames (each one is a 16 bit length then the frame)
+_MAX_LENGTH = 0xFFFF  # Longest str (in bytes), list, dict, batch and batched frame, they are sent as 16 bit lengths
+
+
+class BinaryCodec(object):
+    """
+    Compact wire format for high rate messages.  A call to a known method is a 6 byte header (frame kind, table tag,
+    method id, argument count) followed by the struct packed arguments.  Each argument is a one byte type tag plus
+    its value: None, bool, int (32 or 64 bit), float (64 bit), str, list and dict (with str keys) are supported.
+    Strings can be at most 65535 bytes long (UTF-8) and lists and dicts at most 65535 items, ints must fit in 64 bits.
+    Anything else raises a ValueError (use the JSON codec for bigger values).
+
+    The method id table is owned by the receiver.  When a client connects, its codec publishes the names of the
+    delegate methods it can receive (as a retained message), and the codec on the other end uses it for sending.
+    The table tag (a checksum of the names) is included in every call so a stale table is detected, not misused.
+    You can also give the same list of method_names to the codec on both ends so no table needs to be learned.
+    """
+
+    max_batched_length = _MAX_LENGTH  # Longer messages are published on their own instead of in a batch
+
+    def __init__(self, method_names=None):
+        """
+        Type hints:
+          :type method_names: list of str | None
+        """
+        self.fixed_method_names = list(method_names) if method_names else None
+        self.incoming_method_names = []  # Method id --> name, for frames this end receives.
+        self.incoming_tag = None
+        self.outgoing_method_ids = {}  # Method name --> id, for frames this end sends.
+        self.outgoing_tag = None
+        if self.fixed_method_names:
+            self._set_incoming_table(self.fixed_method_names)
+            self._set_outgoing_table(self.fixed_method_names)
+
+    def encode(self, function_name, parameter_list=None, call_id=None):
+        """
+        Converts a method call into the payload that is published to the broker.
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list | None
+          :type call_id: int | None
+          :rtype: bytes
+        """
+        parameter_list = parameter_list or []
+        if len(parameter_list) > 255:
+            raise ValueError("Too many parameters ({}) for a binary message".format(len(parameter_list)))
+        flags = _FLAG_CALL_ID if call_id is not None else 0
+        parts = []
+        method_id = self.outgoing_method_ids.get(function_name)
+        if method_id is not None:
+            parts.append(_CALL_BY_ID_HEADER.pack(_FRAME_CALL_BY_ID | flags, self.outgoing_tag, method_id,
+                                                 len(parameter_list)))
+        else:
+            name_bytes = function_name.encode()
+            if len(name_bytes) > 255:
+                raise ValueError("The method name {} is too long for a binary message".format(function_name))
+            parts.append(_U8.pack(_FRAME_CALL_BY_NAME | flags))
+            parts.append(_U8.pack(len(name_bytes)))
+            parts.append(name_bytes)
+            parts.append(_U8.pack(len(parameter_list)))
+        if call_id is not None:
+            parts.append(_CALL_ID.pack(call_id))
+        for value in parameter_list:
+            _pack_value(value, parts)
+        return b"".join(parts)
+
+    def encode_reply(self, call_id, result=None, error=None):
+        """
+        Converts the result (or error message) of a call into a reply payload.
+
+        Type hints:
+          :type call_id: int
+          :type error: str | None
+          :rtype: bytes
+        """
+        parts = [_REPLY_HEADER.pack(_FRAME_REPLY, call_id, 0 if error is None else 1)]
+        _pack_value(result if error is None else error, parts)
+        return b"".join(parts)
+
+    def encode_batch(self, payloads):
+        """
+        Packs several encoded payloads into one batch frame.  Raises ValueError if there are more than 65535 payloads
+        or one of them is longer than 65535 bytes.
+
+        Type hints:
+          :type payloads: list of bytes
+          :rtype: bytes
+        """
+        if len(payloads) > _MAX_LENGTH:
+            raise ValueError("Too many messages ({}) for one binary batch".format(len(payloads)))
+        if any(len(payload) > _MAX_LENGTH for payload in payloads):
+            raise ValueError("A message longer than {} bytes can not be put in a binary batch".format(_MAX_LENGTH))
+        parts = [_BATCH_HEADER.pack(_FRAME_BATCH, len(payloads))]
+        for payload in payloads:
+            parts.append(_U16.pack(len(payload)))
+            parts.append(payload)
+        return b"".join(parts)
+
+    def decode(self, payload):
+        """
+        Converts a received payload back into a Call or a Reply.  Method table frames are consumed by the codec
+        itself, in which case None is returned.  Raises ValueError if the payload is not valid.
+
+        Type hints:
+          :type payload: bytes
+          :rtype: Call | Reply | None
+        """
+        try:
+            frame_kind = payload[0] & ~_FLAG_CALL_ID
+            if frame_kind == _FRAME_CALL_BY_ID:
+                unused, tag, method_id, arg_count = _CALL_BY_ID_HEADER.unpack_from(payload, 0)
+                if tag != self.incoming_tag or method_id >= len(self.incoming_method_names):
+                    raise ValueError("Received a method id from a different method table. Restart both programs.")
+                function_name = self.incoming_method_names[method_id]
+                offset = _CALL_BY_ID_HEADER.size
+            elif frame_kind == _FRAME_CALL_BY_NAME:
+                name_length = payload[1]
+                function_name = payload[2:2 + name_length].decode()
+                arg_count = payload[2 + name_length]
+                offset = 3 + name_length
+            elif frame_kind == _FRAME_REPLY:
+                unused, call_id, is_error = _REPLY_HEADER.unpack_from(payload, 0)
+                value, offset = _unpack_value(payload, _REPLY_HEADER.size)
+                if is_error:
+                    return Reply(call_id, None, value)
+                return Reply(call_id, value, None)
+            elif frame_kind == _FRAME_BATCH:
+                count = _BATCH_HEADER.unpack_from(payload, 0)[1]
+                offset = _BATCH_HEADER.size
+                messages = []
+                for k in range(count):
+                    length = _U16.unpack_from(payload, offset)[0]
+                    messages.append(self.decode(payload[offset + 2:offset + 2 + length]))
+                    offset += 2 + length
+                return Batch(messages)
+            elif frame_kind == _FRAME_METHOD_TABLE:
+                self._set_outgoing_table(_unpack_method_table(payload))
+                return None
+            else:
+                raise ValueError("Unknown binary frame kind {}".format(frame_kind))
+            call_id = None
+            if payload[0] & _FLAG_CALL_ID:
+                call_id = _CALL_ID.unpack_from(payload, offset)[0]
+                offset += _CALL_ID.size
+            parameter_list = []
+            for k in range(arg_count):
+                value, offset = _unpack_value(payload, offset)
+                parameter_list.append(value)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            raise ValueError("Unable to decode the received binary message")
+        return Call(function_name, parameter_list, call_id)
+
+    def handshake(self, method_names):
+        """
+        Returns the method table frame that tells the other end which ids to use when calling this end's delegate.
+
+        Type hints:
+          :type method_names: list of str
+          :rtype: bytes | None
+        """
+        names = self.fixed_method_names or sorted(method_names)
+        if not names:
+            return None
+        self._set_incoming_table(names)
+        parts = [_TABLE_HEADER.pack(_FRAME_METHOD_TABLE, self.incoming_tag, len(names))]
+        for name in names:
+            name_bytes = name.encode()
+            parts.append(_U8.pack(len(name_bytes)))
+            parts.append(name_bytes)
+        return b"".join(parts)
+
+    def _set_incoming_table(self, names):
+        self.incoming_method_names = list(names)
+        self.incoming_tag = _method_table_tag(names)
+
+    def _set_outgoing_table(self, names):
+        self.outgoing_method_ids = {name: k for k, name in enumerate(names)}
+        self.outgoing_tag = _method_table_tag(names)
+
+
+def _method_table_tag(names):
+    return zlib.crc32("\n".join(names).encode()) & 0xFFFF
+
+
+def _unpack_method_table(payload):
+    frame_kind, tag, count = _TABLE_HEADER.unpack_from(payload, 0)
+    offset = _TABLE_HEADER.size
+    names = []
+    for k in range(count):
+        name_length = payload[offset]
+        names.append(payload[offset + 1:offset + 1 + name_length].decode())
+        offset += 1 + name_length
+    if _method_table_tag(names) != tag:
+        raise ValueError("Received a corrupt method table")
+    return names
+
+
+def _pack_value(value, parts):
+    """Appends the type tag and struct packed bytes for one argument to the parts list."""
+    if value is None:
+        parts.append(b"N")
+    elif value is True:
+        parts.append(b"T")
+    elif value is False:
+        parts.append(b"F")
+    elif isinstance(value, int):
+        if -0x80000000 <= value <= 0x7FFFFFFF:
+            parts.append(b"i")
+            parts.append(_I32.pack(value))
+        elif not -0x8000000000000000 <= value <= 0x7FFFFFFFFFFFFFFF:
+            raise ValueError("The int {} does not fit in 64 bits for a binary message".format(value))
+        else:
+            parts.append(b"q")
+            parts.append(_I64.pack(value))
+    elif isinstance(value, float):
+        parts.append(b"d")
+        parts.append(_F64.pack(value))
+    elif isinstance(value, str):
+        value_bytes = value.encode()
+        if len(value_bytes) > _MAX_LENGTH:
+            raise ValueError("A str of {} bytes is too long for a binary message".format(len(value_bytes)))
+        parts.append(b"s")
+        parts.append(_U16.pack(len(value_bytes)))
+        parts.append(value_bytes)
+    elif isinstance(value, (list, tuple)):
+        if len(value) > _MAX_LENGTH:
+            raise ValueError("A list of {} items is too long for a binary message".format(len(value)))
+        parts.append(b"l")
+        parts.append(_U16.pack(len(value)))
+        for item in value:
+            _pack_value(item, parts)
+    elif isinstance(value, dict):
+        if len(value) > _MAX_LENGTH:
+            raise ValueError("A dict of {} items is too long for a binary message".format(len(value)))
+        parts.append(b"m")
+        parts.append(_U16.pack(len(value)))
+        for key, item in value.items():
+            _pack_value(str(key), parts)
+            _pack_value(item, parts)
+    else:
+        raise ValueError("Unable to send {} in a binary message (only int, float, str, bool, None, list and dict "
+                         "work)".format(type(value).__name__))
+
+
+def _unpack_value(payload, offset):
+    """Reads one tagged argument starting at offset.  Returns the value and the offset just past it."""
+    tag = payload[offset]
+    offset += 1
+    if tag == 0x69:  # b"i"
+        return _I32.unpack_from(payload, offset)[0], offset + 4
+    if tag == 0x64:  # b"d"
+        return _F64.unpack_from(payload, offset)[0], offset + 8
+    if tag == 0x73:  # b"s"
+        length = _U16.unpack_from(payload, offset)[0]
+        offset += 2
+        return payload[offset:offset + length].decode(), offset + length
+    if tag == 0x4E:  # b"N"
+        return None, offset
+    if tag == 0x54:  # b"T"
+        return True, offset
+    if tag == 0x46:  # b"F"
+        return False, offset
+    if tag == 0x71:  # b"q"
+        return _I64.unpack_from(payload, offset)[0], offset + 8
+    if tag == 0x6C:  # b"l"
+        count = _U16.unpack_from(payload, offset)[0]
+        offset += 2
+        items = []
+        for k in range(count):
+            item, offset = _unpack_value(payload, offset)
+            items.append(item)
+        return items, offset
+    if tag == 0x6D:  # b"m"
+        count = _U16.unpack_from(payload, offset)[0]
+        offset += 2
+        items = {}
+        for k in range(count):
+            key, offset = _unpack_value(payload, offset)
+            items[key], offset = _unpack_value(payload, offset)
+        return items, offset
+    raise ValueError("Unknown binary value tag {}".format(tag))
+
+
+class _Lane(object):
+    """Tasks that must run one at a time, in order.  Methods without a serial lane get a new lane per message."""
+
+    def __init__(self):
+        self.tasks = collections.deque()
+        self.active = False  # True while the lane is waiting in the ready queue or one of its tasks is running.
+
+
+class DispatchExecutor(object):
+    """
+    Runs delegate methods on a small pool of worker threads instead of on the MQTT network thread, so a long method
+    (like seek_beacon or arm_calibration) does not block every message that arrives after it.
+
+      - serial_lanes groups methods that must run one at a time in the order they arrived (like motor commands).
+        Methods that are not in any lane can run at the same time on different workers.
+      - priority_methods (like stop and shutdown) run on their own thread, so they run right away even if every
+        worker is busy.  By default they also cancel the work that is still queued (but not yet running), since
+        it would be unsafe to keep driving after a stop.
+      - At most max_queued messages wait for a worker.  Messages that arrive when the queue is full are rejected.
+
+    Example (code running on the EV3):
+      executor = com.DispatchExecutor(max_workers=2,
+                                      serial_lanes={"motors": ["forward", "left", "right", "back", "drive_inches"]})
+      mqtt_client = com.MqttClient(robot, executor=executor)
+
+    Use the metrics method to see the queue depth and how long messages waited before they started running.
+    """
+
+    def __init__(self, max_workers=2, serial_lanes=None, priority_methods=("stop", "shutdown"), max_queued=100,
+                 cancel_pending_on_priority=True):
+        """
+        Type hints:
+          :type max_workers: int
+          :type serial_lanes: dict of str --> list of str | None
+          :type priority_methods: list of str | tuple of str
+          :type max_queued: int
+          :type cancel_pending_on_priority: bool
+        """
+        self.priority_methods = set(priority_methods)
+        self.max_queued = max_queued
+        self.cancel_pending_on_priority = cancel_pending_on_priority
+
+        self._lanes = {}  # method name --> the _Lane shared by every method in that serial lane
+        for lane_methods in (serial_lanes or {}).values():
+            lane = _Lane()
+            for function_name in lane_methods:
+                self._lanes[function_name] = lane
+
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._priority_ready = threading.Condition(self._lock)
+        self._ready_lanes = collections.deque()
+        self._priority_tasks = collections.deque()
+        self._queued = 0
+        self._shutdown = False
+
+        # Metrics
+        self._max_queued_seen = 0
+        self._dispatched = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+
+        self._threads = [threading.Thread(target=self._run_priority_tasks, daemon=True)]
+        for k in range(max_workers):
+            self._threads.append(threading.Thread(target=self._run_tasks, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, function_name, task, on_cancel=None):
+        """
+        Queues a task (a function with no parameters) that runs the given delegate method.  on_cancel is called
+        instead of the task if it is rejected or cancelled.  Returns False if the task was rejected.
+
+        Type hints:
+          :type function_name: str
+          :type task: callable
+          :type on_cancel: callable | None
+          :rtype: bool
+        """
+        queued_task = (task, on_cancel, time.monotonic())
+        cancelled_tasks = []
+        accepted = True
+        with self._lock:
+            if self._shutdown:
+                accepted = False
+                cancelled_tasks.append(queued_task)
+            elif function_name in self.priority_methods:
+                self._priority_tasks.append(queued_task)
+                if self.cancel_pending_on_priority:
+                    cancelled_tasks = self._remove_queued_tasks()
+                self._priority_ready.notify()
+            elif self._queued >= self.max_queued:
+                self._rejected += 1
+                print("Too many queued messages, dropping {}".format(function_name))
+                accepted = False
+                cancelled_tasks.append(queued_task)
+            else:
+                lane = self._lanes.get(function_name) or _Lane()
+                lane.tasks.append(queued_task)
+                self._queued += 1
+                self._max_queued_seen = max(self._max_queued_seen, self._queued)
+                if not lane.active:
+                    lane.active = True
+                    self._ready_lanes.append(lane)
+                    self._work_ready.notify()
+        for task, on_cancel, queued_time in cancelled_tasks:
+            if on_cancel:
+                on_cancel()
+        return accepted
+
+    def metrics(self):
+        """
+        Returns a dict with the current and maximum queue depth, the number of dispatched, rejected and cancelled
+        messages, and the average and maximum dispatch latency (seconds from arrival until the method started).
+
+        Type hints:
+          :rtype: dict
+        """
+        with self._lock:
+            return {"queue_depth": self._queued,
+                    "max_queue_depth": self._max_queued_seen,
+                    "dispatched": self._dispatched,
+                    "rejected": self._rejected,
+                    "cancelled": self._cancelled,
+                    "average_latency": self._total_latency / self._dispatched if self._dispatched else 0.0,
+                    "max_latency": self._max_latency}
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker threads once the queued tasks are done.  Set wait to False when calling this from a
+        delegate method (which is running on one of the worker threads).
+
+        Type hints:
+          :type wait: bool
+        """
+        with self._lock:
+            self._shutdown = True
+            self._work_ready.notify_all()
+            self._priority_ready.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _remove_queued_tasks(self):
+        """Empties every lane (the lock must be held).  Tasks that are already running are not affected."""
+        removed = []
+        # Serial lanes can have queued tasks while running (so they are not in the ready queue).
+        for lane in set(self._lanes.values()) | set(self._ready_lanes):
+            removed.extend(lane.tasks)
+            lane.tasks.clear()
+        self._cancelled += len(removed)
+        self._queued = 0
+        return removed
+
+    def _record_start(self, queued_time):
+        latency = time.monotonic() - queued_time
+        self._dispatched += 1
+        self._total_latency += latency
+        self._max_latency = max(self._max_latency, latency)
+
+    def _run_tasks(self):
+        while True:
+            with self._lock:
+                while not self._ready_lanes and not self._shutdown:
+                    self._work_ready.wait()
+                if not self._ready_lanes:
+                    return
+                lane = self._ready_lanes.popleft()
+                if not lane.tasks:
+                    lane.active = False  # The lane was emptied by a priority method.
+                    continue
+                task, on_cancel, queued_time = lane.tasks.popleft()
+                self._queued -= 1
+                self._record_start(queued_time)
+            _run_task(task)
+            with self._lock:
+                if lane.tasks:
+                    self._ready_lanes.append(lane)
+                    self._work_ready.notify()
+                else:
+                    lane.active = False
+
+    def _run_priority_tasks(self):
+        while True:
+            with self._lock:
+                while not self._priority_tasks and not self._shutdown:
+                    self._priority_ready.wait()
+                if not self._priority_tasks:
+                    return
+                task, on_cancel, queued_time = self._priority_tasks.popleft()
+                self._record_start(queued_time)
+            _run_task(task)
+
+
+def _run_task(task):
+    try:
+        task()
+    except Exception:
+        traceback.print_exc()
+
+
+class TkDispatcher(object):
+    """
+    An executor for MqttClient that runs delegate methods on the tkinter main loop (the only thread that may change
+    widgets) instead of on the MQTT network thread.
+
+      - Received messages are appended to a deque (appending and popping are thread safe, no lock is needed).
+      - Every interval_ms the main loop runs the queued methods in order, for at most frame_budget seconds (but at
+        least one), so a flood of messages can't freeze the window.  The rest wait for the next frame.
+      - For methods in coalesce_methods only the newest queued message runs, the older ones are dropped (like
+        MqttClient.coalesce, but without having to call process_coalesced).
+      - At most max_queued messages wait.  Messages that arrive when the queue is full are rejected.
+
+    Example (code running on the PC):
+      root = tkinter.Tk()
+      dispatcher = com.TkDispatcher(root, coalesce_methods=["on_rectangle_update"])
+      mqtt_client = com.MqttClient(my_delegate, executor=dispatcher)
+      mqtt_client.connect_to_ev3()
+      root.mainloop()
+
+    Use the metrics method to see the queue depth, the dispatch latency and the longest frame.
+    """
+
+    def __init__(self, root, interval_ms=15, frame_budget=0.008, coalesce_methods=(), max_queued=10000):
+        """
+        Make it on the tkinter thread (before root.mainloop()).
+
+        Type hints:
+          :type root: tkinter.Tk
+          :type interval_ms: int
+          :type frame_budget: float
+          :type coalesce_methods: list of str | tuple of str
+          :type max_queued: int
+        """
+        self.root = root
+        self.interval_ms = interval_ms
+        self.frame_budget = frame_budget
+        self.coalesce_methods = set(coalesce_methods)
+        self.max_queued = max_queued
+        self._tasks = collections.deque()  # (function name, sequence number, task, on_cancel, queued time)
+        self._newest = {}  # coalesced method name --> sequence number of its newest message
+        self._sequence = itertools.count()
+        self._shutdown = False
+
+        # Metrics (only changed on the tkinter thread, except rejected)
+        self._max_queued_seen = 0
+        self._dispatched = 0
+        self._coalesced = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._frames = 0
+        self._total_latency = 0.0
+        self._max_latency = 0.0
+        self._max_frame_time = 0.0
+
+        self.root.after(self.interval_ms, self._run_frame)
+
+    def submit(self, function_name, task, on_cancel=None):
+        """
+        Queues a task (a function with no parameters) that runs the given delegate method on the tkinter thread.
+        on_cancel is called instead of the task if it is rejected, dropped by coalescing or cancelled.  Returns
+        False if the task was rejected.  Safe to call from any thread.
+
+        Type hints:
+          :type function_name: str
+          :type task: callable
+          :type on_cancel: callable | None
+          :rtype: bool
+        """
+        if self._shutdown or len(self._tasks) >= self.max_queued:
+            if not self._shutdown:
+                self._rejected += 1
+                print("Too many queued messages, dropping {}".format(function_name))
+            if on_cancel:
+                on_cancel()
+            return False
+        sequence = next(self._sequence)
+        if function_name in self.coalesce_methods:
+            self._newest[function_name] = sequence
+        self._tasks.append((function_name, sequence, task, on_cancel, time.monotonic()))
+        return True
+
+    def metrics(self):
+        """
+        Returns a dict with the current and maximum queue depth, the number of dispatched, coalesced (dropped for a
+        newer message), rejected and cancelled messages, the average and maximum dispatch latency (seconds from
+        arrival until the method started), the number of frames and the longest frame (seconds).
+
+        Type hints:
+          :rtype: dict
+        """
+        return {"queue_depth": len(self._tasks),
+                "max_queue_depth": self._max_queued_seen,
+                "dispatched": self._dispatched,
+                "coalesced": self._coalesced,
+                "rejected": self._rejected,
+                "cancelled": self._cancelled,
+                "average_latency": self._total_latency / self._dispatched if self._dispatched else 0.0,
+                "max_latency": self._max_latency,
+                "frames": self._frames,
+                "max_frame_time": self._max_frame_time}
+
+    def shutdown(self, wait=True):
+        """
+        Stops running queued methods (the ones still queued are cancelled at the next frame).  There are no threads
+        to wait for, wait is only there to match DispatchExecutor.
+
+        Type hints:
+          :type wait: bool
+        """
+        self._shutdown = True
+
+    def run_frame(self):
+        """
+        Runs queued methods for at most frame_budget seconds and returns how many ran.  The main loop calls this
+        every interval_ms, call it yourself only when there is no main loop running (for example in a test).
+
+        Type hints:
+          :rtype: int
+        """
+        start = time.perf_counter()
+        deadline = start + self.frame_budget
+        self._max_queued_seen = max(self._max_queued_seen, len(self._tasks))
+        count = 0
+        while self._tasks and (count == 0 or time.perf_counter() < deadline):
+            function_name, sequence, task, on_cancel, queued_time = self._tasks.popleft()
+            if self._shutdown:
+                self._cancelled += 1
+                if on_cancel:
+                    on_cancel()
+                continue
+            if function_name in self.coalesce_methods and self._newest.get(function_name) != sequence:
+                self._coalesced += 1
+                if on_cancel:
+                    on_cancel()
+                continue
+            latency = time.monotonic() - queued_time
+            self._dispatched += 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+            _run_task(task)
+            count += 1
+        self._frames += 1
+        self._max_frame_time = max(self._max_frame_time, time.perf_counter() - start)
+        return count
+
+    def _run_frame(self):
+        self.run_frame()
+        if not self._shutdown or self._tasks:
+            self.root.after(self.interval_ms, self._run_frame)
+
+
+def exported(method):
+    """
+    Decorator for delegate methods.  If any method of a delegate is marked with @exported then ONLY the marked
+    methods can be called through the MqttClient.
+    """
+    method.mqtt_exported = True
+    return method
+
+
+class _DeadlineScheduler(object):
+    """
+    Runs callbacks at deadlines (time.monotonic() values) on ONE background thread, started the first time it is
+    needed.  MqttClient uses it for call timeouts and batch windows, and an MqttFleetClient gives the same one to
+    all of its robots, so the number of threads doesn't grow with the fleet.  A callback that raises is printed
+    and the thread goes on with the next one.
+    """
+
+    def __init__(self):
+        self._deadlines = []  # heap of (deadline, sequence number, callback)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def schedule(self, deadline, callback):
+        """
+        Calls callback() (with no parameters) on the scheduler thread once time.monotonic() reaches deadline.
+
+        Type hints:
+          :type deadline: float
+          :type callback: callable
+        """
+        with self._condition:
+            if self._closed:
+                return
+            heapq.heappush(self._deadlines, (deadline, next(self._sequence), callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self):
+        """Forgets the callbacks that have not run yet and stops the thread."""
+        with self._condition:
+            self._closed = True
+            self._deadlines.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if not self._deadlines:
+                        self._condition.wait()
+                        continue
+                    remaining = self._deadlines[0][0] - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._closed:
+                    return
+                deadline, sequence, callback = heapq.heappop(self._deadlines)
+            _run_task(callback)  # A callback that fails (like a publish error while flushing) is printed and skipped
+
 
 class MqttClient(object):
     """Helper class to make it easier to work with MQTT subscriptions and publications."""
 
-    def __init__(self, delegate=None):
+    def __init__(self, delegate=None, codec=None, executor=None, methods=None, client=None, scheduler=None):
         """
         Constructs the MQTT client and optionally connects a delegate object for message Rx.
 
-        Notice that the delegate is optional.
+        Notice that the delegate is optional.  The codec is also optional, by default messages are sent as JSON.
+        If you use a different codec (like BinaryCodec) the other end must use the same kind of codec.
+        The executor is optional too.  Without one delegate methods run on the MQTT network thread, one at a time.
+        methods is an optional list of the only delegate method names that the other end is allowed to call.
+        client is an optional paho client to share with other MqttClients (MqttFleetClient uses that).
+        scheduler is the optional thread for call timeouts and batch windows, shared the same way.
+
+        Type hints:
+          :type codec: JsonCodec | BinaryCodec | None
+          :type executor: DispatchExecutor | None
+          :type methods: list of str | None
+          :type client: paho.mqtt.client.Client | None
+          :type scheduler: _DeadlineScheduler | None
         """
-        self.client = mqtt.Client()
+        self.client = client or mqtt.Client()
+        self.allowed_methods = methods
+        self._dispatch_table = {}  # method name --> (bound method, min parameters, max parameters)
         self.delegate = delegate
+        self.codec = codec or JsonCodec()
+        self.executor = executor
         self.subscription_topic_name = None
         self.publish_topic_name = None
+        self._owns_scheduler = scheduler is None
+        self._scheduler = scheduler or _DeadlineScheduler()  # Runs call timeouts and batch windows
+
+        # Bookkeeping for calls that are waiting for a reply (see the call method).
+        self._pending_calls = {}  # call id --> Future
+        self._call_ids = itertools.count(1)
+        self._call_condition = threading.Condition()
+        self._closed = False
+
+        # Methods that only keep their newest message (see the coalesce method).
+        self._coalesced_methods = set()
+        self._coalesced_messages = collections.OrderedDict()  # method name --> newest Call not yet dispatched
+        self._coalesce_lock = threading.Lock()
+        self.messages_coalesced = 0
+        self.messages_dropped = 0
+
+        # Messages waiting to be sent together (see the enable_batching method).
+        self._batch_window = None  # None means batching is off
+        self._batch_max_messages = 1
+        self._batch_payloads = []
+        self._batch_deadline = None
+        self._batch_condition = threading.Condition()
 
     def connect_to_ev3(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu", lego_robot_number=LEGO_NUMBER):
         """
@@ -179,6 +1167,7 @@ class MqttClient(object):
         The lego_robot number is added to both the subscription and publish topics (as shown in the code below).
 
         Notice that the mqtt_broker_ip_address and lego_robot_number are optional (usually not set).
+        If mqtt_broker_ip_address is LOOPBACK no network is used, messages only go to other clients in this process.
 
         Type hints:
           :type subscription_suffix: str
@@ -186,9 +1175,11 @@ class MqttClient(object):
           :type mqtt_broker_ip_address: str
           :type lego_robot_number: int
         """
-        lego_name = "lego" + str(lego_robot_number).zfill(2)
-        self.subscription_topic_name = lego_name + "/" + subscription_suffix
-        self.publish_topic_name = lego_name + "/" + publish_suffix
+        self.attach(subscription_suffix, publish_suffix, lego_robot_number)
+
+        if mqtt_broker_ip_address == LOOPBACK:
+            import mqtt_loopback  # Only imported when it is used, it is not needed on the robot
+            self.client = mqtt_loopback.LoopbackClient()
 
         # Callback for when the connection to the broker is complete.
         self.client.on_connect = self._on_connect
@@ -198,7 +1189,21 @@ class MqttClient(object):
         print("Connecting to mqtt broker {}".format(mqtt_broker_ip_address), end="")
         self.client.loop_start()
 
-    def send_message(self, function_name, parameter_list=None):
+    def attach(self, subscription_suffix, publish_suffix, lego_robot_number=LEGO_NUMBER):
+        """
+        Sets the subscription and publish topics without connecting (connect calls this).  Used directly by
+        MqttFleetClient, which connects once for many robots.
+
+        Type hints:
+          :type subscription_suffix: str
+          :type publish_suffix: str
+          :type lego_robot_number: int
+        """
+        lego_name = "lego" + str(lego_robot_number).zfill(2)
+        self.subscription_topic_name = lego_name + "/" + subscription_suffix
+        self.publish_topic_name = lego_name + "/" + publish_suffix
+
+    def send_message(self, function_name, parameter_list=None, batch=True):
         """
         Sends a message to the MQTT broker using the publish_topic_name that was set by the connect method.
 
@@ -207,21 +1212,124 @@ class MqttClient(object):
           parameter_list: a List containing the arguments to that method call. Note: even single arguments should be
                           placed into a list.  Also objects in the list will be transferred using json, so objects in
                           the list must be serializable (int, float, string, etc all work fine but nothing fancy)
+          batch: only used after enable_batching. Set it to False for messages that must go out right away (any
+                 messages still waiting are sent first, so the order is kept).
         Type hints:
           :type function_name:  str
           :type parameter_list: list of object | None
+          :type batch: bool
         """
-        message_dict = {"type": function_name}
-        if parameter_list:
-            if isinstance(parameter_list, collections.Iterable):
-                message_dict["payload"] = parameter_list
-            else:
-                # Attempt to bail out users that pass a single item that was a non-list.
-                # CONSIDER: Make this a feature and print no message. Just make it work.
-                print("The parameter_list {} is not a list. Converting it to a list for you.".format(parameter_list))
-                message_dict["payload"] = [parameter_list]
-        message = json.dumps(message_dict)
-        self.client.publish(self.publish_topic_name, message)
+        message = self.codec.encode(function_name, _as_parameter_list(parameter_list))
+        self._publish(message, batch)
+
+    def call(self, function_name, parameter_list=None, timeout=None, batch=True):
+        """
+        Like send_message, but the return value of the method on the other end is sent back.  Returns a
+        concurrent.futures.Future immediately, use future.result() to wait for the value or future.add_done_callback
+        to be called when it arrives.  If the method raised an exception the future raises a RemoteCallError, if no
+        reply arrives within timeout seconds it raises a concurrent.futures.TimeoutError.
+
+        Type hints:
+          :type function_name:  str
+          :type parameter_list: list of object | None
+          :type timeout: float | None
+          :type batch: bool
+          :rtype: concurrent.futures.Future
+        """
+        with self._call_condition:
+            call_id = next(self._call_ids) & 0xFFFFFFFF
+        message = self.codec.encode(function_name, _as_parameter_list(parameter_list), call_id)
+
+        future = concurrent.futures.Future()
+        with self._call_condition:
+            self._pending_calls[call_id] = future
+        if timeout is not None:
+            self._scheduler.schedule(time.monotonic() + timeout, lambda: self._expire_call(call_id, timeout))
+        self._publish(message, batch)
+        return future
+
+    def enable_batching(self, window=0.005, max_messages=10):
+        """
+        From now on messages are not published one at a time.  They wait (for at most window seconds, or until
+        max_messages (at most 65535) are waiting) and are then published together as one MQTT message.  The other
+        end calls the methods in the order they were sent.  Use flush to send waiting messages right away.
+
+        Type hints:
+          :type window: float
+          :type max_messages: int
+        """
+        with self._batch_condition:
+            self._batch_window = window
+            self._batch_max_messages = min(max_messages, _MAX_LENGTH)
+
+    def flush(self):
+        """Publishes any messages that are waiting to be batched right now."""
+        with self._batch_condition:
+            self._flush_locked()
+
+    def _publish(self, message, batch=True):
+        if self._batch_window is None:
+            self.client.publish(self.publish_topic_name, message)
+            return
+        with self._batch_condition:
+            limit = self.codec.max_batched_length
+            if not batch or (limit is not None and len(message) > limit):
+                self._flush_locked()
+                self.client.publish(self.publish_topic_name, message)
+                return
+            self._batch_payloads.append(message)
+            if len(self._batch_payloads) >= self._batch_max_messages:
+                self._flush_locked()
+            elif len(self._batch_payloads) == 1:
+                self._batch_deadline = time.monotonic() + self._batch_window
+                self._scheduler.schedule(self._batch_deadline, self._flush_due)
+
+    def _flush_locked(self):
+        """Publishes the waiting messages (the _batch_condition must be held, which also keeps them in order)."""
+        payloads = self._batch_payloads
+        if not payloads:
+            return
+        self._batch_payloads = []
+        self._batch_deadline = None
+        if len(payloads) == 1:
+            self.client.publish(self.publish_topic_name, payloads[0])
+        else:
+            self.client.publish(self.publish_topic_name, self.codec.encode_batch(payloads))
+
+    def _flush_due(self):
+        """Runs on the scheduler thread when a batch window ends, publishing the batch if it is still waiting."""
+        with self._batch_condition:
+            if self._batch_deadline is not None and self._batch_deadline <= time.monotonic():
+                self._flush_locked()
+
+    def coalesce(self, function_name):
+        """
+        Only keep the newest received message for the given delegate method.  Messages for that method are no longer
+        called right away, instead they are held until process_coalesced is called.  If a newer message arrives
+        before then the older one is dropped.  Useful for high rate sensor readings where only the latest matters.
+
+        Type hints:
+          :type function_name: str
+        """
+        self._coalesced_methods.add(function_name)
+
+    def process_coalesced(self):
+        """
+        Calls the delegate method for the newest held message of each coalesced method (at most one call per
+        method).  Call this once per tick of your program, for example from a tkinter after callback.
+        Returns the number of delegate methods that were called.
+
+        Type hints:
+          :rtype: int
+        """
+        with self._coalesce_lock:
+            if not self._coalesced_messages:
+                return 0
+            messages = list(self._coalesced_messages.values())
+            self._coalesced_messages.clear()
+        for message in messages:
+            self._dispatch(message)
+        return len(messages)
 
     # noinspection PyUnusedLocal
     def _on_connect(self, client, userdata, flags, rc):
@@ -236,6 +1344,13 @@ class MqttClient(object):
 
         # Subscribe to topic(s)
         self.client.subscribe(self.subscription_topic_name)
+        self.publish_handshake()
+
+    def publish_handshake(self):
+        """Lets the codec tell the other end about this end (for example the BinaryCodec method id table)."""
+        handshake_message = self.codec.handshake(list(self._dispatch_table))
+        if handshake_message is not None:
+            self.client.publish(self.publish_topic_name, handshake_message, retain=True)
 
     # noinspection PyUnusedLocal
     def _on_subscribe(self, client, userdata, mid, granted_qos):
@@ -243,41 +1358,447 @@ class MqttClient(object):
 
     # noinspection PyUnusedLocal
     def _on_message(self, client, userdata, msg):
-        message = msg.payload.decode()
-        # print("Received message:", message)
-        if not self.delegate:
-            print("Missing a delegate")
-            return
+        # print("Received message:", msg.payload)
 
         # Attempt to parse the message and call the appropriate function.
         try:
-            message_dict = json.loads(message)
-        except ValueError:
-            print("Unable to decode the received message as JSON")
+            message = self.codec.decode(msg.payload)
+        except ValueError as e:
+            print(e)
+            return
+        if message is None:
+            return  # The codec consumed a control message (like a method table).
+        if isinstance(message, Batch):
+            for batched_message in message.messages:
+                self._handle_message(batched_message)
+        else:
+            self._handle_message(message)
+
+    def _handle_message(self, message):
+        if isinstance(message, Reply):
+            self._resolve_call(message)
             return
 
-        if "type" not in message_dict:
-            print("Received a messages without a 'type' parameter.")
+        if message.function_name in self._coalesced_methods:
+            self._hold_coalesced(message)
             return
-        message_type = message_dict["type"]
-        if hasattr(self.delegate, message_type):
-            method_to_call = getattr(self.delegate, message_type)
-            # Assumes that the user has the parameters correct.
-            if "payload" in message_dict:
-                message_payload = message_dict["payload"]
-                attempted_return = method_to_call(*message_payload)
+        if self.executor:
+            self.executor.submit(message.function_name, lambda: self._dispatch(message),
+                                 lambda: self._send_reply(message.call_id, error="Cancelled before it ran"))
+        else:
+            self._dispatch(message)
+
+    def _hold_coalesced(self, message):
+        with self._coalesce_lock:
+            self.messages_coalesced += 1
+            dropped = self._coalesced_messages.pop(message.function_name, None)
+            self._coalesced_messages[message.function_name] = message
+            if dropped is not None:
+                self.messages_dropped += 1
+        if dropped is not None:
+            self._send_reply(dropped.call_id, error="Dropped because a newer {} call arrived".format(
+                dropped.function_name))
+
+    @property
+    def delegate(self):
+        return self._delegate
+
+    @delegate.setter
+    def delegate(self, delegate):
+        """
+        Setting the delegate also rebuilds the table of methods that can be called.  Methods added to the delegate
+        object later are added to the table the first time they are called.
+        """
+        self._delegate = delegate
+        self._dispatch_table = self._build_dispatch_table()
+        self._exported_only = any(getattr(entry[0], "mqtt_exported", False) for entry in self._dispatch_table.values())
+        self._missing_methods = set()  # Names that were called but could not be (see _add_new_method)
+
+    def _build_dispatch_table(self):
+        if not self._delegate:
+            return {}
+        names = self.allowed_methods or self._exported_method_names() or self._delegate_method_names()
+        dispatch_table = {}
+        for name in names:
+            method = getattr(self._delegate, name, None)
+            if not callable(method):
+                print("The delegate does not have a method named {}".format(name))
+                continue
+            dispatch_table[name] = (method,) + _parameter_count_range(method)
+        return dispatch_table
+
+    def _dispatch(self, message):
+        """Calls the delegate method for a received Call (and sends the reply if the caller wants one)."""
+        message_type, message_payload, call_id = message
+        table_entry = self._dispatch_table.get(message_type)
+        if table_entry is None:
+            table_entry = self._add_new_method(message_type)
+        if table_entry is None:
+            if not self._delegate:
+                print("Missing a delegate")
+                self._send_reply(call_id, error="Missing a delegate")
             else:
-                attempted_return = method_to_call()
+                print("Attempt to call method {} which was not found.".format(message_type))
+                self._send_reply(call_id, error="Method {} was not found".format(message_type))
+            return
+
+        method_to_call, min_parameters, max_parameters = table_entry
+        if not min_parameters <= len(message_payload) <= max_parameters:
+            self._wrong_parameter_count(message, min_parameters, max_parameters)
+            return
+        if call_id is None:
+            attempted_return = method_to_call(*message_payload)
             if attempted_return:
-                print("The method {} returned a value. That's not really how this library works." +
-                      "The value {} was not magically sent back over".format(message_type, attempted_return))
+                print(("The method {} returned a value. That's not really how this library works. " +
+                       "The value {} was not magically sent back over (use call instead of send_message)"
+                       ).format(message_type, attempted_return))
+            return
+        try:
+            result = method_to_call(*message_payload)
+        except Exception as e:
+            print("The method {} raised {!r}, sending the error back to the caller".format(message_type, e))
+            self._send_reply(call_id, error="{}: {}".format(type(e).__name__, e))
+            return
+        self._send_reply(call_id, result=result)
+
+    def _add_new_method(self, name):
+        """
+        The dispatch table is built when the delegate is set, so a method added to the delegate later (for example
+        delegate.on_beep = ...) is looked up here the first time it is called, and added to the table if it may be
+        called.  Returns its table entry, or None.
+
+        A name that can't be called is remembered, so a flood of messages for it costs one set lookup each (the
+        newest _MAX_MISSING_METHODS names are kept).  A method added to the delegate after a message already tried
+        to call it is only found once the delegate is set again.
+        """
+        if not self._delegate or self.allowed_methods or name.startswith("_"):
+            return None  # With a methods list only those methods may be called, and they are already in the table
+        if name in self._missing_methods:
+            return None
+        method = None
+        if not isinstance(getattr(type(self._delegate), name, None), property):
+            method = getattr(self._delegate, name, None)
+        exported = getattr(method, "mqtt_exported", False)
+        if not callable(method) or (self._exported_only and not exported):
+            if len(self._missing_methods) >= _MAX_MISSING_METHODS:
+                self._missing_methods.clear()  # Names come from the network, so don't let the set grow forever
+            self._missing_methods.add(name)
+            return None
+        if exported:
+            self._exported_only = True
+        table_entry = (method,) + _parameter_count_range(method)
+        self._dispatch_table[name] = table_entry
+        return table_entry
+
+    def _wrong_parameter_count(self, message, min_parameters, max_parameters):
+        if max_parameters == _NO_PARAMETER_LIMIT:
+            expected = "at least {}".format(min_parameters)
+        elif min_parameters == max_parameters:
+            expected = str(min_parameters)
         else:
-            print("Attempt to call method {} which was not found.".format(message_type))
+            expected = "{} to {}".format(min_parameters, max_parameters)
+        error = "Method {} takes {} parameters but {} were sent".format(message.function_name, expected,
+                                                                       len(message.parameter_list))
+        print(error)
+        self._send_reply(message.call_id, error=error)
+
+    def _send_reply(self, call_id, result=None, error=None):
+        if call_id is None:
+            return  # The caller used send_message, so no reply is wanted.
+        try:
+            message = self.codec.encode_reply(call_id, result, error)
+        except (TypeError, ValueError) as e:
+            message = self.codec.encode_reply(call_id, error="Unable to send back the return value: {}".format(e))
+        self.client.publish(self.publish_topic_name, message)
+
+    def _resolve_call(self, reply):
+        with self._call_condition:
+            future = self._pending_calls.pop(reply.call_id, None)
+        if future is None or not future.set_running_or_notify_cancel():
+            return  # Not our call, it already timed out, or the caller cancelled it.
+        if reply.error is not None:
+            future.set_exception(RemoteCallError(reply.error))
+        else:
+            future.set_result(reply.result)
+
+    def _expire_call(self, call_id, timeout):
+        """Runs on the scheduler thread, failing the call if it did not get a reply before its timeout."""
+        with self._call_condition:
+            future = self._pending_calls.pop(call_id, None)
+        if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(concurrent.futures.TimeoutError(
+                    "No reply within {} seconds".format(timeout)))
+
+    def _delegate_method_names(self):
+        delegate_class = type(self._delegate)
+        # Properties are skipped without being read, since reading one might have side effects.
+        return [name for name in dir(self._delegate)
+                if not name.startswith("_") and not isinstance(getattr(delegate_class, name, None), property)
+                and callable(getattr(self._delegate, name, None))]
+
+    def _exported_method_names(self):
+        return [name for name in self._delegate_method_names()
+                if getattr(getattr(self._delegate, name), "mqtt_exported", False)]
 
     def close(self):
         """
         Close the MQTT client (recommended of course, but does not seem to be required).
         """
+        self.detach()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def detach(self):
+        """
+        Stops calling the delegate, sends any batched messages, and cancels calls still waiting for a reply, but
+        leaves the (maybe shared) paho client connected.  Close calls this.
+        """
         self.delegate = None
+        with self._batch_condition:
+            self._flush_locked()
+            self._closed = True
+        with self._call_condition:
+            self._closed = True
+            pending_calls = list(self._pending_calls.values())
+            self._pending_calls.clear()
+        for future in pending_calls:
+            future.cancel()
+        if self._owns_scheduler:
+            self._scheduler.close()
+        if self.executor:
+            self.executor.shutdown(wait=False)  # Close might be called from a delegate method on a worker thread.
+
+
+class MqttFleetClient(object):
+    """
+    Lets one program (usually on the PC) talk to many robots over ONE broker connection.  Instead of an MqttClient
+    (with its own socket and network thread) per robot, the fleet client subscribes once with a wildcard and routes
+    each message to the MqttClient for the robot that sent it.  Every robot can have its own delegate.
+
+    Example (code running on the PC):
+      fleet = com.MqttFleetClient(delegate_factory=lambda lego_robot_number: MyDelegate(lego_robot_number))
+      for lego_robot_number in range(1, 31):
+          fleet.add_robot(lego_robot_number)
+      fleet.connect_to_ev3s()
+
+      fleet.send_message(7, "arm_up")            # Only robot 7
+      fleet.broadcast("forward", [300, 300])     # Every robot that was added (or auto added, see __init__)
+      fleet.broadcast("stop", lego_robot_numbers=[3, 4, 5])
+
+    The robots run the normal EV3 code (MqttClient.connect_to_pc), they don't know they are part of a fleet.
+    """
+
+    def __init__(self, delegate_factory=None, codec_class=JsonCodec, auto_add=()):
+        """
+        delegate_factory is optional.  If it is given, add_robot uses delegate_factory(lego_robot_number) as the
+        delegate of a robot that is added without one.
+
+        Messages from robots that were not added are ignored, unless the robot number is in auto_add (for example
+        auto_add=range(1, 31)): then the robot is added the first time it sends a message.  Be careful with
+        auto_add on a shared broker like the class one: anyone can publish to legoNN/msg4pc, so only list the
+        robot numbers of your own robots.
+
+        Type hints:
+          :type delegate_factory: callable | None
+          :type codec_class: type
+          :type auto_add: list of int | range
+        """
+        self.client = mqtt.Client()
+        self.delegate_factory = delegate_factory
+        self.auto_add = set(auto_add)
+        self.codec_class = codec_class
+        self.robots = {}  # lego robot number --> MqttClient (sharing self.client and self.scheduler)
+        self.scheduler = _DeadlineScheduler()  # One thread for the call timeouts and batches of every robot
+        self.subscription_suffix = None
+        self.publish_suffix = None
+        self._robots_lock = threading.Lock()
+        self._connected = False
+
+    def add_robot(self, lego_robot_number, delegate=None, **client_options):
+        """
+        Adds a robot to the fleet and returns the MqttClient used for it.  client_options are passed to the
+        MqttClient constructor (for example executor or methods).  If delegate is not given the delegate_factory
+        is used (if there is one).
+
+        Type hints:
+          :type lego_robot_number: int
+          :rtype: MqttClient
+        """
+        if delegate is None and self.delegate_factory:
+            delegate = self.delegate_factory(lego_robot_number)
+        client_options.setdefault("codec", self.codec_class())
+        robot_client = MqttClient(delegate, client=self.client, scheduler=self.scheduler, **client_options)
+        with self._robots_lock:
+            self.robots[lego_robot_number] = robot_client
+            if self.subscription_suffix:
+                robot_client.attach(self.subscription_suffix, self.publish_suffix, lego_robot_number)
+        if self._connected:
+            robot_client.publish_handshake()
+        return robot_client
+
+    def connect_to_ev3s(self, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu"):
+        """
+        Connects to the MQTT broker and begins listening for messages from every robot.
+
+        Type hints:
+          :type mqtt_broker_ip_address: str
+        """
+        self.connect("msg4pc", "msg4ev3", mqtt_broker_ip_address)
+
+    def connect(self, subscription_suffix, publish_suffix, mqtt_broker_ip_address="mosquitto.csse.rose-hulman.edu"):
+        """
+        Like MqttClient.connect, but for every robot number at once.  The topics are legoNN/subscription_suffix and
+        legoNN/publish_suffix for each robot NN.
+
+        Type hints:
+          :type subscription_suffix: str
+          :type publish_suffix: str
+          :type mqtt_broker_ip_address: str
+        """
+        self.subscription_suffix = subscription_suffix
+        self.publish_suffix = publish_suffix
+        with self._robots_lock:
+            for lego_robot_number, robot_client in self.robots.items():
+                robot_client.attach(subscription_suffix, publish_suffix, lego_robot_number)
+
+        if mqtt_broker_ip_address == LOOPBACK:
+            import mqtt_loopback  # Only imported when it is used, it is not needed on the robot
+            self.client = mqtt_loopback.LoopbackClient()
+            for robot_client in self.robots.values():
+                robot_client.client = self.client
+
+        # MQTT wildcards must be a whole topic level ("lego+/msg4pc" is not allowed), so subscribe to every
+        # "+/subscription_suffix" topic and ignore the ones that are not from a legoNN robot.
+        self.client.on_connect = self._on_connect
+        self.client.message_callback_add("+/" + subscription_suffix, self._on_message)
+        self.client.connect(mqtt_broker_ip_address, 1883, 60)
+        print("Connecting to mqtt broker {}".format(mqtt_broker_ip_address), end="")
+        self.client.loop_start()
+
+    def send_message(self, lego_robot_number, function_name, parameter_list=None, batch=True):
+        """
+        Like MqttClient.send_message, to one robot.
+
+        Type hints:
+          :type lego_robot_number: int
+          :type function_name: str
+          :type parameter_list: list of object | None
+          :type batch: bool
+        """
+        self._robot(lego_robot_number).send_message(function_name, parameter_list, batch)
+
+    def call(self, lego_robot_number, function_name, parameter_list=None, timeout=None):
+        """
+        Like MqttClient.call, to one robot.  Returns a Future for the return value.
+
+        Type hints:
+          :type lego_robot_number: int
+          :rtype: concurrent.futures.Future
+        """
+        return self._robot(lego_robot_number).call(function_name, parameter_list, timeout)
+
+    def broadcast(self, function_name, parameter_list=None, lego_robot_numbers=None):
+        """
+        Sends the same message to every robot in the fleet, or only to the given robot numbers.
+
+        Type hints:
+          :type function_name: str
+          :type parameter_list: list of object | None
+          :type lego_robot_numbers: list of int | None
+        """
+        for robot_client in self._robot_clients(lego_robot_numbers):
+            robot_client.send_message(function_name, parameter_list)
+
+    def broadcast_call(self, function_name, parameter_list=None, lego_robot_numbers=None, timeout=None):
+        """
+        Calls the same method on every robot in the fleet (or only the given robot numbers).  Returns a dict of
+        lego robot number --> Future for that robot's return value.
+
+        Type hints:
+          :rtype: dict of int --> concurrent.futures.Future
+        """
+        with self._robots_lock:
+            numbers = list(self.robots) if lego_robot_numbers is None else list(lego_robot_numbers)
+        return {number: self.call(number, function_name, parameter_list, timeout) for number in numbers}
+
+    def close(self):
+        """Close the connection for every robot in the fleet."""
+        with self._robots_lock:
+            robot_clients = list(self.robots.values())
+        for robot_client in robot_clients:
+            robot_client.detach()
+        self.scheduler.close()
         self.client.loop_stop()
         self.client.disconnect()
+
+    def _robot(self, lego_robot_number):
+        with self._robots_lock:
+            robot_client = self.robots.get(lego_robot_number)
+        if robot_client is None:
+            robot_client = self.add_robot(lego_robot_number)
+        return robot_client
+
+    def _robot_clients(self, lego_robot_numbers):
+        if lego_robot_numbers is None:
+            with self._robots_lock:
+                return list(self.robots.values())
+        return [self._robot(number) for number in lego_robot_numbers]
+
+    # noinspection PyUnusedLocal
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print(" ... Connected!")
+        else:
+            print(" ... Error!!!")
+            exit()
+        self.client.subscribe("+/" + self.subscription_suffix)
+        print("Subscribed to topic: +/" + self.subscription_suffix)
+        self._connected = True
+        with self._robots_lock:
+            robot_clients = list(self.robots.values())
+        for robot_client in robot_clients:
+            robot_client.publish_handshake()
+
+    def _on_message(self, client, userdata, msg):
+        lego_name = msg.topic.split("/", 1)[0]
+        if not lego_name.startswith("lego") or not lego_name[4:].isdigit():
+            return  # Not from a robot.
+        lego_robot_number = int(lego_name[4:])
+        with self._robots_lock:
+            robot_client = self.robots.get(lego_robot_number)
+        if robot_client is None:
+            if lego_robot_number not in self.auto_add:
+                return  # A robot that is not part of this fleet.
+            robot_client = self.add_robot(lego_robot_number)
+        robot_client._on_message(client, userdata, msg)
+
+
+def _parameter_count_range(method):
+    """Returns the (minimum, maximum) number of positional parameters of a method."""
+    try:
+        parameters = inspect.signature(method).parameters.values()
+    except (TypeError, ValueError):
+        return 0, _NO_PARAMETER_LIMIT  # Some built in functions have no signature, so anything is allowed.
+    min_parameters = 0
+    max_parameters = 0
+    for parameter in parameters:
+        if parameter.kind == inspect.Parameter.VAR_POSITIONAL:
+            max_parameters = _NO_PARAMETER_LIMIT
+        elif parameter.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+            if parameter.default is inspect.Parameter.empty:
+                min_parameters += 1
+            if max_parameters != _NO_PARAMETER_LIMIT:
+                max_parameters += 1
+    return min_parameters, max_parameters
+
+
+def _as_parameter_list(parameter_list):
+    """Makes sure the parameters for a message are a list (or None when there are no parameters)."""
+    if not parameter_list:
+        return None
+    if isinstance(parameter_list, collections.abc.Iterable) and not isinstance(parameter_list, str):
+        return list(parameter_list)
+    # Attempt to bail out users that pass a single item that was a non-list.
+    # CONSIDER: Make this a feature and print no message. Just make it work.
+    print("The parameter_list {} is not a list. Converting it to a list for you.".format(parameter_list))
+    return [parameter_list]
@@ -11,46 +11,1630 @@
   could be called.  That way it's a generic action that could be used in any task.
 """
 
+import os
+if os.environ.get("EV3_BACKEND") == "sim":
+    import ev3sim  # A simulated EV3 for running without a robot, see ev3sim.py
+    ev3sim.install()
 import ev3dev.ev3 as ev3
+import ev3_sysfs
+import sound_queue
 import time
 import traceback
 import math
+import threading
+import collections
+import array
+import heapq
+
+
+class MotionHandle(object):
+    """
+    Returned by the *_async motion methods of the Snatch3r (like drive_inches_async).  The motion runs in the
+    background while your code keeps going, so you can read sensors or update the screen at the same time.
+
+      handle = robot.drive_inches_async(12, 400)
+      while not handle.done():
+          print(robot.color_sensor.reflected_light_intensity)
+      handle.wait(timeout=5)  # Blocks until the motion is done (returns False if the timeout ran out first)
+      handle.cancel()         # Stops the motion (or removes it from the queue if it has not started yet)
+
+    Motions run one after the other in the order they were started, so it is fine to start several at once.
+    If a step fails (for example a motor was unplugged) the motion is done and wait raises the error.
+    """
+
+    def __init__(self, monitor, steps):
+        """
+        Type hints:
+          :type monitor: MotionMonitor
+          :type steps: list of callable
+        """
+        self._monitor = monitor
+        self._steps = collections.deque(steps)  # Functions that start one motion and return the motors to watch.
+        self._motors = []  # The motors of the step that is running
+        self._finished = threading.Event()
+        self._cancelled = False
+        self._error = None  # The exception a step raised, if one did
+
+    def done(self):
+        """Returns True if the motion finished or was cancelled."""
+        return self._finished.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def error(self):
+        """Returns the exception that stopped the motion, or None."""
+        return self._error
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the motion is done.  Returns False if the timeout (in seconds) ran out first, and raises the
+        error if a step failed.
+        """
+        finished = self._finished.wait(timeout)
+        if finished and self._error is not None:
+            raise self._error
+        return finished
+
+    def cancel(self):
+        """Stops the motion right away (using brake).  Returns False if it was already done."""
+        return self._monitor.cancel(self)
+
+
+class MotionMonitor(object):
+    """
+    The one background thread that starts queued motions and watches the motors until each one is done.
+    Every Snatch3r makes its own monitor the first time an *_async method is used.
+    """
+
+    def __init__(self, poll_interval=0.01):
+        """
+        Type hints:
+          :type poll_interval: float
+        """
+        self.poll_interval = poll_interval
+        self._queue = collections.deque()  # MotionHandles, the first one is the one running
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def start(self, steps):
+        """
+        Queues a motion made of steps (each step is a function that starts the motors and returns the list of
+        motors to watch).  Returns the MotionHandle.
+
+        Type hints:
+          :type steps: list of callable
+          :rtype: MotionHandle
+        """
+        handle = MotionHandle(self, steps)
+        with self._condition:
+            self._queue.append(handle)
+            self._condition.notify()
+        return handle
+
+    def cancel(self, handle):
+        with self._condition:
+            if handle.done() or handle not in self._queue:
+                return False
+            if handle is self._queue[0]:
+                for motor in handle._motors:
+                    motor.stop(stop_action="brake")
+            self._queue.remove(handle)
+            handle._cancelled = True
+            handle._finished.set()
+            self._condition.notify()
+        return True
+
+    def cancel_all(self):
+        with self._condition:
+            handles = list(self._queue)
+        for handle in handles:
+            self.cancel(handle)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                handle = self._queue[0]
+                motors = handle._motors
+            # The motor reads and the steps (which write to the motors) are done without holding the lock, so
+            # start and cancel never wait for the motors.
+            try:
+                if not any(ev3.Motor.STATE_RUNNING in motor.state for motor in motors):
+                    # The current step is done (or the handle has not started yet), so start the next step.
+                    with self._condition:
+                        if not self._is_running(handle):
+                            continue  # Cancelled while the motors were read
+                        if not handle._steps:
+                            self._queue.popleft()
+                            handle._finished.set()
+                            continue
+                        step = handle._steps.popleft()
+                    motors = step()
+                    with self._condition:
+                        handle._motors = motors
+                        cancelled = not self._is_running(handle)
+                    if cancelled:
+                        self._stop_motors(motors)  # cancel ran while the step was starting these motors
+                        continue
+            except Exception as e:
+                # Only this motion fails (its wait raises the error), the queued ones still run.
+                self._stop_motors(handle._motors)
+                with self._condition:
+                    if self._is_running(handle):
+                        handle._error = e
+                        self._queue.popleft()
+                        handle._finished.set()
+                continue
+            time.sleep(self.poll_interval)
+
+    def _is_running(self, handle):
+        """Returns True if handle is the motion at the front of the queue (call it holding the lock)."""
+        return bool(self._queue) and self._queue[0] is handle
+
+    @staticmethod
+    def _stop_motors(motors):
+        for motor in motors:
+            try:
+                motor.stop(stop_action="brake")
+            except Exception:
+                traceback.print_exc()  # Still stop the other motors
+
+
+class RingBuffer(object):
+    """
+    A fixed size buffer of timestamped samples, kept in preallocated arrays so adding a sample never allocates
+    memory.  Each sample has width values (for example 4 for the Pixy x, y, width, height).  Once the buffer is
+    full the oldest sample is overwritten.
+    """
+
+    def __init__(self, capacity, width=1):
+        """
+        Type hints:
+          :type capacity: int
+          :type width: int
+        """
+        self.capacity = capacity
+        self.width = width
+        self.times = array.array("d", [0.0]) * capacity
+        self.values = array.array("d", [0.0]) * (capacity * width)
+        self.count = 0  # Total samples ever appended
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, values):
+        """
+        Type hints:
+          :type timestamp: float
+          :type values: list of float | tuple of float
+        """
+        with self._lock:
+            index = self.count % self.capacity
+            self.times[index] = timestamp
+            start = index * self.width
+            for k in range(self.width):
+                self.values[start + k] = values[k]  # Into the preallocated array, no temporary array
+            self.count += 1
+
+    def latest(self):
+        """Returns (timestamp, value) of the newest sample, or None if there are no samples yet."""
+        samples = self.window(1)
+        return samples[0] if samples else None
+
+    def window(self, n):
+        """
+        Returns the newest n samples (oldest first) as a list of (timestamp, value).  value is a number when the
+        width is 1, otherwise a tuple of numbers.
+
+        Type hints:
+          :type n: int
+          :rtype: list of (float, float | tuple)
+        """
+        with self._lock:
+            n = min(n, self.count, self.capacity)
+            samples = []
+            for k in range(self.count - n, self.count):
+                index = k % self.capacity
+                start = index * self.width
+                if self.width == 1:
+                    value = self.values[start]
+                else:
+                    value = tuple(self.values[start:start + self.width])
+                samples.append((self.times[index], value))
+            return samples
+
+
+class SensorSampler(object):
+    """
+    Reads sensors at fixed rates on ONE background thread and keeps the recent readings in RingBuffers.  Control
+    loops can then read the newest value from memory (fast) instead of asking the sensor each time (slow).
+
+      sampler = robot.start_sampler(color_hz=100)
+      timestamp, intensity = sampler.latest("color")
+      recent = sampler.window("color", 10)  # The newest 10 (timestamp, value) samples, oldest first
+      sampler.subscribe("touch", lambda name, timestamp, value: print("Touch sensor is now", value))
+    """
+
+    def __init__(self, capacity=100):
+        """
+        Type hints:
+          :type capacity: int
+        """
+        self.capacity = capacity
+        self.buffers = {}  # channel name --> RingBuffer
+        self._channels = {}  # channel name --> (read function, period in seconds)
+        self._close_functions = []  # Called by stop, for example to close the sysfs files the channels read
+        self._subscribers = collections.defaultdict(list)  # channel name --> callbacks
+        self._running = False
+        self._stopped = threading.Event()  # Set by stop, ends the wait of a sampler without channels
+        self._thread = None
+
+    def add_channel(self, name, read, rate_hz, width=1, close=None):
+        """
+        Adds a sensor reading to sample.  read is a function with no parameters that returns the reading (a
+        number, or a list/tuple of width numbers).  If close is given it is called (with no parameters) when the
+        sampler stops, to free what read uses.  Add every channel before calling start.
+
+        Type hints:
+          :type name: str
+          :type read: callable
+          :type rate_hz: float
+          :type width: int
+          :type close: callable | None
+        """
+        self.buffers[name] = RingBuffer(self.capacity, width)
+        self._channels[name] = (read, 1.0 / rate_hz)
+        if close:
+            self._close_functions.append(close)
+
+    def subscribe(self, name, callback):
+        """
+        Calls callback(name, timestamp, value) (on the sampler thread) each time the value of the channel changes.
+        If the callback raises an exception the traceback is printed and the sampler keeps going.
+
+        Type hints:
+          :type name: str
+          :type callback: callable
+        """
+        self._subscribers[name].append(callback)
+
+    def latest(self, name):
+        """Returns (timestamp, value) of the newest sample of the channel, or None if there is none yet."""
+        return self.buffers[name].latest()
+
+    def window(self, name, n):
+        """Returns the newest n (timestamp, value) samples of the channel, oldest first."""
+        return self.buffers[name].window(n)
+
+    def start(self):
+        self._running = True
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread and calls the close function of every channel (the sampler can't be started again)."""
+        self._running = False
+        self._stopped.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        close_functions, self._close_functions = self._close_functions, []
+        for close in close_functions:
+            close()
+
+    def _run(self):
+        # Each channel has its own deadline.  Always sleep until the earliest deadline, so reading one slow
+        # sensor does not shift the schedule of the others.
+        start_time = time.monotonic()
+        schedule = [(start_time, name) for name in self._channels]
+        heapq.heapify(schedule)
+        previous_values = {}
+        if not schedule:
+            self._stopped.wait()  # No channels were added, so there is nothing to read until stop is called
+            return
+        while self._running:
+            deadline, name = heapq.heappop(schedule)
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)  # time.sleep (not the event) so the ev3sim simulated clock is used
+            read, period = self._channels[name]
+            timestamp = time.monotonic()
+            try:
+                value = read()
+            except (OSError, ValueError):
+                value = None  # The sensor was unplugged or is changing modes, try again next time.
+            if value is not None:
+                values = value if isinstance(value, (list, tuple)) else (value,)
+                self.buffers[name].append(timestamp, values)
+                if self._subscribers[name] and previous_values.get(name) != values:
+                    previous_values[name] = values
+                    for callback in self._subscribers[name]:
+                        try:
+                            callback(name, timestamp, value)
+                        except Exception:
+                            traceback.print_exc()  # A broken callback must not stop the sampling (or the others)
+            # Stay on the fixed schedule, but skip missed periods instead of running to catch up.
+            next_deadline = deadline + period
+            if next_deadline < timestamp:
+                next_deadline = timestamp + period
+            heapq.heappush(schedule, (next_deadline, name))
+
+
+class WriteCache(object):
+    """
+    Remembers the last command written to each drive motor and the last color of each LED group, so that sending
+    the same command again (for example a stream of identical forward messages from the PC) can skip the sysfs
+    writes.  Every skipped command saves two attribute writes (speed_sp + command, stop_action + command, or the
+    brightness of both LEDs in a group).
+
+    If other code moves a motor directly (like robot.left_motor.run_forever(...)) the cache doesn't know about it,
+    so call invalidate() afterwards, or make the cache with verify=True to check the motor state (one read)
+    before skipping a run command.  A stop is never skipped while the motor is actually running.
+    """
+
+    def __init__(self, verify=False):
+        """
+        Type hints:
+          :type verify: bool
+        """
+        self.verify = verify
+        self.enabled = True
+        self.commands_written = 0
+        self.commands_avoided = 0
+        self._motor_commands = {}  # motor --> the last (command, value) written
+        self._led_colors = {}  # LED group --> the last color written
+        self._lock = threading.Lock()
+
+    @property
+    def writes_avoided(self):
+        """The number of sysfs attribute writes that were skipped (2 per skipped command)."""
+        return self.commands_avoided * 2
+
+    def run_forever(self, motor, speed_sp):
+        running = self._is_repeat(motor, ("run-forever", speed_sp))
+        if running and self.verify:
+            running = ev3.Motor.STATE_RUNNING in motor.state
+        if running:
+            self._avoided()
+        else:
+            motor.run_forever(speed_sp=speed_sp)
+            self._written(motor, ("run-forever", speed_sp))
+
+    def stop(self, motor, stop_action="brake"):
+        if self._is_repeat(motor, ("stop", stop_action)) and ev3.Motor.STATE_RUNNING not in motor.state:
+            self._avoided()
+            return
+        motor.stop(stop_action=stop_action)
+        self._written(motor, ("stop", stop_action))
+
+    def set_led_color(self, group, color):
+        with self._lock:
+            if self.enabled and self._led_colors.get(group) == color:
+                self.commands_avoided += 1
+                return
+            self._led_colors[group] = color
+            self.commands_written += 1
+        ev3.Leds.set_color(group, color)
+
+    def invalidate(self, motor=None):
+        """Forgets what was written to the motor (or to every motor and LED when motor is None)."""
+        with self._lock:
+            if motor is None:
+                self._motor_commands.clear()
+                self._led_colors.clear()
+            else:
+                self._motor_commands.pop(motor, None)
+
+    def _is_repeat(self, motor, command):
+        with self._lock:
+            return self.enabled and self._motor_commands.get(motor) == command
+
+    def _avoided(self):
+        """Counts a command that was really skipped (not one that _is_repeat matched but was written anyway)."""
+        with self._lock:
+            self.commands_avoided += 1
+
+    def _written(self, motor, command):
+        with self._lock:
+            self._motor_commands[motor] = command
+            self.commands_written += 1
+
+
+class FixedRateTimer(object):
+    """
+    Runs a loop at a fixed rate.  Each iteration has a deadline (the start time + k * period) and wait sleeps until
+    the next one, so the time spent working in the loop does not slow the rate down (sleeping a fixed time after
+    the work would).  If an iteration takes longer than the period, the missed deadlines are skipped instead of
+    running several iterations late.
+
+      timer = FixedRateTimer(50)
+      timer.start()
+      while running:
+          ...  # Read sensors, write motors
+          timer.wait()
+    """
+
+    def __init__(self, rate_hz):
+        """
+        Type hints:
+          :type rate_hz: float
+        """
+        self.period = 1.0 / rate_hz
+        self.deadline = None
+        self.overruns = 0
+
+    def start(self):
+        """Returns the start time (time.monotonic()), which is also the first deadline."""
+        self.deadline = time.monotonic()
+        return self.deadline
+
+    def lateness(self, now):
+        """Returns how many seconds after its deadline the current iteration started (now is time.monotonic())."""
+        return now - self.deadline
+
+    def wait(self):
+        self.deadline += self.period
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.overruns += 1
+            self.deadline = time.monotonic()
+
+
+class PidController(object):
+    """
+    A PID controller: output = kp * error + ki * (the sum of error * dt) + kd * (the change of error / dt).
+    Call update once per loop iteration with the new error and the seconds since the last update.
+    """
+
+    def __init__(self, kp, ki=0.0, kd=0.0, integral_limit=None):
+        """
+        integral_limit (if given) keeps the sum of error * dt between -integral_limit and integral_limit, so the
+        integral can't wind up while the robot is stuck.
+
+        Type hints:
+          :type kp: float
+          :type ki: float
+          :type kd: float
+          :type integral_limit: float | None
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.integral_limit = integral_limit
+        self.integral = 0.0
+        self.previous_error = None
+
+    def reset(self):
+        self.integral = 0.0
+        self.previous_error = None
+
+    def update(self, error, dt):
+        """
+        Type hints:
+          :type error: float
+          :type dt: float
+          :rtype: float
+        """
+        self.integral += error * dt
+        if self.integral_limit is not None:
+            self.integral = max(-self.integral_limit, min(self.integral_limit, self.integral))
+        if self.previous_error is None or dt <= 0:
+            derivative = 0.0
+        else:
+            derivative = (error - self.previous_error) / dt
+        self.previous_error = error
+        return self.kp * error + self.ki * self.integral + self.kd * derivative
+
+
+class _SensorReaders(object):
+    """
+    The sysfs sensor readers (see Snatch3r.fast_sensor_reader) that a controller opened, so its stop can close
+    their files.  A reader that was closed is opened again the next time it is asked for.  While a run loop is
+    reading (between start_using and stop_using) close waits until the loop is done, so a file is never closed
+    under a read on another thread.
+    """
+
+    def __init__(self):
+        self._readers = {}  # name --> (read function, close function or None)
+        self._lock = threading.Lock()
+        self._users = 0
+        self._close_when_unused = False
+
+    def get(self, name, sensor, mode, first_value, end_value=None):
+        """Returns the reader called name, opening it (like fast_sensor_reader) if it is not open."""
+        with self._lock:
+            if name not in self._readers:
+                self._readers[name] = Snatch3r._open_sensor_reader(sensor, mode, first_value, end_value)
+            return self._readers[name][0]
+
+    def is_open(self, name):
+        return name in self._readers
+
+    def start_using(self):
+        with self._lock:
+            self._users += 1
+
+    def stop_using(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._close_when_unused:
+                self._close()
+
+    def close(self):
+        with self._lock:
+            if self._users:
+                self._close_when_unused = True
+            else:
+                self._close()
+
+    def _close(self):
+        readers, self._readers = self._readers, {}
+        self._close_when_unused = False
+        for read, close in readers.values():
+            if close:
+                close()
+
+
+class LineFollower(object):
+    """
+    Follows one edge of a black line on a white surface with a PID loop on the reflected light intensity.  The
+    loop runs at a fixed rate (see FixedRateTimer), so the time spent reading the sensor and writing the motors
+    does not slow the rate down.
+
+    Following an edge (instead of bouncing between "on the line" and "off the line") handles left and right
+    turns: side="left" keeps the sensor on the left edge of the line, side="right" on the right edge.
+
+      robot.calibrate_line()  # Place the sensor on the line, the robot turns a little each way to see white and black
+      robot.follow_line(speed=400, timeout=30)
+      print(robot.line_follower.timing_stats())
+
+    Every iteration is logged in self.timing (a RingBuffer of (lateness, work time, error), see timing_stats).
+    """
+
+    def __init__(self, robot, read_intensity=None, white_level=None, black_level=None, speed=400, side="left",
+                 kp=500.0, ki=0.0, kd=25.0, rate_hz=100, log_size=1000):
+        """
+        read_intensity is a function that returns the reflected light intensity (by default the color sensor of
+        the robot is read through ev3_sysfs, and stop closes its files).  Leave white_level and black_level as None
+        to calibrate the first time run is called.  kp, ki and kd turn the error (-1 to 1) into a turn speed in
+        degrees per second.
+
+        Type hints:
+          :type robot: Snatch3r
+          :type read_intensity: callable
+          :type white_level: int | None
+          :type black_level: int | None
+          :type speed: int
+          :type side: str
+          :type rate_hz: float
+          :type log_size: int
+        """
+        self.robot = robot
+        self.read_intensity = read_intensity
+        self.white_level = white_level
+        self.black_level = black_level
+        self.speed = speed
+        self.side = side
+        self.pid = PidController(kp, ki, kd, integral_limit=1.0)
+        self.rate_hz = rate_hz
+        self.timing = RingBuffer(log_size, width=3)
+        self.iterations = 0
+        self.overruns = 0
+        self.running = False
+        self._readers = _SensorReaders()
+
+    def calibrate(self, turn_speed=150, duration=1.2):
+        """
+        Finds the white and black levels.  Start with the color sensor on the edge of the line: the robot turns
+        right, then left, then right again (back to where it started) while reading the intensity, and uses the
+        brightest reading as white and the darkest as black.  Returns (white_level, black_level).
+        """
+        readings = []
+        read_intensity = self._intensity_reader()
+        self._readers.start_using()
+        try:
+            for direction, seconds in [(1, duration / 4), (-1, duration / 2), (1, duration / 4)]:
+                self._drive(direction * turn_speed, -direction * turn_speed)
+                end_time = time.monotonic() + seconds
+                while time.monotonic() < end_time:
+                    readings.append(read_intensity())
+                    time.sleep(0.005)
+        finally:
+            self._readers.stop_using()
+        self._stop_motors()
+        self.white_level = max(readings)
+        self.black_level = min(readings)
+        if self.white_level - self.black_level < 10:
+            print("Calibration only saw intensities from {} to {}, is the sensor over the edge of the line?".format(
+                self.black_level, self.white_level))
+        return self.white_level, self.black_level
+
+    def run(self, until=None, timeout=None):
+        """
+        Follows the line until until() returns True (by default until the touch sensor is pressed), timeout
+        seconds have passed, or stop is called (for example by an MQTT message).  Then stops the drive motors and
+        returns the number of seconds it ran.
+
+        Type hints:
+          :type until: callable
+          :type timeout: float | None
+          :rtype: float
+        """
+        if self.white_level is None or self.black_level is None:
+            self.calibrate()
+        if until is None:
+            until = self._readers.get("touch", self.robot.touch_sensor, "TOUCH", 0)
+        target = (self.white_level + self.black_level) / 2
+        half_range = max(1, self.white_level - self.black_level) / 2
+        # White means the sensor drifted off the line.  On the left edge the line is then to the right.
+        direction = 1 if self.side == "left" else -1
+        max_speed = self.robot.MAX_SPEED
+        read_intensity = self._intensity_reader()
+        pid = self.pid
+        pid.reset()
+        self.running = True
+
+        timer = FixedRateTimer(self.rate_hz)
+        start_time = timer.start()
+        previous_time = start_time
+        self._readers.start_using()
+        try:
+            while self.running:
+                now = time.monotonic()
+                error = direction * (read_intensity() - target) / half_range
+                turn = pid.update(error, now - previous_time)
+                previous_time = now
+                left_speed = max(-max_speed, min(max_speed, self.speed + turn))
+                right_speed = max(-max_speed, min(max_speed, self.speed - turn))
+                self._drive(int(left_speed), int(right_speed))
+                self.timing.append(now, (timer.lateness(now), time.monotonic() - now, error))
+                self.iterations += 1
+                if until() or (timeout is not None and now - start_time >= timeout):
+                    break
+                timer.wait()
+        finally:
+            self._readers.stop_using()
+        self.running = False
+        self.overruns += timer.overruns
+        self._stop_motors()
+        return time.monotonic() - start_time
+
+    def stop(self):
+        """
+        Makes run return (call it from another thread, like an MQTT message) and closes the sensor files it opened
+        (once run has returned).  They are opened again if the line follower is used again.
+        """
+        self.running = False
+        self._readers.close()
+
+    def timing_stats(self):
+        """
+        Returns a dictionary that summarizes the logged iterations (the newest log_size of them):
+          rate_hz - the iterations per second that actually ran
+          mean_jitter_ms, max_jitter_ms - how late each iteration started compared to its deadline
+          mean_work_ms, max_work_ms - the time spent reading the sensor and writing the motors
+          mean_abs_error - how far from the edge the sensor was, on average (0 is on the edge, 1 is all white)
+          overruns - the iterations that took longer than the period
+        """
+        samples = self.timing.window(self.timing.capacity)
+        stats = {"iterations": self.iterations, "overruns": self.overruns}
+        if len(samples) < 2:
+            return stats
+        lateness = [value[0] for timestamp, value in samples]
+        work = [value[1] for timestamp, value in samples]
+        stats["rate_hz"] = (len(samples) - 1) / (samples[-1][0] - samples[0][0])
+        stats["mean_jitter_ms"] = sum(lateness) / len(samples) * 1000
+        stats["max_jitter_ms"] = max(lateness) * 1000
+        stats["mean_work_ms"] = sum(work) / len(samples) * 1000
+        stats["max_work_ms"] = max(work) * 1000
+        stats["mean_abs_error"] = sum(abs(value[2]) for timestamp, value in samples) / len(samples)
+        return stats
+
+    def _intensity_reader(self):
+        if self.read_intensity is not None:
+            return self.read_intensity
+        return self._readers.get("intensity", self.robot.color_sensor, "COL-REFLECT", 0)
+
+    def _drive(self, left_speed, right_speed):
+        self.robot.write_cache.run_forever(self.robot.left_motor, left_speed)
+        self.robot.write_cache.run_forever(self.robot.right_motor, right_speed)
+
+    def _stop_motors(self):
+        self.robot.write_cache.stop(self.robot.left_motor)
+        self.robot.write_cache.stop(self.robot.right_motor)
+
+
+class BeaconHoming(object):
+    """
+    Drives to the IR remote (in beacon mode) at a fixed loop rate.  The turn speed is proportional to the heading
+    and the forward speed is proportional to the distance (and slows down while the heading is far off), so the
+    robot turns and drives at the same time instead of stopping to turn.  While the beacon is not seen the robot
+    spins toward the side it was last seen on, checking again every loop iteration.
+
+      beacon_homing = BeaconHoming(robot)
+      if beacon_homing.run(timeout=20):
+          robot.arm_up()
+      print(beacon_homing.metrics())
+    """
+
+    NOT_FOUND = -128  # The distance the IR sensor reports when it does not see the beacon
+
+    def __init__(self, robot, read_heading_and_distance=None, channel=1, rate_hz=20, heading_gain=20.0,
+                 distance_gain=15.0, max_speed=600, search_speed=150, pickup_distance=1, heading_tolerance=2,
+                 approach_seconds=0.6):
+        """
+        read_heading_and_distance is a function that returns [heading, distance] like ev3.BeaconSeeker (by default
+        the IR sensor of the robot is read through ev3_sysfs in IR-SEEK mode, and stop closes its files).
+        heading_gain is the turn speed (degrees per second) per unit of heading, distance_gain the forward speed per
+        unit of distance.  Once the beacon is within pickup_distance and heading_tolerance the robot drives forward
+        for approach_seconds more (to get the beacon between the claws) and stops.
+
+        Type hints:
+          :type robot: Snatch3r
+          :type read_heading_and_distance: callable
+          :type channel: int
+          :type rate_hz: float
+        """
+        self.robot = robot
+        self.channel = channel
+        self._read = read_heading_and_distance
+        self.rate_hz = rate_hz
+        self.heading_gain = heading_gain
+        self.distance_gain = distance_gain
+        self.max_speed = max_speed
+        self.search_speed = search_speed
+        self.pickup_distance = pickup_distance
+        self.heading_tolerance = heading_tolerance
+        self.approach_seconds = approach_seconds
+        self.running = False
+        self.time_to_acquire = None  # Seconds from the start of run until the beacon was first seen
+        self.time_to_pickup = None  # Seconds from the start of run until the robot reached the beacon
+        self.times_lost = 0  # How many times the beacon was seen and then lost again
+        self.iterations = 0
+        self.overruns = 0
+        self._readers = _SensorReaders()
+
+    def touch_pressed(self):
+        """The default until of run: True while the touch sensor is pressed."""
+        return self._readers.get("touch", self.robot.touch_sensor, "TOUCH", 0)()
+
+    def read_heading_and_distance(self):
+        if self._read is not None:
+            return self._read()
+        # IR-SEEK has a heading and distance value for each of the 4 channels.
+        first_value = (self.channel - 1) * 2
+        return self._readers.get("ir", self.robot.ir_sensor, "IR-SEEK", first_value, first_value + 2)()
+
+    def run(self, until=None, timeout=None):
+        """
+        Drives to the beacon.  Returns True when the robot reached it, or False if until() returned True (by
+        default until the touch sensor is pressed), timeout seconds passed, or stop was called first.
+
+        Type hints:
+          :type until: callable
+          :type timeout: float | None
+          :rtype: bool
+        """
+        if until is None:
+            until = self.touch_pressed
+        if self._read is None and self._readers.is_open("ir"):
+            self.robot.ir_sensor.mode = "IR-SEEK"  # In case something else (like the sampler) changed the mode
+        self.running = True
+        self.time_to_acquire = None
+        self.time_to_pickup = None
+        self.times_lost = 0
+        last_side = 1  # Search by spinning right until the beacon has been seen once
+        seen = False
+        reached = False
+
+        timer = FixedRateTimer(self.rate_hz)
+        start_time = timer.start()
+        self._readers.start_using()
+        try:
+            while self.running:
+                now = time.monotonic()
+                heading, distance = self.read_heading_and_distance()
+                self.iterations += 1
+                if distance == self.NOT_FOUND:
+                    if seen:
+                        seen = False
+                        self.times_lost += 1
+                    self._drive(last_side * self.search_speed, -last_side * self.search_speed)
+                else:
+                    if not seen:
+                        seen = True
+                        if self.time_to_acquire is None:
+                            self.time_to_acquire = now - start_time
+                    if heading != 0:
+                        last_side = 1 if heading > 0 else -1
+                    if distance <= self.pickup_distance and abs(heading) <= self.heading_tolerance:
+                        reached = True
+                        break
+                    turn = self.heading_gain * heading
+                    # Drive slower while the heading is far off, so the robot turns toward the beacon first.
+                    forward = self.distance_gain * (distance - self.pickup_distance) + self.search_speed
+                    forward *= max(0.0, 1 - abs(heading) / 10)
+                    forward = min(self.max_speed, forward)
+                    left_speed = max(-self.max_speed, min(self.max_speed, forward + turn))
+                    right_speed = max(-self.max_speed, min(self.max_speed, forward - turn))
+                    self._drive(int(left_speed), int(right_speed))
+                if until() or (timeout is not None and now - start_time >= timeout):
+                    break
+                timer.wait()
+        finally:
+            self._readers.stop_using()
+        self.overruns += timer.overruns
+        if reached:
+            self._drive(self.search_speed * 2, self.search_speed * 2)
+            time.sleep(self.approach_seconds)
+            self.time_to_pickup = time.monotonic() - start_time
+        self._stop_motors()
+        self.running = False
+        return reached
+
+    def stop(self):
+        """
+        Makes run return (call it from another thread, like an MQTT message) and closes the sensor files it opened
+        (once run has returned).  They are opened again if the beacon homing is used again.
+        """
+        self.running = False
+        self._readers.close()
+
+    def metrics(self):
+        """Returns a dictionary with the time_to_acquire, time_to_pickup, and times_lost of the last run."""
+        return {"time_to_acquire": self.time_to_acquire, "time_to_pickup": self.time_to_pickup,
+                "times_lost": self.times_lost, "iterations": self.iterations, "overruns": self.overruns}
+
+    def _drive(self, left_speed, right_speed):
+        self.robot.write_cache.run_forever(self.robot.left_motor, left_speed)
+        self.robot.write_cache.run_forever(self.robot.right_motor, right_speed)
+
+    def _stop_motors(self):
+        self.robot.write_cache.stop(self.robot.left_motor)
+        self.robot.write_cache.stop(self.robot.right_motor)
+
+
+class PositionFilter(object):
+    """
+    Smooths a noisy position reading and estimates how fast it is moving, so the position can also be predicted
+    between readings.  This is a small Kalman filter for something moving at a (nearly) constant speed: like an
+    alpha-beta filter, but the amount each reading changes the position and velocity is worked out from the time
+    since the last reading, so it works at any reading rate.
+
+      x_filter = PositionFilter(measurement_noise=3, acceleration_noise=2000)
+      x_filter.update(pixy_x, time.monotonic())
+      x_in_50_ms = x_filter.predict(time.monotonic() + 0.05)
+    """
+
+    def __init__(self, measurement_noise=3.0, acceleration_noise=2000.0):
+        """
+        measurement_noise is how far off a single reading typically is, acceleration_noise how quickly the speed
+        typically changes (per second).  Both are in the units of the position (for the Pixy, pixels).
+
+        Type hints:
+          :type measurement_noise: float
+          :type acceleration_noise: float
+        """
+        self.measurement_variance = measurement_noise ** 2
+        self.acceleration_variance = acceleration_noise ** 2
+        self.position = None
+        self.velocity = 0.0  # Position units per second
+        self.timestamp = None
+        self._covariance = (0.0, 0.0, 0.0)  # How uncertain (position, position and velocity, velocity) are
+
+    def reset(self):
+        self.position = None
+        self.velocity = 0.0
+        self.timestamp = None
+
+    def update(self, measurement, timestamp):
+        """
+        Adds a reading taken at timestamp (in seconds, like time.monotonic()) and returns the new position.
+
+        Type hints:
+          :type measurement: float
+          :type timestamp: float
+          :rtype: float
+        """
+        if self.position is None:
+            self.position = float(measurement)
+            self.velocity = 0.0
+            self.timestamp = timestamp
+            self._covariance = (self.measurement_variance, 0.0, 1e6)
+            return self.position
+        dt = timestamp - self.timestamp
+        self.timestamp = timestamp
+        # Predict where it is now, and how much more uncertain that makes things.
+        predicted = self.position + self.velocity * dt
+        p00, p01, p11 = self._covariance
+        q = self.acceleration_variance
+        p00 += dt * (2 * p01 + dt * p11) + q * dt ** 4 / 4
+        p01 += dt * p11 + q * dt ** 3 / 2
+        p11 += q * dt ** 2
+        # Move the prediction toward the reading (position_gain and velocity_gain are the alpha and beta / dt).
+        position_gain = p00 / (p00 + self.measurement_variance)
+        velocity_gain = p01 / (p00 + self.measurement_variance)
+        residual = measurement - predicted
+        self.position = predicted + position_gain * residual
+        self.velocity += velocity_gain * residual
+        self._covariance = ((1 - position_gain) * p00, (1 - position_gain) * p01, p11 - velocity_gain * p01)
+        return self.position
+
+    def predict(self, timestamp):
+        """Returns where the position will be at timestamp (or None if there have been no readings yet)."""
+        if self.position is None:
+            return None
+        return self.position + self.velocity * (timestamp - self.timestamp)
+
+
+class PixyTracker(object):
+    """
+    Spins the robot to keep facing the object the Pixy sees as signature 1.  The Pixy is read at its own frame
+    rate (50 per second), the x readings are smoothed with a PositionFilter, and the spin speed is proportional
+    to how far from the middle of the picture the object is predicted to be lead_seconds from now (which makes up
+    for the time the Pixy takes to report a frame).  If the object is not seen for lost_after seconds the robot
+    stops until it is seen again.
+
+      pixy_tracker = PixyTracker(robot)
+      pixy_tracker.run(timeout=30)  # Or until the touch sensor is pressed
+
+    Every frame is logged in self.samples (a RingBuffer of x, y, width, height; width is 0 when nothing is seen).
+    """
+
+    CENTER_X = 160  # The Pixy picture is 320 pixels wide
+
+    def __init__(self, robot, read_block=None, rate_hz=50, turn_gain=2.5, max_turn_speed=400, dead_band=4,
+                 lead_seconds=0.04, lost_after=0.3, log_size=500):
+        """
+        read_block is a function that returns [x, y, width, height] of the signature 1 block (by default the Pixy
+        of the robot is read through ev3_sysfs in SIG1 mode, and stop closes its files).  turn_gain is the spin
+        speed (degrees per second) per pixel from the middle, and within dead_band pixels of the middle the robot
+        does not spin.
+
+        Type hints:
+          :type robot: Snatch3r
+          :type read_block: callable
+          :type rate_hz: float
+          :type turn_gain: float
+          :type lead_seconds: float
+          :type lost_after: float
+        """
+        self.robot = robot
+        self._read_block = read_block
+        self.rate_hz = rate_hz
+        self.x_filter = PositionFilter()
+        self.turn_gain = turn_gain
+        self.max_turn_speed = max_turn_speed
+        self.dead_band = dead_band
+        self.lead_seconds = lead_seconds
+        self.lost_after = lost_after
+        self.samples = RingBuffer(log_size, width=4)
+        self.last_seen = None
+        self.running = False
+        self.overruns = 0
+        self._readers = _SensorReaders()
+
+    def read_block(self):
+        if self._read_block is not None:
+            return self._read_block()
+        return self._readers.get("block", self.robot.pixy, "SIG1", 1, 5)()
+
+    def position(self, timestamp=None):
+        """
+        Returns the predicted x of the object at timestamp (default now), or None if it has not been seen lately.
+        Other threads can call this between Pixy frames.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.last_seen is None or timestamp - self.last_seen > self.lost_after:
+            return None
+        return self.x_filter.predict(timestamp)
+
+    def run(self, until=None, timeout=None):
+        """
+        Tracks the object until until() returns True (by default until the touch sensor is pressed), timeout
+        seconds have passed, or stop is called.  Then stops the drive motors.
+
+        Type hints:
+          :type until: callable
+          :type timeout: float | None
+        """
+        if until is None:
+            until = self._readers.get("touch", self.robot.touch_sensor, "TOUCH", 0)
+        self.x_filter.reset()
+        self.last_seen = None
+        self.running = True
+
+        timer = FixedRateTimer(self.rate_hz)
+        start_time = timer.start()
+        self._readers.start_using()
+        try:
+            while self.running:
+                now = time.monotonic()
+                block = self.read_block()
+                self.samples.append(now, block)
+                if block[2] > 0:
+                    self.x_filter.update(block[0], now)
+                    self.last_seen = now
+                target_x = self.position(now + self.lead_seconds)
+                if target_x is None:
+                    self._drive(0)
+                else:
+                    error = target_x - self.CENTER_X
+                    if abs(error) <= self.dead_band:
+                        error = 0
+                    self._drive(int(max(-self.max_turn_speed, min(self.max_turn_speed, self.turn_gain * error))))
+                if until() or (timeout is not None and now - start_time >= timeout):
+                    break
+                timer.wait()
+        finally:
+            self._readers.stop_using()
+        self.overruns += timer.overruns
+        self.robot.write_cache.stop(self.robot.left_motor)
+        self.robot.write_cache.stop(self.robot.right_motor)
+        self.running = False
+
+    def stop(self):
+        """
+        Makes run return (call it from another thread, like an MQTT message) and closes the sensor files it opened
+        (once run has returned).  They are opened again if the tracker is used again.
+        """
+        self.running = False
+        self._readers.close()
+
+    def _drive(self, turn_speed):
+        # A positive turn_speed spins right (the object is right of the middle).
+        self.robot.write_cache.run_forever(self.robot.left_motor, turn_speed)
+        self.robot.write_cache.run_forever(self.robot.right_motor, -turn_speed)
+
+
+class TrapezoidProfile(object):
+    """
+    The speed over time for a move of distance (in degrees of wheel rotation): speed up at acceleration, cruise at
+    max_speed, then slow down at acceleration to stop exactly at distance.  Short moves never reach max_speed (the
+    profile is a triangle).  distance may be negative.
+    """
+
+    def __init__(self, distance, max_speed, acceleration):
+        """
+        Type hints:
+          :type distance: float
+          :type max_speed: float
+          :type acceleration: float
+        """
+        self.distance = distance
+        self.acceleration = acceleration
+        self.direction = 1 if distance >= 0 else -1
+        self.ramp_time = max_speed / acceleration
+        ramp_distance = acceleration * self.ramp_time ** 2 / 2
+        if 2 * ramp_distance > abs(distance):
+            self.ramp_time = math.sqrt(abs(distance) / acceleration)
+            ramp_distance = abs(distance) / 2
+        self.peak_speed = acceleration * self.ramp_time
+        self.cruise_time = (abs(distance) - 2 * ramp_distance) / self.peak_speed if self.peak_speed else 0.0
+        self.duration = 2 * self.ramp_time + self.cruise_time
+
+    def speed(self, t):
+        """The speed (degrees per second) t seconds after the start."""
+        if t <= 0 or t >= self.duration:
+            return 0.0
+        if t < self.ramp_time:
+            return self.direction * self.acceleration * t
+        if t < self.ramp_time + self.cruise_time:
+            return self.direction * self.peak_speed
+        return self.direction * self.acceleration * (self.duration - t)
+
+    def position(self, t):
+        """How far (degrees) the wheel should have turned t seconds after the start."""
+        if t <= 0:
+            return 0.0
+        if t >= self.duration:
+            return self.distance
+        if t < self.ramp_time:
+            return self.direction * self.acceleration * t ** 2 / 2
+        ramp_distance = self.acceleration * self.ramp_time ** 2 / 2
+        if t < self.ramp_time + self.cruise_time:
+            return self.direction * (ramp_distance + self.peak_speed * (t - self.ramp_time))
+        time_left = self.duration - t
+        return self.distance - self.direction * self.acceleration * time_left ** 2 / 2
+
+
+class MotionPlanner(object):
+    """
+    Drives a list of drive and turn segments as one continuous motion.  Each segment gets a TrapezoidProfile, and
+    the next segment starts blend_time seconds before the previous one has slowed down to a stop (the two speeds
+    are added while they overlap), so the robot rounds each corner instead of stopping at it.  A background loop
+    streams the planned wheel speeds to both motors at a fixed rate, corrected by how far each wheel is from its
+    planned position.
+
+      motion_planner = MotionPlanner(robot, speed=600)
+      for k in range(4):
+          motion_planner.add_drive(12)
+          motion_planner.add_turn(90)
+      seconds = motion_planner.run()
+
+    The wheels turn exactly as far in total as with drive_inches and turn_degrees (90 degrees per inch, 4.5 per
+    degree of turn), but the blended corners are rounded, so use blend_time=0 to drive sharp corners.
+    """
+
+    def __init__(self, robot, speed=600, acceleration=3000, blend_time=0.2, rate_hz=50, position_gain=5.0):
+        """
+        speed is the top wheel speed and acceleration the wheel acceleration (degrees per second, per second).
+        position_gain is the extra speed (degrees per second) for each degree a wheel is behind its plan.
+
+        Type hints:
+          :type robot: Snatch3r
+          :type speed: float
+          :type acceleration: float
+          :type blend_time: float
+          :type rate_hz: float
+          :type position_gain: float
+        """
+        self.robot = robot
+        self.speed = speed
+        self.acceleration = acceleration
+        self.blend_time = blend_time
+        self.rate_hz = rate_hz
+        self.position_gain = position_gain
+        self.segments = []  # (left wheel direction, right wheel direction, TrapezoidProfile)
+        self.running = False
+        self.last_duration = None  # Seconds the last run took
+
+    def add_drive(self, inches, speed=None):
+        """Adds driving straight (backwards for negative inches)."""
+        profile = TrapezoidProfile(inches * 90, speed or self.speed, self.acceleration)
+        self.segments.append((1, 1, profile))
+
+    def add_turn(self, degrees, speed=None):
+        """Adds turning in place, in the same direction as turn_degrees."""
+        profile = TrapezoidProfile(degrees * 4.5, speed or self.speed, self.acceleration)
+        self.segments.append((1, -1, profile))
+
+    def clear(self):
+        self.segments = []
+
+    def plan(self):
+        """
+        Returns the list of (start time, segment) and the total planned time in seconds.
+
+        Type hints:
+          :rtype: (list, float)
+        """
+        planned = []
+        start_time = 0.0
+        previous = None
+        for segment in self.segments:
+            if previous is not None:
+                # Overlap no more than the slowing down of the previous and the speeding up of the next segment.
+                blend = min(self.blend_time, previous.ramp_time, segment[2].ramp_time)
+                start_time += previous.duration - blend
+            planned.append((start_time, segment))
+            previous = segment[2]
+        if not planned:
+            return planned, 0.0
+        return planned, max(start + segment[2].duration for start, segment in planned)
+
+    def run(self, settle_time=0.3):
+        """
+        Drives all the segments and returns the seconds it took.  After the plan ends the wheels get up to
+        settle_time seconds to reach their final positions, then they brake.  The segments are cleared.
+
+        Type hints:
+          :type settle_time: float
+          :rtype: float
+        """
+        left_motor = self.robot.left_motor
+        right_motor = self.robot.right_motor
+        write_cache = self.robot.write_cache
+        max_speed = self.robot.MAX_SPEED
+        planned, total_time = self.plan()
+        self.clear()
+        write_cache.invalidate(left_motor)
+        write_cache.invalidate(right_motor)
+        left_start = left_motor.position
+        right_start = right_motor.position
+        self.running = True
+
+        timer = FixedRateTimer(self.rate_hz)
+        start_time = timer.start()
+        while self.running:
+            t = time.monotonic() - start_time
+            left_target = right_target = left_speed = right_speed = 0.0
+            for start, (left_direction, right_direction, profile) in planned:
+                if start > t:
+                    break
+                position = profile.position(t - start)
+                speed = profile.speed(t - start)
+                left_target += left_direction * position
+                right_target += right_direction * position
+                left_speed += left_direction * speed
+                right_speed += right_direction * speed
+            left_error = left_target - (left_motor.position - left_start)
+            right_error = right_target - (right_motor.position - right_start)
+            if t >= total_time and (t >= total_time + settle_time or max(abs(left_error), abs(right_error)) < 2):
+                break
+            left_speed += self.position_gain * left_error
+            right_speed += self.position_gain * right_error
+            write_cache.run_forever(left_motor, int(max(-max_speed, min(max_speed, left_speed))))
+            write_cache.run_forever(right_motor, int(max(-max_speed, min(max_speed, right_speed))))
+            timer.wait()
+        write_cache.stop(left_motor)
+        write_cache.stop(right_motor)
+        self.running = False
+        self.last_duration = time.monotonic() - start_time
+        return self.last_duration
+
+    def stop(self):
+        """Makes run return (call it from another thread, like an MQTT message)."""
+        self.running = False
+
+
+class Odometry(object):
+    """
+    Keeps track of where the robot is by adding up how far each wheel has turned, on a background thread at a
+    fixed rate.  The pose is (x, y, heading): x and y in inches from where the robot was when the odometry
+    started (x is straight ahead at the start, y is to the left), heading in degrees counterclockwise.
+
+      odometry = robot.start_odometry()
+      x, y, heading = odometry.pose()
+      robot.go_to(24, 12)  # Drives straight to 24 inches ahead and 12 inches to the left of the start
+      recent = odometry.history.window(50)  # The newest 50 (timestamp, (x, y, heading)) poses
+
+    Wheel slip is not noticed, so the pose slowly gets less accurate.  Call reset when the robot is at a known
+    spot (like a line or the beacon) to fix it.
+    """
+
+    WHEEL_DEGREES_PER_INCH = 90  # Like drive_inches
+    WHEEL_BASE = 5.73  # inches, from turn_degrees turning the wheels 4.5 degrees per degree of robot turn
+
+    def __init__(self, robot, rate_hz=50, history_size=500):
+        """
+        Type hints:
+          :type robot: Snatch3r
+          :type rate_hz: float
+          :type history_size: int
+        """
+        self.robot = robot
+        self.rate_hz = rate_hz
+        self.history = RingBuffer(history_size, width=3)
+        self.x = 0.0
+        self.y = 0.0
+        self.heading = 0.0  # radians
+        self._lock = threading.Lock()
+        self._read_left = self._position_reader(robot.left_motor)
+        self._read_right = self._position_reader(robot.right_motor)
+        self._left_position = self._read_left()
+        self._right_position = self._read_right()
+        self._running = False
+        self._thread = None
+
+    @staticmethod
+    def _position_reader(motor):
+        """Returns a function that reads the position of the motor, from an open sysfs file if possible."""
+        motor_path = getattr(motor, "_path", None)
+        if motor_path and os.path.isdir(motor_path):
+            return ev3_sysfs.SysfsAttribute(os.path.join(motor_path, "position")).read_int
+        return lambda: motor.position
+
+    def pose(self):
+        """Returns (x, y, heading) with x and y in inches and the heading in degrees."""
+        with self._lock:
+            return self.x, self.y, math.degrees(self.heading)
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        """Sets the pose (heading in degrees), for example when the robot is at a known spot."""
+        with self._lock:
+            self.x = x
+            self.y = y
+            self.heading = math.radians(heading)
+
+    def update(self):
+        """Reads the wheel positions and moves the pose (the background thread calls this, rate_hz times a second)."""
+        left_position = self._read_left()
+        right_position = self._read_right()
+        left = (left_position - self._left_position) / self.WHEEL_DEGREES_PER_INCH
+        right = (right_position - self._right_position) / self.WHEEL_DEGREES_PER_INCH
+        self._left_position = left_position
+        self._right_position = right_position
+        turn = (right - left) / self.WHEEL_BASE
+        with self._lock:
+            # Move along the average heading of this step, which is more accurate on curves.
+            middle_heading = self.heading + turn / 2
+            self.x += (left + right) / 2 * math.cos(middle_heading)
+            self.y += (left + right) / 2 * math.sin(middle_heading)
+            self.heading += turn
+            pose = (self.x, self.y, math.degrees(self.heading))
+        self.history.append(time.monotonic(), pose)
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        timer = FixedRateTimer(self.rate_hz)
+        timer.start()
+        while self._running:
+            self.update()
+            timer.wait()
+
+    def heading_to(self, x, y):
+        """Returns (degrees to turn counterclockwise to face x, y (-180 to 180), inches to x, y)."""
+        current_x, current_y, heading = self.pose()
+        target_heading = math.degrees(math.atan2(y - current_y, x - current_x))
+        turn = (target_heading - heading + 180) % 360 - 180
+        return turn, math.hypot(x - current_x, y - current_y)
+
+
+def lazy_device(name, make_device):
+    """
+    Returns a property for a Snatch3r device that is only made (by calling make_device) the first time it is used,
+    so programs don't pay for (or fail on) devices they never use.  Setting the property replaces the device.
+    """
+
+    def get_device(robot):
+        devices = robot.__dict__.setdefault("_devices", {})
+        device = devices.get(name)
+        if device is None:
+            device = make_device()
+            devices[name] = device
+        return device
+
+    def set_device(robot, device):
+        robot.__dict__.setdefault("_devices", {})[name] = device
+
+    return property(get_device, set_device, doc="The {} (made the first time it is used)".format(name))
 
 
 class Snatch3r(object):
     """Commands for the Snatch3r robot that might be useful in many different programs."""
 
-    def __init__(self):
-        self.left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
-        self.right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
+    # Each device is made the first time it is used (see lazy_device).  Call warm_up to make them all right away.
+    DEVICE_NAMES = ["left_motor", "right_motor", "arm_motor", "touch_sensor", "color_sensor", "ir_sensor", "pixy"]
+    left_motor = lazy_device("left_motor", lambda: ev3.LargeMotor(ev3.OUTPUT_B))
+    right_motor = lazy_device("right_motor", lambda: ev3.LargeMotor(ev3.OUTPUT_C))
+    arm_motor = lazy_device("arm_motor", lambda: ev3.MediumMotor(ev3.OUTPUT_A))
+    touch_sensor = lazy_device("touch_sensor", lambda: ev3.TouchSensor())
+    color_sensor = lazy_device("color_sensor", lambda: ev3.ColorSensor())
+    ir_sensor = lazy_device("ir_sensor", lambda: ev3.InfraredSensor())
+    pixy = lazy_device("pixy", lambda: ev3.Sensor(driver_name="pixy-lego"))
 
-        self.arm_motor = ev3.MediumMotor(ev3.OUTPUT_A)
-        self.touch_sensor = ev3.TouchSensor()
+    def __init__(self):
         self.MAX_SPEED = 900
 
         self.running = True
 
-        self.color_sensor = ev3.ColorSensor()
-        assert self.color_sensor
-
-        self.ir_sensor = ev3.InfraredSensor()
-        assert self.ir_sensor
+        self.motion_monitor = None  # Made the first time an *_async motion method is used
+        self.write_cache = WriteCache()  # Skips repeated drive motor and LED commands
+        self.sampler = None  # Made by start_sampler
+        self.line_follower = None  # Made by calibrate_line or follow_line
+        self.beacon_homing = None  # Made by seek_beacon
+        self.pixy_tracker = None  # Made by track_color
+        self.motion_planner = None  # Made by drive_polygon(blend=True)
+        self.odometry = None  # Made by start_odometry
+        self.sounds = None  # The sound_queue.default_queue(), saved the first time a sound is played
+        self._stop_seeking = threading.Event()  # Set by stop and shutdown to end seek_beacon (it retries until then)
 
-        self.pixy = ev3.Sensor(driver_name="pixy-lego")
-        assert self.pixy
 
+    def warm_up(self):
+        """
+        Makes every device now instead of the first time it is used, and returns the names of the devices that
+        are not connected.
+        """
+        return [name for name in self.DEVICE_NAMES if not getattr(self, name).connected]
 
     def drive_inches(self, inches_target, speed_deg_per_second):
         """Allows the robot to drive to a target distance at a given speed"""
+        self._start_drive_inches(inches_target, speed_deg_per_second)
+        self.left_motor.wait_while(ev3.Motor.STATE_RUNNING)
+
+    def turn_degrees(self, degrees_to_turn, turn_speed_sp):
+        """Causes the robot to turn a set number of degrees."""
+        self._start_turn_degrees(degrees_to_turn, turn_speed_sp)
+        self.right_motor.wait_while(ev3.Motor.STATE_RUNNING)
+
+    def drive_polygon(self, number_of_sides, speed, edge_length_in, blend=False):
+        """
+        Makes a polygon with the given number of sides at the given speed, stopping after every side and turn.
+        With blend=True the sides and turns are driven as one continuous motion by the MotionPlanner instead, which
+        is faster but rounds the corners a little (so the robot ends up a bit off the starting point), and the
+        seconds it took are returned.
+        """
+        if not blend:
+            for k in range(number_of_sides):
+                self.drive_inches(edge_length_in, speed)
+                self.turn_degrees(360 / number_of_sides, speed)
+            return
+        motion_planner = self._get_motion_planner()
+        for k in range(number_of_sides):
+            motion_planner.add_drive(edge_length_in, speed)
+            motion_planner.add_turn(360 / number_of_sides, speed)
+        return motion_planner.run()
+
+    def drive_inches_async(self, inches_target, speed_deg_per_second):
+        """Starts driving a target distance and returns a MotionHandle right away (does not wait)"""
+        return self._start_motion([lambda: self._start_drive_inches(inches_target, speed_deg_per_second)])
+
+    def turn_degrees_async(self, degrees_to_turn, turn_speed_sp):
+        """Starts turning a set number of degrees and returns a MotionHandle right away (does not wait)"""
+        return self._start_motion([lambda: self._start_turn_degrees(degrees_to_turn, turn_speed_sp)])
+
+    def drive_polygon_async(self, number_of_sides, speed, edge_length_in):
+        """Starts driving a polygon and returns one MotionHandle for the whole polygon right away (does not wait)"""
+        steps = []
+        for k in range(number_of_sides):
+            steps.append(lambda: self._start_drive_inches(edge_length_in, speed))
+            steps.append(lambda: self._start_turn_degrees(360 / number_of_sides, speed))
+        return self._start_motion(steps)
+
+    def start_sampler(self, color_hz=50, ir_hz=20, touch_hz=50, pixy_hz=25, capacity=100):
+        """
+        Starts a SensorSampler that reads the sensors in the background at the given rates (set a rate to None
+        to skip that sensor) and returns it.  Channels: "color" (reflected light intensity), "ir" (proximity),
+        "touch" (1 if pressed), and "pixy" (SIG1 x, y, width, height).  The sampler is also saved in self.sampler.
+        Note: the IR channel uses proximity mode, so don't sample it while using a BeaconSeeker.
+        """
+        if self.sampler:
+            self.sampler.stop()
+        self.sampler = SensorSampler(capacity)
+        # The sampler closes the sysfs files of its readers when it stops (a new sampler opens new ones).
+        if color_hz:
+            read, close = self._open_sensor_reader(self.color_sensor, "COL-REFLECT", 0)
+            self.sampler.add_channel("color", read, color_hz, close=close)
+        if ir_hz:
+            read, close = self._open_sensor_reader(self.ir_sensor, "IR-PROX", 0)
+            self.sampler.add_channel("ir", read, ir_hz, close=close)
+        if touch_hz:
+            read, close = self._open_sensor_reader(self.touch_sensor, "TOUCH", 0)
+            self.sampler.add_channel("touch", read, touch_hz, close=close)
+        if pixy_hz:
+            read, close = self._open_sensor_reader(self.pixy, "SIG1", 1, 5)
+            self.sampler.add_channel("pixy", read, pixy_hz, width=4, close=close)
+        self.sampler.start()
+        return self.sampler
+
+    @staticmethod
+    def fast_sensor_reader(sensor, mode, first_value, end_value=None):
+        """
+        Sets the sensor mode and returns a function that reads value(first_value) (or the list of values from
+        first_value up to but not including end_value) using the open sysfs files from the ev3_sysfs module.
+        Falls back to sensor.value(k) if the sensor has no sysfs files.  Don't change the mode after this.
+        The files stay open while the function exists, so make one reader and keep it (don't make one per loop).
+        """
+        return Snatch3r._open_sensor_reader(sensor, mode, first_value, end_value)[0]
+
+    @staticmethod
+    def _open_sensor_reader(sensor, mode, first_value, end_value=None):
+        """Like fast_sensor_reader, but returns (read function, close function or None to close its files)."""
+        sensor.mode = mode
+        count = end_value if end_value is not None else first_value + 1
+        sensor_values = ev3_sysfs.SensorValues.for_device(sensor, count)
+        if end_value is None:
+            if sensor_values:
+                return lambda: sensor_values.read()[first_value], sensor_values.close
+            return lambda: sensor.value(first_value), None
+        if sensor_values:
+            return lambda: sensor_values.read()[first_value:end_value].tolist(), sensor_values.close
+        return lambda: [sensor.value(k) for k in range(first_value, end_value)], None
+
+    def calibrate_line(self):
+        """
+        Finds the white and black levels for follow_line.  Place the color sensor on the edge of the line first,
+        the robot turns a little each way.  Returns (white_level, black_level).
+        """
+        return self._get_line_follower().calibrate()
+
+    def follow_line(self, speed=400, side="left", until=None, timeout=None, white_level=None, black_level=None):
+        """
+        Follows the edge of a black line with a PID loop (see LineFollower) until until() returns True (by default
+        until the touch sensor is pressed) or timeout seconds pass.  Calibrates first if needed, unless white_level
+        and black_level are given.  Returns the number of seconds it followed the line.
+        """
+        line_follower = self._get_line_follower()
+        if white_level is not None and black_level is not None:
+            line_follower.white_level = white_level
+            line_follower.black_level = black_level
+        line_follower.speed = speed
+        line_follower.side = side
+        return line_follower.run(until, timeout)
+
+    def _get_line_follower(self):
+        if self.line_follower is None:
+            self.line_follower = LineFollower(self)
+        return self.line_follower
+
+    def track_color(self, until=None, timeout=None):
+        """
+        Spins to keep facing the object the Pixy sees as signature 1 (see PixyTracker) until until() returns True
+        (by default until the touch sensor is pressed) or timeout seconds pass.
+        """
+        if self.pixy_tracker is None:
+            self.pixy_tracker = PixyTracker(self)
+        self.pixy_tracker.run(until, timeout)
+
+    def start_odometry(self, rate_hz=50):
+        """
+        Starts keeping track of where the robot is (see Odometry), from where it is now, and returns the Odometry.
+        The odometry is also saved in self.odometry.
+        """
+        if self.odometry:
+            self.odometry.stop()
+        self.odometry = Odometry(self, rate_hz)
+        self.odometry.start()
+        return self.odometry
+
+    def go_to(self, x, y, speed=400, tolerance=0.5):
+        """
+        Turns toward the spot (x, y) in inches (from where start_odometry was called, x straight ahead and y to
+        the left) and drives straight to it.  Starts the odometry first if needed.  If the robot ends up more than
+        tolerance inches away, it tries again (twice at most).  Returns the final pose (x, y, heading).
+        """
+        if self.odometry is None:
+            self.start_odometry()
+        motion_planner = self._get_motion_planner()
+        for attempt in range(3):
+            turn, distance = self.odometry.heading_to(x, y)
+            if distance <= tolerance:
+                break
+            motion_planner.add_turn(-turn, speed)  # turn_degrees turns clockwise for positive degrees
+            motion_planner.add_drive(distance, speed)
+            motion_planner.run()
+            time.sleep(2 / self.odometry.rate_hz)  # Let the odometry see the final wheel positions
+        return self.odometry.pose()
+
+    def speak(self, text, priority=sound_queue.SoundQueue.NORMAL, interrupt=False):
+        """
+        Says the text without waiting (see sound_queue.SoundQueue.speak).  The WAV file of the text is made once and
+        kept, so fixed phrases start right away after the first time.  Returns a SoundRequest, call its wait() to
+        wait until it has been said.
+        """
+        return self._get_sounds().speak(text, priority, interrupt)
+
+    def _get_sounds(self):
+        if self.sounds is None:
+            self.sounds = sound_queue.default_queue()
+        return self.sounds
+
+    def _get_motion_planner(self):
+        if self.motion_planner is None:
+            self.motion_planner = MotionPlanner(self)
+        return self.motion_planner
+
+    def _get_beacon_homing(self):
+        if self.beacon_homing is None:
+            self.beacon_homing = BeaconHoming(self)
+        return self.beacon_homing
+
+    def _start_motion(self, steps):
+        if self.motion_monitor is None:
+            self.motion_monitor = MotionMonitor()
+        return self.motion_monitor.start(steps)
+
+    def _start_drive_inches(self, inches_target, speed_deg_per_second):
+        """Starts the drive motors for drive_inches and returns the motors that are moving"""
+        self.write_cache.invalidate(self.left_motor)
+        self.write_cache.invalidate(self.right_motor)
         self.left_motor.run_to_rel_pos(speed_sp=speed_deg_per_second, position_sp=inches_target * 90,
                                        stop_action='brake')
         self.right_motor.run_to_rel_pos(speed_sp=speed_deg_per_second, position_sp=inches_target * 90,
                                         stop_action='brake')
+        return [self.left_motor, self.right_motor]
 
-        self.left_motor.wait_while(ev3.Motor.STATE_RUNNING)
-
-    def turn_degrees(self, degrees_to_turn, turn_speed_sp):
-        """Causes the robot to turn a set number of degrees."""
+    def _start_turn_degrees(self, degrees_to_turn, turn_speed_sp):
+        """Starts the drive motors for turn_degrees and returns the motors that are moving"""
+        self.write_cache.invalidate(self.left_motor)
+        self.write_cache.invalidate(self.right_motor)
 
         # Left Turn
         if degrees_to_turn > 0:
@@ -62,14 +1646,7 @@ class Snatch3r(object):
             self.left_motor.run_to_rel_pos(speed_sp=turn_speed_sp, position_sp=degrees_to_turn*4.5)
             self.right_motor.run_to_rel_pos(speed_sp=turn_speed_sp, position_sp=degrees_to_turn*-4.5)
 
-        self.right_motor.wait_while(ev3.Motor.STATE_RUNNING)
-
-    def drive_polygon(self, number_of_sides, speed, edge_length_in):
-        """Makes a polygon with the given number of sides at the given speed"""
-
-        for k in range(number_of_sides):
-            self.drive_inches(edge_length_in, speed)
-            self.turn_degrees(360/number_of_sides, speed)
+        return [self.left_motor, self.right_motor]
 
     def arm_calibration(self, state):
         """Resets the position of the arm to be in the down position"""
@@ -78,7 +1655,7 @@ class Snatch3r(object):
             while not self.touch_sensor.is_pressed:
                 time.sleep(1.00)
             self.arm_motor.stop(stop_action="brake")
-            ev3.Sound.beep().wait()
+            self._get_sounds().beep()
 
             arm_revolutions_for_full_range = 14.2 * 360
             self.arm_motor.run_to_rel_pos(position_sp=-arm_revolutions_for_full_range)
@@ -93,29 +1670,35 @@ class Snatch3r(object):
             time.sleep(0.01)
         self.arm_motor.stop(stop_action="brake")
 
-        ev3.Sound.beep().wait()
+        self._get_sounds().beep()
 
     def arm_down(self):
         """Repositions the arm to be in the down state"""
         self.arm_motor.run_to_abs_pos(position_sp=0, speed_sp=self.MAX_SPEED)
         self.arm_motor.wait_while(ev3.Motor.STATE_RUNNING)  # Blocks until the motor finishes running
 
-        ev3.Sound.beep().wait()
+        self._get_sounds().beep()
 
     def shutdown(self):
         """Stops all motors and exits the program"""
-        self.right_motor.stop(stop_action="brake")
-        self.left_motor.stop(stop_action="brake")
+        self._stop_controllers()
+        if self.sampler:
+            self.sampler.stop()
+        if self.odometry:
+            self.odometry.stop()
+        self.write_cache.invalidate()  # Always write everything when shutting down
+        self.write_cache.stop(self.right_motor)
+        self.write_cache.stop(self.left_motor)
 
-        ev3.Leds.set_color(ev3.Leds.RIGHT, ev3.Leds.GREEN)
-        ev3.Leds.set_color(ev3.Leds.LEFT, ev3.Leds.GREEN)
+        self.write_cache.set_led_color(ev3.Leds.RIGHT, ev3.Leds.GREEN)
+        self.write_cache.set_led_color(ev3.Leds.LEFT, ev3.Leds.GREEN)
 
         self.running = False
 
         print("--------------------------------------------")
         print(" Goodbye")
         print("--------------------------------------------")
-        ev3.Sound.speak("Goodbye").wait()
+        self.speak("Goodbye", sound_queue.SoundQueue.HIGH, interrupt=True)  # Still plays if the program ends now
 
     def loop_forever(self):
         # This is a convenience method that I don't really recommend for most programs other than m5.
@@ -128,109 +1711,100 @@ class Snatch3r(object):
 
     def forward(self, left_speed, right_speed):
         """Drives the robot forward"""
-        self.right_motor.run_forever(speed_sp=right_speed)
-        self.left_motor.run_forever(speed_sp=left_speed)
+        self.write_cache.run_forever(self.right_motor, right_speed)
+        self.write_cache.run_forever(self.left_motor, left_speed)
 
     def stop(self):
-        """Stops both motors"""
-        self.right_motor.stop(stop_action="brake")
-        self.left_motor.stop(stop_action="brake")
+        """
+        Stops both motors, and everything that drives them: follow_line, seek_beacon (and its retries),
+        track_color, drive_polygon(blend=True), go_to and the queued *_async motions.
+        """
+        self._stop_controllers()
+        self._stop_drive()
+
+    def _stop_controllers(self):
+        """Makes the control loops return (they stop their motors) and cancels the queued motions."""
+        self._stop_seeking.set()
+        if self.motion_monitor:
+            self.motion_monitor.cancel_all()
+        if self.line_follower:
+            self.line_follower.stop()
+        if self.beacon_homing:
+            self.beacon_homing.stop()
+        if self.pixy_tracker:
+            self.pixy_tracker.stop()
+        if self.motion_planner:
+            self.motion_planner.stop()
+
+    def _stop_drive(self):
+        """Stops both motors and turns the LEDs off, but leaves the control loops running."""
+        self.write_cache.stop(self.right_motor)
+        self.write_cache.stop(self.left_motor)
 
-        ev3.Leds.set_color(ev3.Leds.RIGHT, ev3.Leds.BLACK)
-        ev3.Leds.set_color(ev3.Leds.LEFT, ev3.Leds.BLACK)
+        self.write_cache.set_led_color(ev3.Leds.RIGHT, ev3.Leds.BLACK)
+        self.write_cache.set_led_color(ev3.Leds.LEFT, ev3.Leds.BLACK)
 
     def left(self, left_speed):
         """turns the robot left"""
-        self.left_motor.run_forever(speed_sp=-left_speed)
-        self.right_motor.run_forever(speed_sp=left_speed)
+        self.write_cache.run_forever(self.left_motor, -left_speed)
+        self.write_cache.run_forever(self.right_motor, left_speed)
 
     def right(self, right_speed):
         """Turns the robot right"""
-        self.right_motor.run_forever(speed_sp=-right_speed)
-        self.left_motor.run_forever(speed_sp=right_speed)
+        self.write_cache.run_forever(self.right_motor, -right_speed)
+        self.write_cache.run_forever(self.left_motor, right_speed)
 
     def back(self, left_speed, right_speed):
         """Drives the robot backward"""
-        self.right_motor.run_forever(speed_sp=-right_speed)
-        self.left_motor.run_forever(speed_sp=-left_speed)
+        self.write_cache.run_forever(self.right_motor, -right_speed)
+        self.write_cache.run_forever(self.left_motor, -left_speed)
 
     def seek_beacon(self):
+        """
+        Drives to the beacon and picks it up.  An attempt aborted with the touch sensor is tried again, until the
+        beacon is picked up or shutdown is called.  Returns True if the beacon was picked up.
+        """
         print("--------------------------------------------")
         print(" Beacon pickup")
         print("--------------------------------------------")
-        ev3.Sound.speak("Beacon pickup")
+        self.speak("Beacon pickup")
 
+        self._stop_seeking.clear()
+        beacon_homing = self._get_beacon_homing()
+        # Checked by the homing loop too, so a shutdown between two attempts still stops the next one.
+        until = lambda: self._stop_seeking.is_set() or beacon_homing.touch_pressed()
         try:
-            while True:
-                if seek_beacon(self) is True:
-                    break
+            while not self._stop_seeking.is_set():
+                if seek_beacon(self, until) is True:
+                    return True
 
         except:
             traceback.print_exc()
-            ev3.Sound.speak("Error")
+            self.speak("Error", sound_queue.SoundQueue.HIGH, interrupt=True)
+        return False
 
 
-def seek_beacon(robot):
+def seek_beacon(robot, until=None):
     """
     Uses the IR Sensor in BeaconSeeker mode to find the beacon.  If the beacon is found this return True.
     If the beacon is not found and the attempt is cancelled by hitting the touch sensor, return False.
+    The driving is done by the BeaconHoming controller of the robot, see robot.beacon_homing.metrics() for how
+    long it took.  until replaces the touch sensor check of the attempt (see BeaconHoming.run).
 
     Type hints:
       :type robot: robo.Snatch3r
+      :type until: callable | None
       :rtype: bool
     """
-
-    # DONE: 2. Create a BeaconSeeker object on channel 1.
-    beacon_seeker = ev3.BeaconSeeker()
-
-    forward_speed = 300
-    turn_speed = 100
-
-    while not robot.touch_sensor.is_pressed:
-        # The touch sensor can be used to abort the attempt (sometimes handy during testing)
-
-        # DONE: 3. Use the beacon_seeker object to get the current heading and distance.
-        current_distance = beacon_seeker.distance  # use the beacon_seeker distance
-        while current_distance == -128:
-            current_distance = beacon_seeker.distance
-            # If the IR Remote is not found just sit idle for this program until it is moved.
-            print("IR Remote not found. Distance is -128")
-            robot.right(100)
-        else:
-            current_heading = beacon_seeker.heading  # use the beacon_seeker heading
-            current_distance = beacon_seeker.distance
-            if math.fabs(current_heading) < 2:
-                # Close enough of a heading to move forward
-                print("On the right heading. Distance: ", current_distance)
-                # You add more!
-                if current_distance <= 1:
-                    time.sleep(0.6)
-                    robot.stop()
-                    robot.arm_up()
-                    time.sleep(1)
-                    # robot.arm_down()
-                    # Commented out for grabbing an item and taking it to the house, then putting it down separately
-
-                    return True
-                if current_distance > 1:
-                    robot.forward(forward_speed, forward_speed)
-
-            if math.fabs(current_heading) > 2 and math.fabs(current_heading) < 10:
-                print("Adjusting Heading: ", current_heading)
-                if current_heading < 0:
-                    robot.left(turn_speed)
-                if current_heading > 0:
-                    robot.right(turn_speed)
-
-            if math.fabs(current_heading) > 10:
-                robot.forward(100, 100)
-                time.sleep(0.5)
-                robot.stop()
-                print("Heading too far off!")
-
-        time.sleep(0.2)
+    if robot._get_beacon_homing().run(until):
+        print("Found the beacon in {:.1f} seconds".format(robot.beacon_homing.time_to_pickup))
+        robot._stop_drive()
+        robot.arm_up()
+        # robot.arm_down()
+        # Commented out for grabbing an item and taking it to the house, then putting it down separately
+        return True
 
     # The touch_sensor was pressed to abort the attempt if this code runs.
     print("Abandon ship!")
-    robot.stop()
+    robot._stop_drive()  # Not robot.stop(), that would also end the retries of Snatch3r.seek_beacon
     return False
@@ -0,0 +1,296 @@
+"""
+  Keeps a Snatch3r ready in a process that stays running, so programs can use the robot without waiting for the
+  ev3dev imports and the device setup every time they start.  On the EV3 that saves a few seconds per program.
+
+  Start the server once (for example in a second ssh window):
+    python3 /home/robot/csse120/libs/robot_server.py
+
+  Then in your programs:
+    import robot_server
+
+    robot = robot_server.get_robot()  # The server's robot if the server is running, otherwise a new Snatch3r
+    robot.forward(300, 300)
+    print(robot.color_sensor.reflected_light_intensity)
+
+  Through the server every Snatch3r method call, attribute read and attribute assignment is sent over a Unix socket
+  (with the marshal module, which needs no imports, unlike json) and the result is sent back, so the parameters and
+  return values need to be numbers, strings, lists, tuples, dictionaries, True/False or None (other return values come
+  back as text).  Attributes that are objects (like robot.touch_sensor) come back as proxies too, so
+  robot.touch_sensor.is_pressed and robot.touch_sensor.wait_for_pressed() work, and robot.running = False sets running
+  on the server's robot.  Each attribute read asks the server, so save the value in a variable instead of reading it
+  twice.  get("name.name") reads an attribute in one request.  Only the user that started the server can connect.  This
+  module does not import ev3dev itself (only when it has to make a Snatch3r), so importing it is fast.
+"""
+
+import marshal
+import os
+import socket
+import struct
+import sys
+import threading
+
+SOCKET_PATH = "/tmp/snatch3r.sock"
+_LENGTH = struct.Struct("<I")  # Every message is its length, then that many bytes of marshal data
+
+
+class RobotServerError(Exception):
+    """The robot server could not run a call (the message is the error from the server)."""
+
+
+class RobotProxy(object):
+    """Looks like a Snatch3r, but sends every method call, attribute read and attribute assignment to the server."""
+
+    def __init__(self, path=SOCKET_PATH):
+        """
+        Type hints:
+          :type path: str
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._lock = threading.Lock()
+        self._kinds = {}  # attribute path --> "method" or "object" (those don't change, values are read every time)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._lookup(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)  # The proxy's own attributes
+        else:
+            self.set(name, value)
+
+    def get(self, path):
+        """
+        Returns the value of an attribute of the robot, like get("MAX_SPEED") or get("touch_sensor.is_pressed").
+
+        Type hints:
+          :type path: str
+        """
+        return self._request({"get": path})
+
+    def set(self, path, value):
+        """
+        Sets an attribute of the robot, like set("running", False) or set("beacon_homing.running", False).
+
+        Type hints:
+          :type path: str
+        """
+        self._request({"set": path, "value": value})
+
+    def close(self):
+        self._socket.close()
+
+    def _lookup(self, path):
+        """Returns the value of the attribute at path, or a function or _RemoteObject if it is a method or object."""
+        kind = self._kinds.get(path)
+        if kind is None:
+            kind, value = self._request({"lookup": path})
+            if kind == "value":
+                return value
+            self._kinds[path] = kind
+        if kind == "object":
+            return _RemoteObject(self, path)
+
+        def call_method(*args, **kwargs):
+            return self._request({"call": path, "args": args, "kwargs": kwargs})
+
+        call_method.__name__ = path.rpartition(".")[2]
+        return call_method
+
+    def _request(self, message):
+        with self._lock:
+            _send(self._socket, message)
+            reply = _receive(self._socket)
+        if reply is None:
+            raise RobotServerError("The robot server closed the connection")
+        if "error" in reply:
+            raise RobotServerError(reply["error"])
+        return reply["result"]
+
+
+class _RemoteObject(object):
+    """An attribute of the server's robot that is an object (like robot.touch_sensor), its attributes are proxied."""
+
+    def __init__(self, proxy, path):
+        """
+        Type hints:
+          :type proxy: RobotProxy
+          :type path: str
+        """
+        self._proxy = proxy
+        self._path = path
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._proxy._lookup(self._path + "." + name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            self._proxy.set(self._path + "." + name, value)
+
+
+def connect(path=SOCKET_PATH):
+    """
+    Returns a RobotProxy for the robot server (raises OSError if the server is not running).
+
+    Type hints:
+      :rtype: RobotProxy
+    """
+    return RobotProxy(path)
+
+
+def get_robot(path=SOCKET_PATH):
+    """
+    Returns a RobotProxy if the robot server is running, otherwise a new robot_controller.Snatch3r.
+
+    Type hints:
+      :rtype: RobotProxy | robot_controller.Snatch3r
+    """
+    try:
+        return connect(path)
+    except OSError:
+        import robot_controller
+        return robot_controller.Snatch3r()
+
+
+class RobotServer(object):
+    """Runs the calls from RobotProxy objects on one robot.  Each connection is handled on its own thread."""
+
+    def __init__(self, robot, path=SOCKET_PATH):
+        """
+        Type hints:
+          :type robot: robot_controller.Snatch3r
+          :type path: str
+        """
+        self.robot = robot
+        self.path = path
+        self.running = False
+        self._listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Left over from a server that did not stop cleanly
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # Makes the socket file 0o600 from the start, so no one else can connect
+        try:
+            self._listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self._listener.listen(5)
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    connection = self._listener.accept()[0]
+                except OSError:
+                    break  # stop closed the listener
+                threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _handle(self, connection):
+        with connection:
+            while True:
+                message = _receive(connection)
+                if message is None:
+                    return
+                try:
+                    reply = {"result": self._execute(message)}
+                except Exception as error:
+                    import traceback
+                    traceback.print_exc()
+                    reply = {"error": "{}: {}".format(type(error).__name__, error)}
+                _send(connection, reply)
+
+    def _execute(self, message):
+        if "get" in message:
+            return self._resolve(message["get"])
+        if "lookup" in message:
+            value = self._resolve(message["lookup"])
+            if callable(value):
+                return "method", None
+            try:
+                marshal.dumps(value)
+            except ValueError:
+                return "object", None  # Like a sensor, the proxy asks for its attributes one at a time
+            return "value", value
+        if "set" in message:
+            parent_path, _, name = message["set"].rpartition(".")
+            if name.startswith("_"):
+                raise AttributeError(name)
+            setattr(self._resolve(parent_path) if parent_path else self.robot, name, message["value"])
+            return None
+        return self._resolve(message["call"])(*message["args"], **message["kwargs"])
+
+    def _resolve(self, path):
+        """Returns the attribute of the robot at a path like "touch_sensor.is_pressed"."""
+        value = self.robot
+        for name in path.split("."):
+            if name.startswith("_"):
+                raise AttributeError(name)
+            value = getattr(value, name)
+        return value
+
+
+def _send(sock, message):
+    try:
+        data = marshal.dumps(message)
+    except ValueError:
+        if "result" not in message:
+            raise ValueError("Only numbers, strings, lists, tuples, dictionaries, True/False and None can be sent "
+                             "to the robot server")
+        data = marshal.dumps({"result": repr(message["result"])})  # A result that can't be sent, send it as text
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _receive(sock):
+    """Returns the next message, or None if the other side closed the connection."""
+    header = _receive_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    data = _receive_exactly(sock, _LENGTH.unpack(header)[0])
+    if data is None:
+        return None
+    return marshal.loads(data)
+
+
+def _receive_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def main():
+    import robot_controller
+
+    path = sys.argv[1] if len(sys.argv) > 1 else SOCKET_PATH
+    robot = robot_controller.Snatch3r()
+    not_connected = robot.warm_up()
+    if not_connected:
+        print("Not connected:", ", ".join(not_connected))
+    print("Robot server ready on", path)
+    try:
+        RobotServer(robot, path).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
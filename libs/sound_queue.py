@@ -0,0 +1,305 @@
+"""
+  Plays sounds and speech in the background, so the program never waits for them.  ev3.Sound.speak("...").wait()
+  starts espeak every time (even for the same words) and stops the program until the sound is done, which is
+  seconds of motors and MQTT messages being ignored.
+
+  A SoundQueue plays one sound at a time on a background thread, and speak/play/beep return right away.  Speech is
+  made into a WAV file by espeak the first time, and the file is kept (see SpeechCache), so "Goodbye" only costs
+  aplay after the first time ever.  Each sound has a priority: higher priority sounds play first, and a sound
+  added with interrupt=True stops the sound that is playing (and throws away the queued ones) unless they have a
+  higher priority.
+
+  Example:
+    import sound_queue
+
+    sounds = sound_queue.default_queue()  # One queue for the whole program, the EV3 has one speaker
+    sounds.speak("Beacon pickup")  # Returns right away
+    sounds.speak("Ouch", priority=sound_queue.SoundQueue.HIGH, interrupt=True)
+    sounds.speak("Goodbye").wait()  # Waits (like ev3.Sound.speak("Goodbye").wait() did)
+
+  Queued sounds still play when the program ends (for up to exit_timeout seconds).
+"""
+
+import atexit
+import hashlib
+import heapq
+import os
+import re
+import subprocess
+import threading
+import traceback
+
+import ev3dev.ev3 as ev3
+
+SPEECH_FOLDER = os.getenv("EV3_SPEECH_CACHE", os.path.expanduser("~/.cache/ev3_speech"))
+ESPEAK_OPTIONS = "-a 200 -s 130"  # The same default as ev3.Sound.speak
+POLL_INTERVAL = 0.05  # seconds between checks of the sound that is playing
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+class SpeechCache(object):
+    """
+    Makes WAV files of spoken text with espeak and keeps them in a folder, named by the text and the espeak
+    options (the voice, speed, pitch and volume), so each phrase is only made once.
+    """
+
+    def __init__(self, folder=SPEECH_FOLDER, espeak="espeak"):
+        """
+        Type hints:
+          :type folder: str
+          :type espeak: str
+        """
+        self.folder = folder
+        self.espeak = espeak
+        self.available = True  # False once espeak turned out not to be installed
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, text, espeak_options=ESPEAK_OPTIONS):
+        """Returns the file name the WAV for this text and these options is kept in (it may not exist yet)."""
+        key = hashlib.sha1("{}\n{}".format(espeak_options, text).encode("utf-8")).hexdigest()[:16]
+        name = re.sub("[^a-z0-9]+", "_", text.lower()).strip("_")[:24] or "speech"
+        return os.path.join(self.folder, "{}-{}.wav".format(name, key))
+
+    def render(self, text, espeak_options=ESPEAK_OPTIONS):
+        """
+        Returns the path of the WAV file for the text, making it first if needed.  Returns None if espeak isn't
+        installed or fails (then use ev3.Sound.speak instead).
+
+        Type hints:
+          :type text: str
+          :type espeak_options: str
+          :rtype: str | None
+        """
+        path = self.path(text, espeak_options)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        if not self.available:
+            return None
+        self.misses += 1
+        os.makedirs(self.folder, exist_ok=True)
+        temporary_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        try:
+            returncode = subprocess.call([self.espeak] + espeak_options.split() + ["-w", temporary_path, text],
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            self.available = False
+            returncode = None
+        if returncode != 0 or not os.path.exists(temporary_path) or os.path.getsize(temporary_path) == 0:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return None
+        os.replace(temporary_path, path)  # Another program using the cache never sees half a file
+        return path
+
+
+class SoundRequest(object):
+    """A sound added to a SoundQueue.  Like the process ev3.Sound.speak returns, it has wait()."""
+
+    def __init__(self, kind, value, priority, espeak_options=ESPEAK_OPTIONS):
+        """
+        Type hints:
+          :type kind: str
+          :type priority: int
+        """
+        self.kind = kind  # "speak", "play" or "beep"
+        self.value = value  # The text, the WAV file or the beep arguments
+        self.priority = priority
+        self.espeak_options = espeak_options
+        self.played = False  # True if it played to the end (not dropped or interrupted)
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Waits until the sound has played (or was dropped).  Returns False if timeout seconds passed first."""
+        return self._done.wait(timeout)
+
+    def done(self):
+        return self._done.is_set()
+
+    def _finish(self, played):
+        self.played = played
+        self._done.set()
+
+
+class SoundQueue(object):
+    """
+    Plays sounds one at a time on a background thread, highest priority first (see the module docstring).  All
+    methods are safe to call from any thread, for example from MQTT delegate methods.
+    """
+
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+    def __init__(self, cache=None, max_queued=16, exit_timeout=10.0):
+        """
+        If more than max_queued sounds are waiting, the oldest one with the lowest priority is dropped.
+
+        Type hints:
+          :type cache: SpeechCache | None
+          :type max_queued: int
+          :type exit_timeout: float
+        """
+        self.cache = cache or SpeechCache()
+        self.max_queued = max_queued
+        self.exit_timeout = exit_timeout
+        self.played = 0
+        self.dropped = 0
+        self.interrupted = 0
+        self._queue = []  # heap of (-priority, sequence number, SoundRequest)
+        self._sequence = 0
+        self._current = None  # The SoundRequest being made or played
+        self._interrupt = False
+        self._condition = threading.Condition()
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self._finish_at_exit)
+
+    def speak(self, text, priority=NORMAL, interrupt=False, espeak_options=ESPEAK_OPTIONS):
+        """
+        Says the text and returns its SoundRequest right away.
+
+        Type hints:
+          :type text: str
+          :type priority: int
+          :type interrupt: bool
+          :type espeak_options: str
+          :rtype: SoundRequest
+        """
+        return self._add(SoundRequest("speak", text, priority, espeak_options), interrupt)
+
+    def play(self, wav_file, priority=NORMAL, interrupt=False):
+        """Plays a WAV file and returns its SoundRequest right away."""
+        return self._add(SoundRequest("play", wav_file, priority), interrupt)
+
+    def beep(self, args="", priority=NORMAL, interrupt=False):
+        """Beeps (args are the arguments of the beep program, see ev3.Sound.beep) and returns right away."""
+        return self._add(SoundRequest("beep", args, priority), interrupt)
+
+    def prerender(self, texts, espeak_options=ESPEAK_OPTIONS):
+        """Makes the WAV files for the texts on a background thread, so they play right away the first time too."""
+        thread = threading.Thread(target=lambda: [self.cache.render(text, espeak_options) for text in texts],
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """Stops the sound that is playing and throws away the queued ones."""
+        with self._condition:
+            self._drop(lambda request: True)
+            if self._current is not None:
+                self._interrupt = True
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Waits until every queued sound has played.  Returns False if timeout seconds passed first."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and self._current is None, timeout)
+
+    def close(self):
+        """Stops the sound that is playing, throws away the queued ones, and stops the background thread."""
+        self.clear()
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+        self._thread.join()
+        atexit.unregister(self._finish_at_exit)
+
+    def _add(self, request, interrupt):
+        with self._condition:
+            if interrupt:
+                self._drop(lambda queued: queued.priority <= request.priority)
+                if self._current is not None and self._current.priority <= request.priority:
+                    self._interrupt = True
+            if len(self._queue) >= self.max_queued:
+                lowest = max(self._queue, key=lambda entry: (entry[0], -entry[1]))  # Lowest priority, oldest
+                if -lowest[0] > request.priority:
+                    self.dropped += 1
+                    request._finish(False)
+                    return request
+                self._queue.remove(lowest)
+                heapq.heapify(self._queue)
+                self.dropped += 1
+                lowest[2]._finish(False)
+            heapq.heappush(self._queue, (-request.priority, self._sequence, request))
+            self._sequence += 1
+            self._condition.notify_all()
+        return request
+
+    def _drop(self, should_drop):
+        """Throws away the queued requests should_drop(request) is True for (call with the condition held)."""
+        kept = []
+        for entry in self._queue:
+            if should_drop(entry[2]):
+                self.dropped += 1
+                entry[2]._finish(False)
+            else:
+                kept.append(entry)
+        heapq.heapify(kept)
+        self._queue = kept
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.running and not self._queue:
+                    self._condition.wait()
+                if not self.running:
+                    return
+                request = heapq.heappop(self._queue)[2]
+                self._current = request
+                self._interrupt = False
+            process = self._start(request)  # May take a while the first time a phrase is spoken
+            with self._condition:
+                while process is not None and process.poll() is None and not self._interrupt:
+                    self._condition.wait(POLL_INTERVAL)
+                interrupted = self._interrupt
+                self._current = None
+                self._interrupt = False
+                if interrupted:
+                    self.interrupted += 1
+                elif process is not None:
+                    self.played += 1
+                self._condition.notify_all()
+            if interrupted and process is not None and process.poll() is None:
+                process.kill()
+            request._finish(process is not None and not interrupted)
+
+    def _start(self, request):
+        """Starts the sound and returns its process (None if it couldn't be started)."""
+        try:
+            if request.kind == "speak":
+                path = self.cache.render(request.value, request.espeak_options)
+                with self._condition:
+                    if self._interrupt:
+                        return None
+                if path is None:
+                    return ev3.Sound.speak(request.value, request.espeak_options)
+                return ev3.Sound.play(path)
+            if request.kind == "play":
+                return ev3.Sound.play(request.value)
+            return ev3.Sound.beep(request.value)
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    def _finish_at_exit(self):
+        self.wait(self.exit_timeout)
+
+
+def default_queue():
+    """
+    Returns the SoundQueue for the whole program (made the first time).  Use it instead of making more queues, or
+    sounds from different queues will play over each other.
+
+    Type hints:
+      :rtype: SoundQueue
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = SoundQueue()
+        return _default_queue
@@ -50,7 +50,10 @@ def main():
 
     # Create an MQTT connection
     my_delegate = MyDelegate(canvas, rect_tag)
-    mqtt_client = com.MqttClient(my_delegate)
+    # Run on_rectangle_update on the tkinter thread, and only for the newest Pixy reading each frame, so the display
+    # never falls behind the robot.
+    dispatcher = com.TkDispatcher(root, coalesce_methods=["on_rectangle_update"])
+    mqtt_client = com.MqttClient(my_delegate, executor=dispatcher)
     mqtt_client.connect_to_ev3()
     # mqtt_client.connect_to_ev3("35.194.247.175")  # Off campus IP address of a GCP broker
 
@@ -58,7 +61,7 @@ def main():
 
 
 # ----------------------------------------------------------------------
-# Tkinter event handler
+# Tkinter event handlers
 # ----------------------------------------------------------------------
 def quit_program(mqtt_client):
     mqtt_client.close()
@@ -25,7 +25,8 @@ Author: David Fisher.
 import ev3dev.ev3 as ev3
 import time
 import random
-from PIL import Image
+import lcd_assets
+import lcd_compositor
 import mqtt_remote_method_calls as com
 
 
@@ -34,21 +35,14 @@ class GameMaster(object):
 
     def __init__(self):
         self.mqtt_client = None
-        self.lcd = ev3.Screen()
+        self.lcd = lcd_compositor.ScreenCompositor(max_fps=20)  # Writes only the dice that changed
         self.num_active_dice = 5
         self.max_die_value = 6
         self.consecutive_correct = 0
         self.dice_values = [0, 0, 0, 0, 0]
-        self.dice_images = [Image.open('/home/robot/csse120/assets/images/dice/none.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/one.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/two.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/three.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/four.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/five.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/six.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/seven.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/eight.bmp'),
-                            Image.open('/home/robot/csse120/assets/images/dice/nine.bmp')]
+        self.atlas = lcd_assets.load_atlas()
+        self.dice_images = ['dice/none', 'dice/one', 'dice/two', 'dice/three', 'dice/four', 'dice/five', 'dice/six',
+                            'dice/seven', 'dice/eight', 'dice/nine']  # Image names in the lcd_assets atlas
         self.randomly_display_new_dice()
         self.running = False
 
@@ -59,12 +53,12 @@ class GameMaster(object):
         self.update_lcd()
 
     def update_lcd(self):
-        self.lcd.image.paste(self.dice_images[self.dice_values[0]], (5, 8))
-        self.lcd.image.paste(self.dice_images[self.dice_values[1]], (62, 8))
-        self.lcd.image.paste(self.dice_images[self.dice_values[2]], (119, 8))
-        self.lcd.image.paste(self.dice_images[self.dice_values[3]], (33, 66))
-        self.lcd.image.paste(self.dice_images[self.dice_values[4]], (91, 66))
-        self.lcd.update()
+        self.atlas.draw(self.lcd, self.dice_images[self.dice_values[0]], 5, 8)
+        self.atlas.draw(self.lcd, self.dice_images[self.dice_values[1]], 62, 8)
+        self.atlas.draw(self.lcd, self.dice_images[self.dice_values[2]], 119, 8)
+        self.atlas.draw(self.lcd, self.dice_images[self.dice_values[3]], 33, 66)
+        self.atlas.draw(self.lcd, self.dice_images[self.dice_values[4]], 91, 66)
+        self.atlas.update(self.lcd)
 
     def loop_forever(self):
         btn = ev3.Button()
@@ -148,10 +142,12 @@ def main():
     my_delegate.mqtt_client = mqtt_client
     mqtt_client.connect_to_pc()
     # mqtt_client.connect_to_pc("35.194.247.175")  # Off campus use EV3 as broker.
-    my_delegate.loop_forever()
-    teary_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_tear.bmp")
-    my_delegate.lcd.image.paste(teary_eyes, (0, 0))
-    my_delegate.lcd.update()
+    try:
+        my_delegate.loop_forever()
+        my_delegate.atlas.draw(my_delegate.lcd, "ev3_lego/eyes_tear")
+        my_delegate.atlas.update(my_delegate.lcd)
+    finally:
+        my_delegate.lcd.close()  # Shows the last frame, and stops the screen thread even if the game crashed
     print("If you ran via SSH and typed 'sudo chvt 6' earlier, don't forget to type")
     print("'sudo chvt 1' to get Brickman back after you finish this program.")
 
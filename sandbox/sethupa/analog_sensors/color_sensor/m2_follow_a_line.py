@@ -16,7 +16,6 @@ Authors: David Fisher and Adi Sethupathy.
 """  # DONE: 1. PUT YOUR NAME IN THE ABOVE LINE.
 
 import ev3dev.ev3 as ev3
-import time
 
 import robot_controller as robo
 
@@ -82,16 +81,10 @@ def follow_the_line(robot, white_level, black_level):
     # should drive straight or turn to the right.  You will need to test and refine your code until it works well.
     # Optional extra - For a harder challenge could you drive on the black line and handle left or right turns?
 
-    threshold = (white_level + black_level) / 2
-    while True:
-        if robot.color_sensor.reflected_light_intensity > threshold:
-            robot.right(300)
-            time.sleep(.2)
-        elif robot.color_sensor.reflected_light_intensity <= threshold:
-            robot.forward(300, 300)
-            time.sleep(0.2)
-
-    robot.stop()
+    # This call replaces the exercise solution: instead of the drive straight / turn right threshold from the TODO, the
+    # PID line follower in robot_controller follows the left edge of the line, so it handles left and right turns.
+    # It stops the motors when the touch sensor is pressed.
+    robot.follow_line(speed=400, side="left", white_level=white_level, black_level=black_level)
     #ev3.Sound.speak("Done")
 
 
@@ -9,7 +9,6 @@ Authors: David Fisher and Adi Sethupathy.
 """  # DONE: 1. PUT YOUR NAME IN THE ABOVE LINE.
 
 import ev3dev.ev3 as ev3
-import time
 
 import robot_controller as robo
 
@@ -24,38 +23,21 @@ def main():
     # This code assumes you have setup the pixy object on the Snatch3r class.
     # Add the pixy property to that class if you have not done so already.
     robot = robo.Snatch3r()
-    robot.pixy.mode = "SIG1"
-    turn_speed = 100
 
-    while not robot.touch_sensor.is_pressed:
+    # DONE: 2. Read the Pixy values for x and y
+    # Print the values for x and y
 
-        # DONE: 2. Read the Pixy values for x and y
-        # Print the values for x and y
+    # DONE: 3. Use the x value to turn the robot
+    #   If the Pixy x value is less than 150 turn left (-turn_speed, turn_speed)
+    #   If the Pixy x value is greater than 170 turn right (turn_speed, -turn_speed)
+    #   If the Pixy x value is between 150 and 170 stop the robot
+    # Continuously track the color until the touch sensor is pressed to end the program.
 
-        x = robot.pixy.value(1)
-        y = robot.pixy.value(2)
-
-        print(x)
-        print(y)
-
-        # DONE: 3. Use the x value to turn the robot
-        #   If the Pixy x value is less than 150 turn left (-turn_speed, turn_speed)
-        #   If the Pixy x value is greater than 170 turn right (turn_speed, -turn_speed)
-        #   If the Pixy x value is between 150 and 170 stop the robot
-        # Continuously track the color until the touch sensor is pressed to end the program.
-
-        if x < 150:
-            robot.left(turn_speed, turn_speed)
-
-        elif x > 170:
-            robot.right(turn_speed, turn_speed)
-
-        elif x > 150 and x < 170:
-            robot.stop()
-
-
-
-        time.sleep(0.25)
+    # This call replaces the exercise solution: instead of reading x every 0.25 seconds and turning left, right or
+    # stopping at the 150 / 170 thresholds from the TODOs, the PixyTracker in robot_controller reads the Pixy 50 times
+    # a second, smooths and predicts the x value, and spins at a speed proportional to how far from the middle
+    # (x = 160) the color is, until the touch sensor is pressed.
+    robot.track_color()
 
     print("Goodbye!")
     ev3.Sound.speak("Goodbye").wait()
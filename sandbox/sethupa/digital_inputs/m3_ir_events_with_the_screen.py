@@ -26,7 +26,7 @@ Authors: David Fisher and Adi Sethupathy.
 
 import ev3dev.ev3 as ev3
 import time
-from PIL import Image
+import lcd_assets
 
 
 # DONE: 2. Have someone on your team run this program as is on the EV3 and make sure everyone understands the code.
@@ -38,20 +38,21 @@ class DataContainer(object):
     def __init__(self):
         self.running = True
 
-        # Creates the one and only Screen object and prepares a few Image objects.
+        # Creates the one and only Screen object and prepares a few images (from the lcd_assets atlas).
         self.lcd_screen = ev3.Screen()
 
         # All of these images are exactly 178 by 128 pixels, the exact screen resolution
         # They are made by Lego and ship with the Lego Mindstorm EV3 Home Edition software
-        self.eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_neutral.bmp")
-        self.angry_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_angry.bmp")
-        self.puppy_dog_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_disappointed.bmp")
-        self.sad_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_hurt.bmp")
-        self.shifty_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_pinch_left.bmp")
-        self.progress_0 = Image.open("/home/robot/csse120/assets/images/ev3_lego/progress_bar_0.bmp")
-        self.progress_50 = Image.open("/home/robot/csse120/assets/images/ev3_lego/progress_bar_50.bmp")
-        self.progress_100 = Image.open("/home/robot/csse120/assets/images/ev3_lego/progress_bar_100.bmp")
-        self.teary_eyes = Image.open("/home/robot/csse120/assets/images/ev3_lego/eyes_tear.bmp")
+        atlas = lcd_assets.load_atlas()
+        self.eyes = atlas.sprite("ev3_lego/eyes_neutral")
+        self.angry_eyes = atlas.sprite("ev3_lego/eyes_angry")
+        self.puppy_dog_eyes = atlas.sprite("ev3_lego/eyes_disappointed")
+        self.sad_eyes = atlas.sprite("ev3_lego/eyes_hurt")
+        self.shifty_eyes = atlas.sprite("ev3_lego/eyes_pinch_left")
+        self.progress_0 = atlas.sprite("ev3_lego/progress_bar_0")
+        self.progress_50 = atlas.sprite("ev3_lego/progress_bar_50")
+        self.progress_100 = atlas.sprite("ev3_lego/progress_bar_100")
+        self.teary_eyes = atlas.sprite("ev3_lego/eyes_tear")
 
 
 def main():
@@ -242,10 +243,10 @@ def display_image(lcd_screen, image):
 
     Type hints:
       :type lcd_screen: ev3.Screen
-      :type image: Image
+      :type image: lcd_assets.Sprite
     """
-    lcd_screen.image.paste(image, (0, 0))
-    lcd_screen.update()
+    if not lcd_assets.draw(lcd_screen, image):
+        lcd_screen.update()
 
 
 # ----------------------------------------------------------------------
@@ -9,16 +9,17 @@ Authors: David Fisher and PUT_YOUR_NAME_HERE.
 import tkinter
 from tkinter import ttk
 
+import chat_view
 import mqtt_remote_method_calls as com
 
 
 class MyDelegate(object):
 
-    def __init__(self, label):
-        self.label = label
+    def __init__(self, chat_window):
+        self.chat_window = chat_window
 
     def on_chat_message(self, message):
-        self.label["text"] += "\n" + message
+        self.chat_window.add(message)
 
 
 def main():
@@ -56,8 +57,7 @@ def main():
     msg_button['command'] = lambda: send_message(mqtt_client, my_name, chat_window, msg_entry)
     root.bind('<Return>', lambda event: send_message(mqtt_client, my_name, chat_window, msg_entry))
 
-    chat_window = ttk.Label(main_frame, justify=tkinter.LEFT, text="", width=60, wraplength="500p")
-    # chat_window.pack(fill="x")
+    chat_window = chat_view.ChatView(main_frame, capacity=1000, visible_lines=15, width=60)  # The newest 1000 lines
     chat_window.grid(columnspan=2)
 
     q_button = ttk.Button(main_frame, text="Quit")
@@ -66,7 +66,7 @@ def main():
 
     # Create an MQTT connection
     my_delegate = MyDelegate(chat_window)
-    mqtt_client = com.MqttClient(my_delegate)
+    mqtt_client = com.MqttClient(my_delegate, executor=com.TkDispatcher(root))  # on_chat_message runs on the tk thread
     mqtt_client.connect(my_name, team_member_name)
     # mqtt_client.connect(my_name, team_member_name, "35.194.247.175")  # Off campus IP address of a GCP broker
 
@@ -79,7 +79,7 @@ def main():
 def send_message(mqtt_client, my_name, chat_window, msg_entry):
     msg = msg_entry.get()
     msg_entry.delete(0, 'end')
-    chat_window["text"] += "\nMe: " + msg
+    chat_window.add("Me: " + msg)
     mqtt_client.send_message("on_chat_message", [my_name + ": " + msg])
 
 
@@ -9,7 +9,7 @@ from tkinter import ttk
 
 import mqtt_remote_method_calls as com
 
-import time
+GRAB_PACKAGE_TIMEOUT = 120  # seconds to wait for the ev3 to say it grabbed the package (seek_beacon can be slow)
 
 
 class MyDelegateOnThePc(object):
@@ -92,6 +92,26 @@ def main():
     root.mainloop()
 
 
+def ship_when_grabbed(mqtt_client, grab_package, ship_to):
+    """
+    Called when the reply to grab_package arrives (or the call failed, timed out or was cancelled).  Only ships the
+    package if it was really grabbed (grab_package returned True).
+
+    :param mqtt_client: Connects to the ev3
+    :param grab_package: The finished future from mqtt_client.call("grab_package", ...)
+    :param ship_to: The house to deliver to
+    :return: None
+    """
+    if grab_package.cancelled():
+        print("Not shipping to {} House, grabbing the package was cancelled".format(ship_to))
+    elif grab_package.exception() is not None:
+        print("Not shipping to {} House, grabbing the package failed: {}".format(ship_to, grab_package.exception()))
+    elif grab_package.result() is not True:
+        print("Not shipping to {} House, the package was not found".format(ship_to))
+    else:
+        mqtt_client.send_message("ship_to", [ship_to])
+
+
 def address(mqtt_client, address_entry, item_number):
     """
     This is the main method to ship packages to the different houses.
@@ -117,15 +137,17 @@ def address(mqtt_client, address_entry, item_number):
         print("Shipping to White House")
 
     elif ship_to == "Blue":
+        grab_package = None
         if item_number == 'item1':
-            mqtt_client.send_message("grab_package", ['item1'])
+            grab_package = mqtt_client.call("grab_package", ['item1'], timeout=GRAB_PACKAGE_TIMEOUT)
             print("Amazon Echo Ordered")
         if item_number == 'item2':
-            mqtt_client.send_message("grab_package", ['item2'])
+            grab_package = mqtt_client.call("grab_package", ['item2'], timeout=GRAB_PACKAGE_TIMEOUT)
             print("Fire TV Ordered")
 
-        time.sleep(20)
-        mqtt_client.send_message("ship_to", [ship_to])
+        # Ship as soon as the ev3 replies that the package was grabbed (instead of sleeping for the worst case)
+        if grab_package:
+            grab_package.add_done_callback(lambda future: ship_when_grabbed(mqtt_client, future, ship_to))
         print("Shipping to Blue House")
 
     elif ship_to == "":
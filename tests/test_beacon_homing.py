@@ -0,0 +1,59 @@
+"""
+Tests for robot_controller.BeaconHoming and Snatch3r.seek_beacon on the simulated EV3 (ev3sim.py).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+
+import ev3sim
+
+ev3sim.install(time_scale=1)
+
+import ev3dev.ev3 as ev3
+import robot_controller as robo
+
+
+class BeaconHomingTests(unittest.TestCase):
+
+    def tearDown(self):
+        ev3sim.install(time_scale=1)
+
+    def test_reaches_a_beacon_to_the_left(self):
+        world = ev3sim.install(time_scale=0)
+        world.reset()
+        world.beacons[1] = (30, 20)
+        robot = robo.Snatch3r()
+        self.assertTrue(robot._get_beacon_homing().run(timeout=30))
+        x, y, heading = world.pose()
+        self.assertLess(((x - 30) ** 2 + (y - 20) ** 2) ** 0.5, 6)
+        self.assertNotIn(ev3.Motor.STATE_RUNNING, robot.left_motor.state)
+
+    def test_gives_up_at_the_timeout_without_a_beacon(self):
+        world = ev3sim.install(time_scale=0)
+        world.reset()
+        robot = robo.Snatch3r()
+        self.assertFalse(robot._get_beacon_homing().run(timeout=2))
+        self.assertIsNone(robot.beacon_homing.time_to_acquire)
+
+    def test_shutdown_stops_seek_beacon(self):
+        world = ev3sim.install(time_scale=1)  # Real time, seek_beacon runs on its own thread
+        world.reset()
+        robot = robo.Snatch3r()
+        results = []
+        seek_thread = threading.Thread(target=lambda: results.append(robot.seek_beacon()), daemon=True)
+        seek_thread.start()
+        time.sleep(0.5)
+        self.assertTrue(robot.beacon_homing.running)  # Spinning to look for the beacon
+        robot.shutdown()
+        seek_thread.join(2)
+        self.assertFalse(seek_thread.is_alive())
+        self.assertEqual([False], results)
+        self.assertFalse(robot.beacon_homing.running)
+        for motor in [robot.left_motor, robot.right_motor]:
+            self.assertNotIn(ev3.Motor.STATE_RUNNING, motor.state)
+
+
+if __name__ == "__main__":
+    unittest.main()
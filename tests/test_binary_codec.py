@@ -0,0 +1,63 @@
+"""
+Tests for the size limits of the mqtt_remote_method_calls.BinaryCodec (values that do not fit its 64 bit ints and 16
+bit lengths must raise a clear ValueError, not struct.error).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import unittest
+
+import mqtt_remote_method_calls as com
+
+
+class BinaryCodecLimitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = com.BinaryCodec(["forward"])
+
+    def test_ints_up_to_64_bits_round_trip(self):
+        for value in [-2 ** 63, 2 ** 63 - 1]:
+            call = self.codec.decode(self.codec.encode("forward", [value]))
+            self.assertEqual([value], call.parameter_list)
+
+    def test_ints_over_64_bits_raise_value_error(self):
+        for value in [2 ** 63, -2 ** 63 - 1, 10 ** 30]:
+            with self.assertRaisesRegex(ValueError, "64 bits"):
+                self.codec.encode("forward", [value])
+
+    def test_lengths_up_to_65535_round_trip(self):
+        text = "x" * 65535
+        items = list(range(65535))
+        call = self.codec.decode(self.codec.encode("forward", [text, items]))
+        self.assertEqual([text, items], call.parameter_list)
+
+    def test_lengths_over_65535_raise_value_error(self):
+        for value in ["x" * 65536, "é" * 32768, [0] * 65536, {str(k): k for k in range(65536)}]:
+            with self.assertRaisesRegex(ValueError, "too long"):
+                self.codec.encode("forward", [value])
+
+    def test_batch_limits_raise_value_error(self):
+        small = self.codec.encode("forward", [1])
+        self.assertEqual(2, len(self.codec.decode(self.codec.encode_batch([small, small])).messages))
+        with self.assertRaisesRegex(ValueError, "Too many messages"):
+            self.codec.encode_batch([small] * 65536)
+        with self.assertRaisesRegex(ValueError, "longer than 65535 bytes"):
+            self.codec.encode_batch([small, self.codec.encode("forward", ["x" * 65535])])
+
+    def test_reply_with_a_value_too_big_sends_an_error(self):
+        codec = com.BinaryCodec()
+        client = com.MqttClient(codec=codec)
+        published = []
+
+        class FakeClient(object):
+            def publish(self, topic, payload):
+                published.append(payload)
+
+        client.client = FakeClient()
+        client._send_reply(7, result=2 ** 64)
+        reply = codec.decode(published[0])
+        self.assertEqual(7, reply.call_id)
+        self.assertIn("64 bits", reply.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
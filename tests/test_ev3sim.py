@@ -0,0 +1,151 @@
+"""
+Tests for the simulated EV3 in ev3sim.py: the motor and robot motion, the simulated clock, and the sensor modes.
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import time
+import unittest
+
+import ev3sim
+
+ev3sim.install(time_scale=1)
+
+import ev3dev.ev3 as ev3
+
+
+class SimTestCase(unittest.TestCase):
+    """Starts every test with a fresh world without sensor noise, in stepped time (so the results are exact)."""
+
+    def setUp(self):
+        self.world = ev3sim.install(time_scale=0)
+        self.world.reset()
+        self.world.noise = 0
+
+    def tearDown(self):
+        ev3sim.install(time_scale=1)
+
+
+class MotorTests(SimTestCase):
+
+    def test_run_forever_integrates_the_speed(self):
+        motor = ev3.LargeMotor(ev3.OUTPUT_B)
+        motor.run_forever(speed_sp=360)
+        time.sleep(2)
+        # 2 seconds at 360 degrees per second, less the 0.06 seconds of speeding up at 6000 degrees per second^2
+        self.assertAlmostEqual(720 - 360 ** 2 / (2 * 6000), motor.position, delta=2)
+        self.assertEqual(360, motor.speed)
+        self.assertIn(ev3.Motor.STATE_RUNNING, motor.state)
+
+    def test_run_to_rel_pos_stops_on_the_target(self):
+        motor = ev3.LargeMotor(ev3.OUTPUT_B)
+        motor.position = 100
+        motor.run_to_rel_pos(speed_sp=500, position_sp=720, stop_action="brake")
+        self.assertTrue(motor.wait_while(ev3.Motor.STATE_RUNNING, timeout=5000))
+        self.assertEqual(820, motor.position)
+        self.assertEqual(0, motor.speed)
+
+    def test_run_timed_stops_after_the_time(self):
+        motor = ev3.MediumMotor(ev3.OUTPUT_A)
+        start_time = time.monotonic()
+        motor.run_timed(speed_sp=200, time_sp=500)
+        motor.wait_while(ev3.Motor.STATE_RUNNING)
+        self.assertAlmostEqual(0.5, time.monotonic() - start_time, delta=0.02)
+
+    def test_wheels_move_the_robot(self):
+        left_motor = ev3.LargeMotor(ev3.OUTPUT_B)
+        right_motor = ev3.LargeMotor(ev3.OUTPUT_C)
+        for motor in [left_motor, right_motor]:
+            motor.run_to_rel_pos(speed_sp=600, position_sp=10 * ev3sim.WHEEL_DEGREES_PER_INCH)
+        left_motor.wait_while(ev3.Motor.STATE_RUNNING)
+        x, y, heading = self.world.pose()
+        self.assertAlmostEqual(10, x, delta=0.05)
+        self.assertAlmostEqual(0, y, delta=0.05)
+        # The left wheel forward and the right one back turns clockwise (turn_degrees uses 4.5 wheel degrees each).
+        left_motor.run_to_rel_pos(speed_sp=400, position_sp=90 * 4.5)
+        right_motor.run_to_rel_pos(speed_sp=400, position_sp=-90 * 4.5)
+        left_motor.wait_while(ev3.Motor.STATE_RUNNING)
+        self.assertAlmostEqual(-90, self.world.pose()[2], delta=0.5)
+
+
+class ClockTests(SimTestCase):
+
+    def test_stepped_time_only_moves_when_sleeping(self):
+        real_start = ev3sim._real_monotonic()
+        start_time = time.monotonic()
+        time.sleep(100)
+        self.assertAlmostEqual(100, time.monotonic() - start_time, delta=0.01)
+        self.assertLess(ev3sim._real_monotonic() - real_start, 1)
+
+    def test_time_scale_runs_faster_than_real_time(self):
+        ev3sim.install(time_scale=10)
+        real_start = ev3sim._real_monotonic()
+        start_time = time.monotonic()
+        time.sleep(0.5)
+        self.assertAlmostEqual(0.5, time.monotonic() - start_time, delta=0.1)
+        self.assertAlmostEqual(0.05, ev3sim._real_monotonic() - real_start, delta=0.04)
+
+    def test_time_scale_1_uses_the_real_time_functions(self):
+        ev3sim.install(time_scale=1)
+        self.assertIs(ev3sim._real_sleep, time.sleep)
+        self.assertIs(ev3sim._real_monotonic, time.monotonic)
+
+    def test_motors_follow_the_simulated_clock(self):
+        ev3sim.install(time_scale=10)
+        motor = ev3.LargeMotor(ev3.OUTPUT_B)
+        motor.run_forever(speed_sp=600)
+        time.sleep(1)  # 0.1 real seconds
+        motor.stop(stop_action="brake")
+        self.assertAlmostEqual(600 - 600 ** 2 / (2 * 6000), motor.position, delta=40)
+
+
+class SensorModeTests(SimTestCase):
+
+    def test_color_sensor_sees_the_tape(self):
+        color_sensor = ev3.ColorSensor()
+        self.assertEqual(60, color_sensor.reflected_light_intensity)  # The white floor in the middle of the track
+        self.assertEqual(ev3.ColorSensor.COLOR_WHITE, color_sensor.color)
+        track_x, track_y = self.world.floor.lines[0][0]
+        self.world.place_robot(track_x - ev3sim.COLOR_SENSOR_AHEAD, track_y)  # The sensor right over the tape
+        self.assertEqual(5, color_sensor.reflected_light_intensity)
+        self.assertEqual(ev3.ColorSensor.COLOR_BLACK, color_sensor.color)
+        self.assertEqual(ev3sim.COLOR_READINGS[ev3sim.COLOR_BLACK][1], color_sensor.raw)
+        self.world.ambient_light = 33
+        self.assertEqual(33, color_sensor.ambient_light_intensity)
+        self.assertEqual(ev3.ColorSensor.MODE_COL_AMBIENT, color_sensor.mode)
+
+    def test_infrared_sensor_modes(self):
+        ir_sensor = ev3.InfraredSensor()
+        self.world.beacons[1] = (ev3sim.IR_SENSOR_AHEAD + 8, 0)  # 8 inches straight ahead
+        ir_sensor.mode = ev3.InfraredSensor.MODE_IR_SEEK
+        self.assertEqual(8, ir_sensor.num_values)  # A heading and a distance for each of the 4 channels
+        self.assertEqual([0, 10], [ir_sensor.value(0), ir_sensor.value(1)])
+        self.assertEqual([0, ev3sim.NOT_FOUND], [ir_sensor.value(2), ir_sensor.value(3)])
+        self.assertEqual((0, 10), ev3.BeaconSeeker(channel=1).heading_and_distance)
+
+        self.world.remote_buttons[2] = {"red_up", "blue_down"}
+        ir_sensor.mode = ev3.InfraredSensor.MODE_IR_REMOTE
+        self.assertEqual([0, 6, 0, 0], [ir_sensor.value(k) for k in range(4)])
+
+        self.world.obstacles = [(ev3sim.IR_SENSOR_AHEAD + 11, 0, 0)]
+        self.assertEqual(40, ir_sensor.proximity)  # About 0.275 inches per unit
+
+    def test_pixy_sees_the_target(self):
+        pixy = ev3.Sensor(driver_name="pixy-lego")
+        pixy.mode = "SIG1"
+        self.assertEqual([0, 0, 0, 0, 0], [pixy.value(k) for k in range(5)])
+        self.world.pixy_target = (ev3sim.PIXY_AHEAD + 20, 0)  # 20 inches straight ahead
+        self.assertEqual([1, 160, 100], [pixy.value(k) for k in range(3)])
+
+    def test_touch_sensor(self):
+        touch_sensor = ev3.TouchSensor()
+        self.assertFalse(touch_sensor.is_pressed)
+        self.world.touch_pressed = True
+        self.assertTrue(touch_sensor.is_pressed)
+
+    def test_unknown_mode_raises(self):
+        with self.assertRaises(ValueError):
+            ev3.ColorSensor().mode = "SIG1"
+
+
+if __name__ == "__main__":
+    unittest.main()
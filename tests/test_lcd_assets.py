@@ -0,0 +1,106 @@
+"""
+Tests for lcd_assets: the sprite bit format (PIL's "1;R", white is 1), blit, and building and reading an atlas.
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+import lcd_assets
+
+
+def checkerboard(width, height):
+    """A PIL image with white where x + y is even."""
+    image = Image.new("1", (width, height))
+    image.putdata([255 * (1 - (x + y) % 2) for y in range(height) for x in range(width)])
+    return image
+
+
+class SpriteFormatTests(unittest.TestCase):
+
+    def test_leftmost_pixel_is_the_lowest_bit_and_white_is_1(self):
+        image = Image.new("1", (10, 1))
+        image.putpixel((0, 0), 255)  # White
+        image.putpixel((9, 0), 255)
+        sprite = lcd_assets.Sprite.from_image(image)
+        self.assertEqual(2, sprite.stride)
+        self.assertEqual(bytes([0b00000001, 0b00000010]), sprite.data)
+        self.assertEqual(image.tobytes("raw", "1;R"), sprite.data)
+
+    def test_from_image_and_to_image_round_trip(self):
+        image = checkerboard(13, 5)
+        self.assertEqual(image.tobytes(), lcd_assets.Sprite.from_image(image).to_image().tobytes())
+
+    def test_from_image_makes_bright_pixels_white(self):
+        image = Image.new("L", (3, 1))
+        image.putdata([0, 127, 200])
+        self.assertEqual(bytes([0b100]), lcd_assets.Sprite.from_image(image).data)
+
+
+class BlitTests(unittest.TestCase):
+
+    def setUp(self):
+        self.line_length = 4  # 32 pixels wide
+        self.buffer = bytearray(self.line_length * 8)  # 8 rows, all black
+
+    def pixel(self, x, y):
+        return self.buffer[y * self.line_length + x // 8] >> (x % 8) & 1
+
+    def test_blit_copies_the_pixels_at_x_y(self):
+        sprite = lcd_assets.Sprite.from_image(checkerboard(5, 3))
+        self.assertEqual((11, 2, 16, 5), sprite.blit(self.buffer, self.line_length, 11, 2))
+        for y in range(8):
+            for x in range(32):
+                inside = 11 <= x < 16 and 2 <= y < 5
+                self.assertEqual(int(inside and (x - 11 + y - 2) % 2 == 0), self.pixel(x, y), (x, y))
+
+    def test_blit_only_changes_the_pixels_under_the_sprite(self):
+        self.buffer[:] = b"\xff" * len(self.buffer)
+        black = lcd_assets.Sprite("black", 3, 2, 1, bytes(2))
+        black.blit(self.buffer, self.line_length, 6, 1)
+        self.assertEqual(sum(bin(byte).count("1") for byte in self.buffer), 32 * 8 - 6)
+        self.assertEqual(0, self.pixel(6, 1))
+        self.assertEqual(0, self.pixel(8, 2))
+        self.assertEqual(1, self.pixel(5, 1))
+        self.assertEqual(1, self.pixel(9, 1))
+
+    def test_blit_clips_at_the_edges(self):
+        white = lcd_assets.Sprite("white", 8, 8, 1, b"\xff" * 8)
+        self.assertEqual((0, 0, 4, 3), white.blit(self.buffer, self.line_length, -4, -5, 30, 8))
+        self.assertEqual((28, 6, 30, 8), white.blit(self.buffer, self.line_length, 28, 6, 30, 8))
+        self.assertEqual(0, self.pixel(30, 7))  # Outside the width given
+        self.assertIsNone(white.blit(self.buffer, self.line_length, 40, 0))
+
+
+class AtlasTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, "images"))
+        os.mkdir(os.path.join(self.folder, "images", "dice"))
+        checkerboard(9, 4).convert("RGB").save(os.path.join(self.folder, "images", "dice", "one.bmp"))
+        Image.new("L", (3, 2), 255).save(os.path.join(self.folder, "images", "white.bmp"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_atlas_has_the_images_in_the_screen_format(self):
+        atlas = lcd_assets.load_atlas(os.path.join(self.folder, "images"))
+        try:
+            self.assertEqual(["dice/one", "white"], atlas.names())
+            self.assertEqual(lcd_assets.Sprite.from_image(checkerboard(9, 4)).data, atlas.sprite("dice/one").data)
+            self.assertEqual(bytes([0b111, 0b111]), atlas.sprite("white").data)
+            atlas.sprite("white")
+            self.assertEqual((1, 2), (atlas.hits, atlas.misses))
+            with self.assertRaises(KeyError):
+                atlas.sprite("dice/two")
+        finally:
+            atlas.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
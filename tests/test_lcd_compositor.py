@@ -0,0 +1,75 @@
+"""
+Tests for lcd_compositor.ScreenCompositor with a file as the framebuffer (Framebuffer.fake).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lcd_assets
+import lcd_compositor
+
+
+class ScreenCompositorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "fb0")
+        framebuffer = lcd_compositor.Framebuffer.fake(self.path)  # The EV3 screen: 178 x 128, 24 bytes per row
+        self.lcd = lcd_compositor.ScreenCompositor(framebuffer, background=False)
+
+    def tearDown(self):
+        self.lcd.close()
+        shutil.rmtree(self.folder)
+
+    def framebuffer_bytes(self):
+        self.lcd.framebuffer.mmap.flush()
+        with open(self.path, "rb") as framebuffer_file:
+            return framebuffer_file.read()
+
+    def update_and_flush(self):
+        """Shows what was drawn and returns the number of rows written to the framebuffer."""
+        rows_written = self.lcd.rows_written
+        self.lcd.update()  # Writes right away if the last frame was long enough ago
+        self.lcd.flush()  # Otherwise this writes it
+        return self.lcd.rows_written - rows_written
+
+    def test_first_frame_writes_the_whole_screen_white(self):
+        self.assertEqual(128, self.update_and_flush())
+        self.assertEqual(b"\xff" * (24 * 128), self.framebuffer_bytes())
+
+    def test_only_the_changed_rows_are_written(self):
+        self.update_and_flush()
+        black = lcd_assets.Sprite("black", 10, 3, 2, bytes(6))
+        self.lcd.draw_sprite(black, 20, 40)
+        self.assertEqual(3, self.update_and_flush())
+        expected = bytearray(b"\xff" * (24 * 128))
+        black.blit(expected, 24, 20, 40, 178, 128)
+        self.assertEqual(bytes(expected), self.framebuffer_bytes())
+        for row in range(40, 43):  # Pixels 20 to 29 are black (0), the leftmost pixel of each byte is its lowest bit
+            self.assertEqual(b"\xff\xff\x0f\xc0" + b"\xff" * 20, bytes(expected[row * 24:(row + 1) * 24]))
+
+    def test_drawing_the_same_pixels_again_writes_nothing(self):
+        black = lcd_assets.Sprite("black", 10, 3, 2, bytes(6))
+        self.lcd.draw_sprite(black, 20, 40)
+        self.update_and_flush()
+        self.lcd.draw_sprite(black, 20, 40)  # The rows are dirty, but nothing in them changed
+        self.assertEqual(0, self.update_and_flush())
+        self.assertEqual(0, self.lcd.flush())  # No update since the last frame
+
+    def test_separate_changes_are_written_as_separate_runs_of_rows(self):
+        self.update_and_flush()
+        self.lcd.fill(0, 0, 8, 2, white=False)
+        self.lcd.fill(0, 100, 8, 1, white=False)
+        self.assertEqual(3, self.update_and_flush())
+        data = self.framebuffer_bytes()
+        self.assertEqual([0, 0, 255], [data[row * 24] for row in range(3)])
+        self.assertEqual([255, 0, 255], [data[row * 24] for row in range(99, 102)])
+        self.assertEqual(2, self.lcd.frames_written)
+        self.assertEqual(128 + 3, self.lcd.rows_written)
+
+
+if __name__ == "__main__":
+    unittest.main()
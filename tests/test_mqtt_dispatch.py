@@ -0,0 +1,76 @@
+"""
+Tests for how mqtt_remote_method_calls.MqttClient finds the delegate method for a received message.
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import unittest
+import unittest.mock
+
+import mqtt_remote_method_calls as com
+
+
+class CountingDelegate(object):
+    """Counts the lookups of attributes it does not have."""
+
+    def __init__(self):
+        self.missing_lookups = 0
+        self.beeps = 0
+
+    def __getattr__(self, name):
+        self.missing_lookups += 1
+        raise AttributeError(name)
+
+
+class ExportedDelegate(object):
+
+    @com.exported
+    def forward(self):
+        pass
+
+    def secret(self):
+        pass
+
+
+class DispatchTests(unittest.TestCase):
+
+    def dispatch(self, client, function_name):
+        with unittest.mock.patch("builtins.print"):  # Not found messages
+            client._dispatch(com.Call(function_name, [], None))
+
+    def test_unknown_names_are_looked_up_once(self):
+        delegate = CountingDelegate()
+        client = com.MqttClient(delegate)
+        lookups = delegate.missing_lookups
+        for k in range(100):
+            self.dispatch(client, "no_such_method")
+        self.assertEqual(lookups + 1, delegate.missing_lookups)
+
+    def test_methods_added_later_are_found(self):
+        delegate = CountingDelegate()
+        client = com.MqttClient(delegate)
+        delegate.on_beep = lambda: setattr(delegate, "beeps", delegate.beeps + 1)
+        self.dispatch(client, "on_beep")
+        self.assertEqual(1, delegate.beeps)
+
+    def test_setting_the_delegate_again_forgets_the_unknown_names(self):
+        delegate = CountingDelegate()
+        client = com.MqttClient(delegate)
+        self.dispatch(client, "on_beep")
+        delegate.on_beep = lambda: setattr(delegate, "beeps", delegate.beeps + 1)
+        client.delegate = delegate
+        self.dispatch(client, "on_beep")
+        self.assertEqual(1, delegate.beeps)
+
+    def test_only_exported_methods_are_added(self):
+        delegate = ExportedDelegate()
+        client = com.MqttClient(delegate)
+        delegate.later = com.exported(lambda: None)
+        delegate.not_exported = lambda: None
+        self.dispatch(client, "secret")
+        self.dispatch(client, "later")
+        self.dispatch(client, "not_exported")
+        self.assertEqual({"forward", "later"}, set(client._dispatch_table))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Tests for mqtt_remote_method_calls.MqttFleetClient, with the in-process loopback broker (no network needed).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+
+import mqtt_remote_method_calls as com
+
+
+class PcDelegate(object):
+    """Records the hello messages from one robot."""
+
+    received = []  # (lego robot number, text) from every PcDelegate
+    got_message = threading.Event()
+
+    def __init__(self, lego_robot_number):
+        self.lego_robot_number = lego_robot_number
+
+    def hello(self, text):
+        PcDelegate.received.append((self.lego_robot_number, text))
+        PcDelegate.got_message.set()
+
+
+class FleetAutoAddTests(unittest.TestCase):
+
+    def setUp(self):
+        PcDelegate.received = []
+        PcDelegate.got_message.clear()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+    def connect_fleet(self, **fleet_options):
+        fleet = com.MqttFleetClient(delegate_factory=PcDelegate, **fleet_options)
+        fleet.connect_to_ev3s(com.LOOPBACK)
+        self.clients.append(fleet)
+        return fleet
+
+    def say_hello(self, lego_robot_number):
+        robot = com.MqttClient()
+        robot.connect_to_pc(com.LOOPBACK, lego_robot_number)
+        self.clients.append(robot)
+        time.sleep(0.1)  # Lets the connections finish
+        robot.send_message("hello", ["Hi from {}".format(lego_robot_number)])
+        robot.flush()
+
+    def test_robots_are_not_added_automatically_by_default(self):
+        fleet = self.connect_fleet()
+        self.say_hello(7)
+        self.assertFalse(PcDelegate.got_message.wait(0.3))
+        self.assertNotIn(7, fleet.robots)
+
+    def test_only_robots_in_auto_add_are_added(self):
+        fleet = self.connect_fleet(auto_add=[7])
+        self.say_hello(8)
+        self.say_hello(7)
+        self.assertTrue(PcDelegate.got_message.wait(2))
+        time.sleep(0.1)
+        self.assertEqual([(7, "Hi from 7")], PcDelegate.received)
+        self.assertIn(7, fleet.robots)
+        self.assertNotIn(8, fleet.robots)
+
+
+if __name__ == "__main__":
+    unittest.main()
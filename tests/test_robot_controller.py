@@ -0,0 +1,261 @@
+"""
+Tests for robot_controller on the simulated EV3 (ev3sim.py).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import threading
+import time
+import unittest
+import unittest.mock
+
+import ev3sim
+
+ev3sim.install(time_scale=1)
+
+import ev3dev.ev3 as ev3
+import robot_controller as robo
+
+
+class SimTestCase(unittest.TestCase):
+    """Starts every test with a fresh world in real time (most of these tests use a second thread)."""
+
+    def setUp(self):
+        self.world = ev3sim.install(time_scale=1)
+        self.world.reset()
+        self.robot = robo.Snatch3r()
+
+    def tearDown(self):
+        ev3sim.install(time_scale=1)
+
+    def assert_drive_motors_stopped(self):
+        for motor in [self.robot.left_motor, self.robot.right_motor]:
+            self.assertNotIn(ev3.Motor.STATE_RUNNING, motor.state)
+
+
+class StopTests(SimTestCase):
+    """Snatch3r.stop (for example sent by the PC over MQTT) must stop whatever is driving the motors."""
+
+    def run_then_stop(self, drive):
+        thread = threading.Thread(target=drive, daemon=True)
+        thread.start()
+        time.sleep(0.3)
+        self.assertIn(ev3.Motor.STATE_RUNNING, self.robot.left_motor.state)
+        self.robot.stop()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        time.sleep(0.05)  # A control loop might have written the motors once more before it saw the stop
+        self.assert_drive_motors_stopped()
+
+    def test_stop_ends_follow_line(self):
+        self.run_then_stop(lambda: self.robot.follow_line(white_level=60, black_level=5))
+
+    def test_stop_ends_seek_beacon(self):
+        self.run_then_stop(self.robot.seek_beacon)  # No beacon, so it spins looking for one
+
+    def test_stop_ends_track_color(self):
+        self.world.pixy_target = (20, -8)  # To the right, so the robot spins toward it
+        self.run_then_stop(self.robot.track_color)
+
+    def test_stop_cancels_queued_motions(self):
+        handles = [self.robot.drive_inches_async(12, 400) for k in range(3)]
+        time.sleep(0.1)
+        self.robot.stop()
+        self.assertTrue(all(handle.wait(1) for handle in handles))
+        self.assertTrue(all(handle.cancelled() for handle in handles))
+        self.assert_drive_motors_stopped()
+
+
+
+class SensorReaderCloseTests(SimTestCase):
+    """The controllers close the sysfs files of their sensor readers when they are stopped (after their loop ends)."""
+
+    def setUp(self):
+        super().setUp()
+        self.closed = []  # The modes of the readers that were closed
+        self.reads_after_close = []
+        open_reader = robo.Snatch3r._open_sensor_reader
+
+        def open_with_close(sensor, mode, first_value, end_value=None):
+            read = open_reader(sensor, mode, first_value, end_value)[0]  # The simulated sensors have no files
+            is_closed = []
+
+            def checked_read():
+                if is_closed:
+                    self.reads_after_close.append(mode)
+                return read()
+
+            def close():
+                is_closed.append(True)
+                self.closed.append(mode)
+
+            return checked_read, close
+
+        patcher = unittest.mock.patch.object(robo.Snatch3r, "_open_sensor_reader", staticmethod(open_with_close))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_then_stop(self, drive, controller_name):
+        thread = threading.Thread(target=drive, daemon=True)
+        thread.start()
+        time.sleep(0.3)
+        getattr(self.robot, controller_name).stop()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([], self.reads_after_close)
+
+    def test_line_follower(self):
+        self.run_then_stop(lambda: self.robot.follow_line(white_level=60, black_level=5), "line_follower")
+        self.assertEqual(["COL-REFLECT", "TOUCH"], sorted(self.closed))
+        self.robot.follow_line(white_level=60, black_level=5, timeout=0.1)  # Opens them again
+        self.assertEqual([], self.reads_after_close)
+
+    def test_beacon_homing(self):
+        self.run_then_stop(lambda: self.robot._get_beacon_homing().run(), "beacon_homing")
+        self.assertEqual(["IR-SEEK", "TOUCH"], sorted(self.closed))
+
+    def test_pixy_tracker(self):
+        self.world.pixy_target = (20, -8)
+        self.run_then_stop(self.robot.track_color, "pixy_tracker")
+        self.assertEqual(["SIG1", "TOUCH"], sorted(self.closed))
+
+
+class BrokenMotor(object):
+    """A motor that was unplugged: reading its state raises OSError."""
+
+    @property
+    def state(self):
+        raise OSError("No such device")
+
+    def stop(self, stop_action=None):
+        raise OSError("No such device")
+
+
+class MotionMonitorTests(SimTestCase):
+
+    def test_failing_step_stops_its_motors_and_the_next_motion_runs(self):
+        def start_left_motor():
+            self.robot.left_motor.run_forever(speed_sp=300)
+            return [BrokenMotor(), self.robot.left_motor]
+
+        monitor = robo.MotionMonitor()
+        failing = monitor.start([start_left_motor])
+        following = monitor.start([lambda: []])
+        with self.assertRaises(OSError):
+            failing.wait(1)
+        self.assertIsInstance(failing.error(), OSError)
+        self.assertNotIn(ev3.Motor.STATE_RUNNING, self.robot.left_motor.state)
+        self.assertTrue(following.wait(1))
+        self.assertIsNone(following.error())
+
+    def test_cancel_while_a_step_is_starting_the_motors(self):
+        in_step = threading.Event()
+        finish_step = threading.Event()
+
+        def slow_start():
+            in_step.set()
+            finish_step.wait(2)
+            self.robot.left_motor.run_forever(speed_sp=300)
+            return [self.robot.left_motor]
+
+        monitor = robo.MotionMonitor()
+        handle = monitor.start([slow_start])
+        self.assertTrue(in_step.wait(1))
+        start_time = time.monotonic()
+        self.assertTrue(handle.cancel())
+        self.assertLess(time.monotonic() - start_time, 0.5)  # Did not wait for the step
+        self.assertTrue(handle.wait(0))
+        finish_step.set()
+        time.sleep(0.1)
+        self.assertNotIn(ev3.Motor.STATE_RUNNING, self.robot.left_motor.state)
+        self.assertTrue(monitor.start([lambda: []]).wait(1))  # The monitor still runs motions
+
+
+class SensorSamplerTests(unittest.TestCase):
+
+    def test_a_raising_subscriber_does_not_stop_the_sampler(self):
+        readings = iter(range(1000000))
+        sampler = robo.SensorSampler()
+        sampler.add_channel("count", lambda: next(readings), 200)
+        received = []
+
+        def broken(name, timestamp, value):
+            raise RuntimeError("Broken subscriber")
+
+        sampler.subscribe("count", broken)
+        sampler.subscribe("count", lambda name, timestamp, value: received.append(value))
+        with unittest.mock.patch("traceback.print_exc") as print_exc:
+            sampler.start()
+            try:
+                time.sleep(0.2)
+                self.assertTrue(sampler._thread.is_alive())
+            finally:
+                sampler.stop()
+        self.assertEqual(len(received), print_exc.call_count)  # The broken subscriber's errors were printed
+        self.assertGreater(len(received), 5)  # The subscriber after the broken one got every change
+        self.assertEqual(list(range(len(received))), received)
+
+
+class TrapezoidProfileTests(unittest.TestCase):
+
+    def test_long_move_cruises_at_max_speed(self):
+        profile = robo.TrapezoidProfile(1080, 600, 3000)  # 12 inches
+        self.assertAlmostEqual(600, profile.peak_speed)
+        self.assertAlmostEqual(0.2, profile.ramp_time)
+        self.assertAlmostEqual(2.0, profile.duration)  # 0.2 speeding up, 1.6 at 600, 0.2 slowing down
+        self.assertAlmostEqual(600, profile.speed(1.0))
+        self.assertAlmostEqual(60, profile.position(0.2))
+        self.assertAlmostEqual(1080, profile.position(2.0))
+        self.assertEqual(0, profile.speed(2.0))
+
+    def test_short_move_is_a_triangle(self):
+        profile = robo.TrapezoidProfile(90, 600, 3000)
+        self.assertAlmostEqual(0.1 * 3 ** 0.5, profile.ramp_time)
+        self.assertAlmostEqual(3000 * profile.ramp_time, profile.peak_speed)
+        self.assertLess(profile.peak_speed, 600)
+        self.assertEqual(0, profile.cruise_time)
+        self.assertAlmostEqual(2 * profile.ramp_time, profile.duration)
+        self.assertAlmostEqual(45, profile.position(profile.ramp_time))
+
+    def test_negative_distance_goes_backwards(self):
+        profile = robo.TrapezoidProfile(-1080, 600, 3000)
+        self.assertAlmostEqual(-600, profile.speed(1.0))
+        self.assertAlmostEqual(-1080, profile.position(profile.duration))
+
+
+class MotionPlannerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.world = ev3sim.install(time_scale=0)  # MotionPlanner.run uses only the calling thread
+        self.world.reset()
+        self.robot = robo.Snatch3r()
+
+    def tearDown(self):
+        ev3sim.install(time_scale=1)
+
+    def test_blending_overlaps_the_segments(self):
+        motion_planner = robo.MotionPlanner(self.robot, speed=600, acceleration=3000, blend_time=0.2)
+        motion_planner.add_drive(12)
+        motion_planner.add_drive(12)
+        planned, total_time = motion_planner.plan()
+        self.assertEqual([0.0, 1.8], [start for start, segment in planned])
+        self.assertAlmostEqual(3.8, total_time)
+        motion_planner.blend_time = 0
+        self.assertAlmostEqual(4.0, motion_planner.plan()[1])
+
+    def test_run_drives_and_turns(self):
+        motion_planner = robo.MotionPlanner(self.robot, speed=600, acceleration=3000, blend_time=0)
+        motion_planner.add_drive(12)
+        motion_planner.add_turn(90)
+        total_time = motion_planner.plan()[1]
+        seconds = motion_planner.run()
+        self.assertGreaterEqual(seconds, total_time)
+        self.assertLess(seconds, total_time + 0.35)  # At most the settle time longer
+        x, y, heading = self.world.pose()
+        self.assertAlmostEqual(12, x, delta=0.2)
+        self.assertAlmostEqual(0, y, delta=0.2)
+        self.assertAlmostEqual(-90, heading, delta=2)  # Positive turns are clockwise, like turn_degrees
+        self.assertEqual([], motion_planner.segments)
+
+
+if __name__ == "__main__":
+    unittest.main()
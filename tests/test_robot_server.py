@@ -0,0 +1,59 @@
+"""
+Tests for robot_server (a RobotServer on a thread with a Snatch3r on the simulated EV3, and a RobotProxy).
+  PYTHONPATH=libs python3 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import ev3sim
+
+ev3sim.install(time_scale=1)
+
+import robot_controller as robo
+import robot_server
+
+
+class RobotServerTests(unittest.TestCase):
+
+    def setUp(self):
+        ev3sim.install(time_scale=1).reset()
+        self.folder = tempfile.mkdtemp()
+        path = os.path.join(self.folder, "snatch3r.sock")
+        self.robot = robo.Snatch3r()
+        self.server = robot_server.RobotServer(self.robot, path)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        self.proxy = robot_server.connect(path)
+
+    def tearDown(self):
+        self.proxy.close()
+        self.server.stop()
+        shutil.rmtree(self.folder)
+
+    def test_reads_and_calls(self):
+        self.assertEqual(self.robot.MAX_SPEED, self.proxy.MAX_SPEED)
+        self.assertEqual(self.robot.MAX_SPEED, self.proxy.get("MAX_SPEED"))
+        self.assertFalse(self.proxy.touch_sensor.is_pressed)
+
+    def test_setting_an_attribute_sets_it_on_the_server(self):
+        self.proxy.running = False
+        self.assertFalse(self.robot.running)
+        self.assertFalse(self.proxy.running)
+        self.assertNotIn("running", vars(self.proxy))
+        self.proxy.left_motor.speed_sp = 321
+        self.assertEqual(321, self.robot.left_motor.speed_sp)
+
+    def test_private_attributes_are_not_sent(self):
+        with self.assertRaises(robot_server.RobotServerError):
+            self.proxy.set("_stop_seeking", None)
+        self.assertIsNotNone(self.robot._stop_seeking)
+
+
+if __name__ == "__main__":
+    unittest.main()